@@ -32,15 +32,63 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 
-from jenkins_auth.models import JenkinsUser
-from jenkins_auth.models import Project, JenkinsUserProfile
+from jenkins_auth.backends import invalidate_project_permissions
+from jenkins_auth.models import JenkinsUser, OwnedProjectCount
+from jenkins_auth.models import ProjectMembership
+from jenkins_auth.utils import delete_project
+from jenkins_auth.models import Project, JenkinsUserProfile, OutgoingEmail
+
+
+class ProjectMembershipInline(admin.TabularInline):
+    model = ProjectMembership
+    raw_id_fields = ('user',)
+    extra = 0
 
 
 @admin.register(Project)
 class ProjectAdmin(admin.ModelAdmin):
-    fields = (('name', 'owner'), 'description', 'admins', 'users', 'is_active')
+    fields = (('name', 'owner'), 'description', 'is_active')
     list_display = ('name', 'owner', 'is_active')
     list_filter = ('owner',)
+    inlines = (ProjectMembershipInline,)
+    # a bulk delete would not update the owned project counts
+    actions = None
+
+    def save_model(self, request, obj, form, change):
+        """
+        Keep the owned project counts up to date, the admin saves in a
+        transaction.
+
+        """
+        super(ProjectAdmin, self).save_model(request, obj, form, change)
+        if not change:
+            OwnedProjectCount.objects.adjust({obj.owner_id: 1})
+        elif 'owner' in form.changed_data:
+            OwnedProjectCount.objects.adjust(
+                {form.initial['owner']: -1, obj.owner_id: 1})
+
+    def delete_model(self, request, obj):
+        delete_project(obj)
+
+    def save_related(self, request, form, formsets, change):
+        """
+        The cached permissions of both the old and the new members are
+        cleared.
+
+        """
+        memberships = form.instance.memberships.values_list('user_id',
+                                                             flat=True)
+        user_ids = set(memberships)
+        super(ProjectAdmin, self).save_related(request, form, formsets, change)
+        user_ids.update(memberships)
+        invalidate_project_permissions(user_ids)
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'created_on', 'sent_on',
+                    'attempts', 'failed')
+    list_filter = ('failed',)
 
 
 class JenkinsUserProfileInline(admin.StackedInline):
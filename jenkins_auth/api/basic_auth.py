@@ -11,6 +11,8 @@ import base64
 from django.contrib.auth import authenticate, login
 from django.http import HttpResponse
 
+from jenkins_auth.throttle import get_client_ip, get_failure_tracker
+
 
 def view_or_basicauth(view, request, test_func, realm="", *args, **kwargs):
     """
@@ -32,8 +34,19 @@ def view_or_basicauth(view, request, test_func, realm="", *args, **kwargs):
             if auth[0].lower() == "basic":
                 uname, passwd = base64.b64decode(
                     auth[1]).decode('utf-8').split(':', 1)
+                # refuse before hashing the password if there have been too
+                # many failures
+                tracker = get_failure_tracker()
+                ip = get_client_ip(request)
+                if tracker.is_blocked(uname, ip):
+                    response = HttpResponse('Too many failed logins')
+                    response.status_code = 429
+                    return response
                 user = authenticate(username=uname, password=passwd)
-                if user is not None:
+                if user is None:
+                    tracker.add_failure(uname, ip)
+                else:
+                    tracker.reset(uname)
                     if user.is_active:
                         login(request, user)
                         request.user = user
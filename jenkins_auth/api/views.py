@@ -39,7 +39,7 @@ from django.utils.decorators import method_decorator
 from django.views.generic import View
 
 from jenkins_auth.api.basic_auth import logged_in_or_basicauth
-from jenkins_auth.models import Project
+from jenkins_auth.models import Project, ProjectMembership
 from jenkins_auth.settings import API_USER
 
 
@@ -107,19 +107,9 @@ class _UserInfo():
 
     def _set_roles(self, user):
         roles = {}
-        users_groups = user.groups.all()
-        projects = Project.objects.filter(
-            admins__in=users_groups).filter(is_active=True)
-        project_admin = []
-        for project in projects:
-            project_admin.append(project.name)
-        roles['admin'] = project_admin
-
-        projects = Project.objects.filter(
-            users__in=users_groups).filter(is_active=True)
-        project_user = []
-        for project in projects:
-            project_user.append(project.name)
-        roles['user'] = project_user
+        for role in (ProjectMembership.ADMIN, ProjectMembership.USER):
+            roles[role] = list(
+                Project.objects.with_member(user, role).
+                filter(is_active=True).values_list('name', flat=True))
 
         self.user_info['roles'] = roles
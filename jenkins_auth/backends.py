@@ -0,0 +1,134 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+from django.core.cache import cache
+from django.db import transaction
+
+from jenkins_auth.models import Project, ProjectMembership
+from jenkins_auth.settings import PROJECT_PERMISSION_CACHE_TIMEOUT
+
+
+PROJECT_PERMISSIONS = frozenset([
+    'jenkins_auth.read_project',
+    'jenkins_auth.change_project',
+    'jenkins_auth.delete_project',
+])
+
+# The permissions given by each project role
+ROLE_PERMISSIONS = {
+    ProjectMembership.ADMIN: frozenset([
+        'jenkins_auth.read_project',
+        'jenkins_auth.change_project',
+        'jenkins_auth.delete_project',
+    ]),
+    ProjectMembership.USER: frozenset([
+        'jenkins_auth.read_project',
+    ]),
+}
+
+CACHE_KEY = 'jenkins_auth.project_perms.{}'
+
+
+class ProjectPermissionBackend(object):
+    """
+    Object level permissions for projects.
+
+    A user has a permission on a project if they own the project, or if they
+    have a role in the project that gives the permission, see
+    ROLE_PERMISSIONS.
+
+    The permissions a user holds through their roles are calculated with a
+    single query, stored on the user object for the rest of the request and
+    cached between requests until the users project memberships change.
+
+    """
+
+    def authenticate(self, *args, **kwargs):
+        """
+        This backend only provides permissions.
+
+        """
+        return None
+
+    def get_user(self, user_id):
+        return None
+
+    def has_perm(self, user_obj, perm, obj=None):
+        if not isinstance(obj, Project):
+            return False
+        if not user_obj.is_active or user_obj.is_anonymous():
+            return False
+        if obj.owner_id == user_obj.pk:
+            return perm in PROJECT_PERMISSIONS
+        return perm in get_project_permissions(user_obj).get(obj.pk, ())
+
+
+def get_project_permissions(user_obj):
+    """
+    Get the project permissions a user has through their project roles.
+
+    @param user_obj (User) the user
+    @return (dict) project id mapped to a set of 'app_label.codename'
+
+    """
+    if not hasattr(user_obj, '_project_perm_cache'):
+        key = CACHE_KEY.format(user_obj.pk)
+        perms = cache.get(key)
+        if perms is None:
+            perms = _load_project_permissions(user_obj)
+            cache.set(key, perms, PROJECT_PERMISSION_CACHE_TIMEOUT)
+        user_obj._project_perm_cache = perms
+    return user_obj._project_perm_cache
+
+
+def _load_project_permissions(user_obj):
+    perms = {}
+    rows = (ProjectMembership.objects.filter(user=user_obj).
+            values_list('project_id', 'role'))
+    for project_id, role in rows:
+        perms.setdefault(project_id, set()).update(ROLE_PERMISSIONS[role])
+    return perms
+
+
+def invalidate_project_permissions(user_ids):
+    """
+    Remove the cached project permissions for the given users.
+    The cache is cleared straight away and again once the current transaction
+    has been committed, so that a concurrent request cannot cache the old
+    permissions.
+
+    @param user_ids (iterable) the ids of the users
+
+    """
+    keys = [CACHE_KEY.format(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -29,15 +29,16 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 '''
 from django import forms
-from django.contrib.admin.widgets import FilteredSelectMultiple
 from django.forms import ModelForm
 from django.urls import reverse_lazy
+from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 from registration.forms import RegistrationForm as RegistrationFormBase
 from registration.users import UserModel, UsernameField
 
-from jenkins_auth.models import JenkinsUser, Project
+from jenkins_auth.models import JenkinsUser, Project, ProjectMembership
 from jenkins_auth.settings import API_USER, ADMIN_USER
+from jenkins_auth.utils import set_project_members
 
 
 User = UserModel()
@@ -72,70 +73,109 @@ class MinimalRegistrationForm(ModelForm):
         fields = ('first_name', 'last_name', 'email')
 
 
+def get_member_queryset():
+    """
+    Get the users that can be made members of a project.
+
+    """
+    return (JenkinsUser.objects.
+            filter(is_active=True).
+            exclude(username=API_USER).
+            exclude(username=ADMIN_USER))
+
+
+def get_user_label(user):
+    return u"{full_name} (id:{id})".format(
+        full_name=user.get_full_name(), id=user.id)
+
+
+class UserAutocompleteSelectMultiple(forms.SelectMultiple):
+    """
+    A multiple select that only renders the users that have been selected.
+    Other users are found by searching, the matches are fetched a page at a
+    time from the url.
+
+    """
+
+    def __init__(self, url, attrs=None):
+        super(UserAutocompleteSelectMultiple, self).__init__(attrs)
+        self.url = url
+
+    class Media:
+        css = {
+            'all': ('jenkins_auth/css/user_autocomplete.css',),
+        }
+        js = ('jenkins_auth/scripts/user_autocomplete.js',)
+
+    def render(self, name, value, attrs=None):
+        attrs = dict(attrs or {})
+        attrs['data-autocomplete-url'] = self.url
+        selected = [force_text(v) for v in (value or [])
+                    if force_text(v).isdigit()]
+        all_choices = self.choices
+        self.choices = [
+            (user.pk, get_user_label(user))
+            for user in all_choices.queryset.filter(pk__in=selected)]
+        try:
+            return super(UserAutocompleteSelectMultiple, self).render(
+                name, selected, attrs)
+        finally:
+            self.choices = all_choices
+
+
 class UserMultipleModelChoiceField(forms.ModelMultipleChoiceField):
 
     def label_from_instance(self, obj):
-        return "{full_name} (id:{id})".format(
-            full_name=obj.get_full_name(), id=obj.id)
+        return get_user_label(obj)
 
 
 class ProjectForm(forms.ModelForm):
     admin_users = UserMultipleModelChoiceField(
-        queryset=(JenkinsUser.objects.
-                  filter(is_active=True).
-                  exclude(username=API_USER).
-                  exclude(username=ADMIN_USER)),
+        queryset=get_member_queryset(),
         required=False,
         label=_("Admins"),
-        widget=FilteredSelectMultiple(
-            verbose_name=('Admins'),
-            is_stacked=False,
-        )
+        widget=UserAutocompleteSelectMultiple(
+            url=reverse_lazy('project-user-search'))
     )
     user_users = UserMultipleModelChoiceField(
-        queryset=(JenkinsUser.objects.
-                  filter(is_active=True).
-                  exclude(username=API_USER).
-                  exclude(username=ADMIN_USER)),
+        queryset=get_member_queryset(),
         required=False,
         label=_("Users"),
-        widget=FilteredSelectMultiple(
-            verbose_name=('Users'),
-            is_stacked=False
-        )
+        widget=UserAutocompleteSelectMultiple(
+            url=reverse_lazy('project-user-search'))
     )
 
     class Meta:
         model = Project
         fields = ('description', )
 
-    class Media:
-        css = {
-            'all': ('jenkins_auth/css/jenkins_auth_selector.css',),
-        }
-        js = (reverse_lazy('javascript-catalog'),)
-
     def __init__(self, *args, **kwargs):
         super(ProjectForm, self).__init__(*args, **kwargs)
 
         if self.instance and self.instance.pk:
-            self.fields[
-                'admin_users'].initial = self.instance.admins.user_set.all()
-            self.fields[
-                'user_users'].initial = self.instance.users.user_set.all()
+            self.fields['admin_users'].initial = (
+                self.instance.get_members(ProjectMembership.ADMIN).
+                values_list('pk', flat=True))
+            self.fields['user_users'].initial = (
+                self.instance.get_members(ProjectMembership.USER).
+                values_list('pk', flat=True))
 
     def save(self, commit=True):
         project = super(ProjectForm, self).save(commit=commit)
 
         if commit:
-            project.admins.user_set = self.cleaned_data['admin_users']
-            project.users.user_set = self.cleaned_data['user_users']
+            self._save_members(project)
         else:
             old_save_m2m = self.save_m2m
 
             def new_save_m2m():
                 old_save_m2m()
-                project.admins.user_set = self.cleaned_data['admin_users']
-                project.users.user_set = self.cleaned_data['user_users']
+                self._save_members(project)
             self.save_m2m = new_save_m2m
         return project
+
+    def _save_members(self, project):
+        set_project_members(
+            project,
+            [user.pk for user in self.cleaned_data['admin_users']],
+            [user.pk for user in self.cleaned_data['user_users']])
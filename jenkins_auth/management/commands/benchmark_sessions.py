@@ -0,0 +1,146 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+import threading
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from jenkins_auth.models import JenkinsUser
+
+
+ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+    'django.contrib.sessions.backends.signed_cookies',
+)
+
+
+class Command(BaseCommand):
+    """
+    Time page loads by clients that all log in at the same time, once for
+    each of the supported session engines. Each client logs in as the given
+    user and then loads the page a number of times.
+
+    The sessions created are left to expire, with the database engines they
+    are removed by purge_expired_sessions.
+
+    """
+    help = ('Time the login and page latency of concurrent clients for each '
+            'session engine.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username',
+                            help='The active user the clients log in as.')
+        parser.add_argument('--clients', type=int, default=8,
+                            help='The number of concurrent clients.')
+        parser.add_argument('--requests', type=int, default=20,
+                            help='The number of page loads per client.')
+        parser.add_argument('--path', default=None,
+                            help='The page to load, by default the home page.')
+        parser.add_argument('--host', default='127.0.0.1',
+                            help='The host name sent with the requests, it '
+                            'must be in ALLOWED_HOSTS.')
+
+    def handle(self, *args, **options):
+        try:
+            user = JenkinsUser.objects.get(username=options['username'],
+                                           is_active=True)
+        except JenkinsUser.DoesNotExist:
+            raise CommandError(
+                'Active user "{}" does not exist'.format(options['username']))
+        path = options['path'] or reverse('home')
+
+        self.stdout.write('{:<16}{:>10}{:>10}{:>10}{:>10}{:>8}'.format(
+            'engine', 'login ms', 'p50 ms', 'p95 ms', 'max ms', 'errors'))
+        for engine in ENGINES:
+            with override_settings(SESSION_ENGINE=engine):
+                logins, pages, errors = self._run(
+                    user, path, options['host'], max(options['clients'], 1),
+                    max(options['requests'], 1))
+            self.stdout.write(
+                '{:<16}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}{:>8}'.format(
+                    engine.rsplit('.', 1)[-1],
+                    _percentile(logins, 50), _percentile(pages, 50),
+                    _percentile(pages, 95), max(pages or [0]), errors))
+
+    def _run(self, user, path, host, clients, requests):
+        """
+        @return (tuple) the login times and page load times in milliseconds,
+            and the number of failed logins and page loads
+
+        """
+        logins = []
+        pages = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def run_client():
+            client = Client(HTTP_HOST=host)
+            try:
+                start = timeit.default_timer()
+                client.force_login(
+                    user, backend='django.contrib.auth.backends.ModelBackend')
+                login = (timeit.default_timer() - start) * 1000
+                timings = []
+                failed = 0
+                for _ in range(requests):
+                    start = timeit.default_timer()
+                    response = client.get(path)
+                    timings.append((timeit.default_timer() - start) * 1000)
+                    if response.status_code >= 400:
+                        failed += 1
+                with lock:
+                    logins.append(login)
+                    pages.extend(timings)
+                    errors[0] += failed
+            except Exception:
+                with lock:
+                    errors[0] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run_client)
+                   for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return logins, pages, errors[0]
+
+
+def _percentile(timings, percent):
+    if not timings:
+        return 0
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, len(timings) * percent // 100)]
@@ -0,0 +1,94 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from jenkins_auth.models import JenkinsUser
+
+
+# the url names of the pages that are timed
+PAGES = (
+    'home',
+    'staff_user_approval',
+    'staff_user_active',
+    'staff_user_stale',
+    'staff_user_deleted',
+    'staff_user_staff',
+    'staff_user_registration',
+    'staff_project',
+    'staff_project_approval',
+)
+
+
+class Command(BaseCommand):
+    """
+    Time how long the home page and the staff list pages take to render, as
+    seen by the given staff user. Only the rendering of the template is
+    timed, not the view. The first render is shown separately as it includes
+    loading the templates and filling the fragment cache.
+
+    """
+    help = 'Time the rendering of the home page and the staff list pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username',
+                            help='The staff user the pages are rendered for.')
+        parser.add_argument('--repeat', type=int, default=100,
+                            help='The number of times each page is rendered.')
+
+    def handle(self, *args, **options):
+        try:
+            user = JenkinsUser.objects.get(username=options['username'],
+                                           is_staff=True)
+        except JenkinsUser.DoesNotExist:
+            raise CommandError(
+                'Staff user "{}" does not exist'.format(options['username']))
+        repeat = max(options['repeat'], 1)
+        factory = RequestFactory()
+
+        self.stdout.write('{:<26}{:>10}{:>10}{:>10}'.format(
+            'page', 'first ms', 'min ms', 'mean ms'))
+        for name in PAGES:
+            path = reverse(name)
+            match = resolve(path)
+            timings = []
+            for _ in range(repeat):
+                request = factory.get(path)
+                request.user = user
+                response = match.func(request, *match.args, **match.kwargs)
+                start = timeit.default_timer()
+                response.render()
+                timings.append((timeit.default_timer() - start) * 1000)
+            self.stdout.write('{:<26}{:>10.2f}{:>10.2f}{:>10.2f}'.format(
+                name, timings[0], min(timings), sum(timings) / len(timings)))
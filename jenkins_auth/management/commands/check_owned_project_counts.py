@@ -0,0 +1,67 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+from django.core.management.base import BaseCommand, CommandError
+
+from jenkins_auth.models import JenkinsUser
+from jenkins_auth.utils import check_owned_project_counts
+
+
+class Command(BaseCommand):
+    """
+    Check the stored number of projects owned by each user against the
+    projects, and optionally repair them. The counts are only changed by
+    this application, so they may be wrong after projects have been changed
+    in the database directly or deleted in bulk from the Django admin.
+
+    manage.py check_owned_project_counts --repair
+
+    """
+    help = 'Check, and optionally repair, the owned project counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true',
+                            help='Correct the counts that are wrong.')
+
+    def handle(self, *args, **options):
+        wrong = check_owned_project_counts(repair=options['repair'])
+        usernames = dict(JenkinsUser.objects.filter(pk__in=list(wrong)).
+                         values_list('pk', 'username'))
+        for user_id, (stored, actual) in sorted(wrong.items()):
+            self.stdout.write('  {}: stored {}, owns {}'.format(
+                usernames.get(user_id, user_id), stored, actual))
+        if options['repair']:
+            self.stdout.write('Repaired {} counts'.format(len(wrong)))
+        elif wrong:
+            raise CommandError(
+                '{} counts are wrong, run with --repair to correct '
+                'them'.format(len(wrong)))
+        else:
+            self.stdout.write('All counts are correct')
@@ -0,0 +1,77 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+from django.core.management.base import BaseCommand, CommandError
+
+from jenkins_auth.models import JenkinsUser, Project
+from jenkins_auth.utils import create_projects
+
+
+class Command(BaseCommand):
+    """
+    Create projects owned by a user.
+
+    manage.py create_projects <owner> "project 1" "project 2"
+    manage.py create_projects <owner> --count 100 --prefix "course 2017"
+
+    """
+    help = 'Create active projects owned by a user, using bulk inserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('owner', help='The username of the project owner.')
+        parser.add_argument('names', nargs='*',
+                            help='The names of the projects to create.')
+        parser.add_argument('--count', type=int, default=0,
+                            help='Also create COUNT projects named '
+                            '"<prefix> <n>".')
+        parser.add_argument('--prefix', default='project',
+                            help='The name prefix used with --count.')
+        parser.add_argument('--batch-size', type=int, default=250,
+                            help='The number of projects created per '
+                            'transaction.')
+
+    def handle(self, *args, **options):
+        try:
+            owner = JenkinsUser.objects.get(username=options['owner'])
+        except JenkinsUser.DoesNotExist:
+            raise CommandError(
+                'User "{}" does not exist'.format(options['owner']))
+
+        names = list(options['names'])
+        names.extend('{} {}'.format(options['prefix'], i)
+                     for i in range(1, options['count'] + 1))
+        batch_size = max(options['batch_size'], 1)
+
+        for start in range(0, len(names), batch_size):
+            create_projects(
+                [Project(name=name, owner=owner, is_active=True)
+                 for name in names[start:start + batch_size]])
+
+        self.stdout.write('Created {} projects'.format(len(names)))
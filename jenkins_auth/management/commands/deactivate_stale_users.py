@@ -0,0 +1,86 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+from django.core.management.base import BaseCommand
+
+from jenkins_auth.settings import ACCOUNT_EXPIRATION_DAYS
+from jenkins_auth.utils import deactivate_stale_users, \
+    run_requested_stale_user_deactivation
+
+
+class Command(BaseCommand):
+    """
+    Logically delete the users that have not logged in for
+    ACCOUNT_EXPIRATION_DAYS days, except for project owners. Intended to be
+    run from cron, e.g.
+
+    30 3 * * * manage.py deactivate_stale_users
+
+    With --requested the users are only deactivated if the staff have asked
+    for it, so that it can be checked for often, e.g.
+
+    * * * * * manage.py deactivate_stale_users --requested
+
+    """
+    help = ('Deactivate the accounts that have not been used recently, in '
+            'batches, each batch in its own transaction.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=ACCOUNT_EXPIRATION_DAYS,
+                            help='The number of days without a login after '
+                            'which an account is stale.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='The number of accounts deactivated per '
+                            'transaction.')
+        parser.add_argument('--requested', action='store_true',
+                            help='Only deactivate if the staff have asked '
+                            'for it.')
+
+    def handle(self, *args, **options):
+        verbose = options['verbosity'] > 1
+
+        def progress(summary):
+            if verbose:
+                self.stdout.write(
+                    '  deactivated {}'.format(summary['users deactivated']))
+
+        if options['requested']:
+            summary = run_requested_stale_user_deactivation(
+                days=options['days'],
+                batch_size=max(options['batch_size'], 1), progress=progress)
+            if summary is None:
+                return
+        else:
+            summary = deactivate_stale_users(
+                days=options['days'],
+                batch_size=max(options['batch_size'], 1), progress=progress)
+        for name, count in sorted(summary.items()):
+            self.stdout.write('  {}: {}'.format(name, count))
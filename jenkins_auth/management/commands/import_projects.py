@@ -0,0 +1,134 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+from jenkins_auth.backends import invalidate_project_permissions
+from jenkins_auth.management.importing import ImportCommand
+from jenkins_auth.models import JenkinsUser, Project, ProjectMembership
+from jenkins_auth.utils import create_projects
+
+
+ROLES = ('owner', 'admin', 'user')
+
+
+class Command(ImportCommand):
+    """
+    Import projects and their members.
+
+    Each row has the columns project, role, username and, optionally,
+    description. A row with the role 'owner' creates the project, the owner is
+    also made an admin. Rows with the role 'admin' or 'user' add a member to a
+    project created by an earlier row or already in the database.
+
+    CSV:
+        project,role,username,description
+        course 1,owner,jbloggs,The first course
+        course 1,user,asmith,
+
+    JSON lines:
+        {"project": "course 1", "role": "owner", "username": "jbloggs"}
+        {"project": "course 1", "role": "user", "username": "asmith"}
+
+    """
+    help = 'Import projects, admins and users from a CSV or JSON lines file.'
+
+    def import_rows(self, rows):
+        owner_rows = []
+        member_rows = []
+        for row in rows:
+            role = (row.get('role') or '').strip().lower()
+            if not row.get('project') or not row.get('username') or \
+                    role not in ROLES:
+                self.counts['invalid rows'] += 1
+            elif role == 'owner':
+                owner_rows.append(row)
+            else:
+                member_rows.append(row)
+
+        user_ids = dict(
+            JenkinsUser.objects.
+            filter(username__in=set(row['username'] for row in rows
+                                    if row.get('username'))).
+            values_list('username', 'id'))
+        self._create_projects(owner_rows, user_ids)
+        self._add_members(member_rows, user_ids)
+
+    def _create_projects(self, rows, user_ids):
+        names = set(row['project'] for row in rows)
+        existing = set(Project.objects.filter(name__in=names).
+                       values_list('name', flat=True))
+        projects = []
+        for row in rows:
+            name = row['project']
+            if name in existing:
+                self.counts['projects already exist'] += 1
+            elif row['username'] not in user_ids:
+                self.counts['unknown users'] += 1
+            else:
+                existing.add(name)
+                projects.append(Project(
+                    name=name,
+                    description=row.get('description') or '',
+                    owner_id=user_ids[row['username']],
+                    is_active=True))
+        if projects:
+            create_projects(projects)
+        self.counts['projects created'] += len(projects)
+
+    def _add_members(self, rows, user_ids):
+        project_ids = dict(
+            Project.objects.
+            filter(name__in=set(row['project'] for row in rows)).
+            values_list('name', 'id'))
+        wanted = set()
+        for row in rows:
+            if row['project'] not in project_ids:
+                self.counts['unknown projects'] += 1
+            elif row['username'] not in user_ids:
+                self.counts['unknown users'] += 1
+            else:
+                role = row['role'].strip().lower()
+                wanted.add((project_ids[row['project']], role,
+                            user_ids[row['username']]))
+        if not wanted:
+            return
+
+        existing = set(
+            ProjectMembership.objects.
+            filter(project_id__in=set(row[0] for row in wanted),
+                   user_id__in=set(row[2] for row in wanted)).
+            values_list('project_id', 'role', 'user_id'))
+        new = wanted - existing
+        ProjectMembership.objects.bulk_create(
+            [ProjectMembership(project_id=project_id, role=role,
+                               user_id=user_id)
+             for project_id, role, user_id in new])
+        invalidate_project_permissions(set(row[2] for row in new))
+        self.counts['members added'] += len(new)
+        self.counts['members already present'] += len(wanted) - len(new)
@@ -0,0 +1,121 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+import hashlib
+
+from django.contrib.auth.hashers import make_password
+from django.utils.crypto import get_random_string
+
+from jenkins_auth.management.importing import ImportCommand
+from jenkins_auth.models import JenkinsUser, JenkinsUserProfile, RegistrationProfile
+from jenkins_auth.search import get_search_backend
+
+
+class Command(ImportCommand):
+    """
+    Create Shibboleth users before they log in for the first time.
+
+    Each row has the columns persistent_id, first_name, last_name and email.
+    For each new persistent id a user with an unusable password, a
+    JenkinsUserProfile holding the Shibboleth id and an activated
+    RegistrationProfile are created, the same as a user that has registered
+    and confirmed their email. Users that already exist are skipped. No email
+    is sent.
+
+    CSV:
+        persistent_id,first_name,last_name,email
+        CBIV/Ddgyl825NoF6EM77QAQl0E=42,Joe,Bloggs,joe.bloggs@example.org
+
+    """
+    help = ('Create Shibboleth users from a CSV or JSON lines file of '
+            'persistent_id, first_name, last_name, email.')
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--inactive', action='store_true', default=False,
+                            help='Leave the new users waiting for staff '
+                            'approval.')
+
+    def handle(self, *args, **options):
+        self.is_active = not options['inactive']
+        return super(Command, self).handle(*args, **options)
+
+    def import_rows(self, rows):
+        new_rows = {}
+        for row in rows:
+            username = (row.get('persistent_id') or '').strip()
+            if not username:
+                self.counts['invalid rows'] += 1
+            elif username in new_rows:
+                self.counts['duplicate rows'] += 1
+            else:
+                new_rows[username] = row
+
+        existing = set(JenkinsUser.objects.
+                       filter(username__in=list(new_rows)).
+                       values_list('username', flat=True))
+        self.counts['users already exist'] += len(existing)
+        for username in existing:
+            del new_rows[username]
+        if not new_rows:
+            return
+
+        JenkinsUser.objects.bulk_create(
+            [JenkinsUser(username=username,
+                         first_name=row.get('first_name') or '',
+                         last_name=row.get('last_name') or '',
+                         email=row.get('email') or '',
+                         password=make_password(None),
+                         is_active=self.is_active)
+             for username, row in new_rows.items()])
+        # bulk_create does not set the primary key on every database
+        user_ids = (JenkinsUser.objects.
+                    filter(username__in=list(new_rows)).
+                    values_list('username', 'id'))
+
+        profiles = []
+        registrations = []
+        for username, user_id in user_ids:
+            profiles.append(
+                JenkinsUserProfile(user_id=user_id, shib_uid=username))
+            registrations.append(
+                RegistrationProfile(user_id=user_id,
+                                    activation_key=_activation_key(),
+                                    activated=True))
+        JenkinsUserProfile.objects.bulk_create(profiles)
+        RegistrationProfile.objects.bulk_create(registrations)
+        # bulk_create does not send post_save
+        get_search_backend().index_users(
+            JenkinsUser.objects.filter(username__in=list(new_rows)))
+        self.counts['users created'] += len(profiles)
+
+
+def _activation_key():
+    return hashlib.sha1(get_random_string(40).encode('ascii')).hexdigest()
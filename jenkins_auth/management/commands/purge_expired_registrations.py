@@ -0,0 +1,76 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+from django.core.management.base import BaseCommand
+
+from jenkins_auth.models import RegistrationProfile
+from jenkins_auth.utils import run_requested_registration_purge
+
+
+class Command(BaseCommand):
+    """
+    Delete the users that never completed their registration before the
+    activation key expired. Intended to be run from cron, e.g.
+
+    0 3 * * * manage.py purge_expired_registrations
+
+    With --requested the purge is only run if the staff have asked for one,
+    so that it can be checked for often, e.g.
+
+    * * * * * manage.py purge_expired_registrations --requested
+
+    """
+    help = ('Delete expired, never activated registrations in batches, each '
+            'batch in its own transaction.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='The number of registrations deleted per '
+                            'transaction.')
+        parser.add_argument('--requested', action='store_true',
+                            help='Only purge if the staff have asked for it.')
+
+    def handle(self, *args, **options):
+        verbose = options['verbosity'] > 1
+
+        def progress(deleted):
+            if verbose:
+                self.stdout.write('  deleted {}'.format(deleted))
+
+        batch_size = max(options['batch_size'], 1)
+        if options['requested']:
+            deleted = run_requested_registration_purge(
+                batch_size=batch_size, progress=progress)
+            if deleted is None:
+                return
+        else:
+            deleted = RegistrationProfile.objects.delete_expired_users(
+                batch_size=batch_size, progress=progress)
+        self.stdout.write('Deleted {} expired registrations'.format(deleted))
@@ -0,0 +1,70 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+from django.core.management.base import BaseCommand
+
+from jenkins_auth.utils import delete_expired_sessions
+
+
+class Command(BaseCommand):
+    """
+    Delete the expired sessions, a replacement for clearsessions that does
+    not lock the database for the whole delete. Intended to be run from cron,
+    e.g.
+
+    15 * * * * manage.py purge_expired_sessions
+
+    """
+    help = ('Delete expired sessions from the database in batches, each batch '
+            'in its own transaction.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='The number of sessions deleted per '
+                            'transaction.')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='The number of seconds to wait between '
+                            'batches.')
+
+    def handle(self, *args, **options):
+        verbose = options['verbosity'] > 1
+
+        def progress(deleted):
+            if verbose:
+                self.stdout.write('  deleted {}'.format(deleted))
+
+        deleted = delete_expired_sessions(
+            batch_size=max(options['batch_size'], 1),
+            pause=max(options['pause'], 0), progress=progress)
+        if deleted is None:
+            self.stdout.write(
+                'The session engine does not store sessions in the database')
+        else:
+            self.stdout.write('Deleted {} expired sessions'.format(deleted))
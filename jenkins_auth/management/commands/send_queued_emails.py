@@ -0,0 +1,76 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+import time
+
+from django.core.management.base import BaseCommand
+
+from jenkins_auth.outbox import queue_staff_digest, send_queued_emails
+from jenkins_auth.settings import STAFF_DIGEST_INTERVAL
+
+
+class Command(BaseCommand):
+    """
+    Send the emails in the outbox, queuing the digest of account requests
+    for the staff first if one is due. Intended to be run from cron, e.g.
+
+    * * * * * manage.py send_queued_emails
+
+    or as a long running worker with --loop.
+
+    """
+    help = ('Send the queued emails over one connection to the mail server, '
+            'retrying failed emails with a backoff.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='The number of emails claimed at a time.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep checking the outbox until stopped.')
+        parser.add_argument('--interval', type=int, default=10,
+                            help='The number of seconds to wait between '
+                            'checks when using --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            if STAFF_DIGEST_INTERVAL:
+                users = queue_staff_digest()
+                if users:
+                    self.stdout.write(
+                        'Queued a digest of {} account requests'.format(
+                            users))
+            sent, failed = send_queued_emails(
+                batch_size=max(options['batch_size'], 1))
+            if sent or failed or not options['loop']:
+                self.stdout.write(
+                    'Sent {} emails, {} failed'.format(sent, failed))
+            if not options['loop']:
+                break
+            time.sleep(max(options['interval'], 1))
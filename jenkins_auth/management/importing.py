@@ -0,0 +1,194 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+from collections import Counter
+import csv
+import io
+from itertools import islice
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import six
+
+
+def read_rows(stream, file_format):
+    """
+    Read a UTF-8 encoded CSV file with a header row, or a JSON lines file,
+    one row at a time.
+
+    @param stream (file) the file open in binary mode
+    @param file_format (str) 'csv' or 'jsonl'
+    @return (generator) a dict of unicode strings for each row
+
+    """
+    try:
+        if file_format == 'csv':
+            for row in _read_csv(stream):
+                yield row
+            return
+        for line_number, line in enumerate(stream, 1):
+            line = line.decode('utf-8').strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as ex:
+                raise CommandError('Line {}: {}'.format(line_number, ex))
+    except UnicodeDecodeError as ex:
+        raise CommandError('The file is not UTF-8 encoded: {}'.format(ex))
+
+
+def _read_csv(stream):
+    if six.PY3:
+        return csv.DictReader(
+            io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+    # the Python 2 csv module only reads bytes
+    return (dict((_decode(key), _decode(value))
+                 for key, value in row.items())
+            for row in csv.DictReader(stream))
+
+
+def _decode(value):
+    """
+    @return the value with any UTF-8 bytes, including those in a list of
+        extra cells, decoded
+
+    """
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def chunked(iterable, size):
+    """
+    Split an iterable into lists of at most size items.
+
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ImportCommand(BaseCommand):
+    """
+    Base class for commands that import a CSV or JSON lines file.
+
+    The file is streamed and handed to import_rows in chunks of --batch-size
+    rows, so memory use does not depend on the size of the file. Each chunk is
+    imported in its own transaction. With --dry-run the whole import runs in
+    one transaction that is rolled back at the end.
+
+    Sub classes implement import_rows and count what they do in self.counts.
+
+    """
+    # The default number of rows per chunk. On SQLite a chunk must produce
+    # fewer than 999 query parameters.
+    batch_size = 400
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='The file to import, "-" for stdin.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='The file format, by default taken from the '
+                            'file extension.')
+        parser.add_argument('--batch-size', type=int, default=self.batch_size,
+                            help='The number of rows imported per '
+                            'transaction.')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='Check the file without saving anything.')
+
+    def import_rows(self, rows):
+        """
+        Import a chunk of rows.
+
+        @param rows (list) dicts read from the file
+
+        """
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.counts = Counter()
+        path = options['file']
+        file_format = options['format']
+        if file_format is None:
+            file_format = 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+        batch_size = max(options['batch_size'], 1)
+
+        started = time.time()
+        if path == '-':
+            stdin = sys.stdin.buffer if six.PY3 else sys.stdin
+            total = self._import_stream(
+                stdin, file_format, batch_size, options['dry_run'])
+        else:
+            try:
+                stream = io.open(path, 'rb')
+            except IOError as ex:
+                raise CommandError(str(ex))
+            with stream:
+                total = self._import_stream(
+                    stream, file_format, batch_size, options['dry_run'])
+        elapsed = max(time.time() - started, 0.001)
+
+        self.stdout.write('Read {} rows in {:.1f}s ({:.0f} rows/s)'.format(
+            total, elapsed, total / elapsed))
+        for name in sorted(self.counts):
+            self.stdout.write('  {}: {}'.format(name, self.counts[name]))
+        if options['dry_run']:
+            self.stdout.write('Dry run, nothing was saved')
+
+    def _import_stream(self, stream, file_format, batch_size, dry_run):
+        rows = read_rows(stream, file_format)
+        if not dry_run:
+            return self._import_chunks(rows, batch_size)
+        with transaction.atomic():
+            total = self._import_chunks(rows, batch_size)
+            transaction.set_rollback(True)
+        return total
+
+    def _import_chunks(self, rows, batch_size):
+        total = 0
+        started = time.time()
+        for chunk in chunked(rows, batch_size):
+            with transaction.atomic():
+                self.import_rows(chunk)
+            total += len(chunk)
+            if self.verbosity > 1:
+                elapsed = max(time.time() - started, 0.001)
+                self.stdout.write('{} rows ({:.0f} rows/s)'.format(
+                    total, total / elapsed))
+        return total
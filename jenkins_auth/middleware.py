@@ -0,0 +1,121 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+import hashlib
+
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.encoding import force_bytes
+from shibboleth.middleware import ShibbolethRemoteUserMiddleware
+
+from jenkins_auth.models import JenkinsUser
+from jenkins_auth.settings import SHIBBOLETH_USER_CACHE_TIMEOUT
+
+
+SHIB_USER_CACHE_KEY = 'jenkins_auth.shib_user.{}'
+
+
+class CachedShibbolethRemoteUserMiddleware(ShibbolethRemoteUserMiddleware):
+    """
+    A ShibbolethRemoteUserMiddleware that does not load the user on every
+    request.
+
+    The persistent-id in the Shibboleth header is resolved, through the cache,
+    to the id of the user and whether they are a Shibboleth user. If the
+    session already belongs to that user nothing more is done here, so the
+    user is only loaded if the view uses it. Otherwise the user is
+    authenticated and logged in by ShibbolethRemoteUserMiddleware.
+
+    The resolved details are available to views as request.shib_user.
+
+    """
+
+    def process_request(self, request):
+        persistent_id = request.META.get(self.header)
+        if persistent_id and hasattr(request, 'session'):
+            shib_user = get_shib_user(persistent_id)
+            if shib_user is not None:
+                request.shib_user = shib_user
+                if request.session.get(SESSION_KEY) == str(
+                        shib_user['user_id']):
+                    return
+        return super(CachedShibbolethRemoteUserMiddleware,
+                     self).process_request(request)
+
+
+def get_shib_user(username):
+    """
+    Get the id of a user and whether they are a Shibboleth user, i.e. they
+    have a profile with a shib_uid equal to their username.
+
+    @param username (str) the username, for a Shibboleth user the
+        persistent-id
+
+    @return (dict) with the keys 'user_id' and 'is_shib_user', or None if
+        there is no such user
+
+    """
+    key = _cache_key(username)
+    shib_user = cache.get(key)
+    if shib_user is None:
+        row = (JenkinsUser.objects.filter(username=username).
+               values_list('pk', 'jenkinsuserprofile__shib_uid').first())
+        if row is None:
+            return None
+        shib_user = {'user_id': row[0], 'is_shib_user': row[1] == username}
+        cache.set(key, shib_user, SHIBBOLETH_USER_CACHE_TIMEOUT)
+    return shib_user
+
+
+def invalidate_shib_users(usernames):
+    """
+    Remove the cached details of the given users. The cache is cleared
+    straight away and again once the current transaction has been committed,
+    as is done for the project permissions.
+
+    @param usernames (iterable) the usernames of the users
+
+    """
+    keys = [_cache_key(username) for username in usernames]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _cache_key(username):
+    """
+    The username is hashed as it may hold characters, or be longer than,
+    memcached allows in a key.
+
+    """
+    return SHIB_USER_CACHE_KEY.format(
+        hashlib.sha1(force_bytes(username)).hexdigest())
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 14:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0008_alter_user_username_max_length'),
+        ('registration', '0003_migrate_activatedstatus'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JenkinsUserProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shib_uid', models.CharField(max_length=100, unique=True, verbose_name='Shibboleth UID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Project',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='A human readable name for the project that must be unique.', max_length=200, unique=True, verbose_name='Project name')),
+                ('description', models.TextField(blank=True, help_text='A description of the project, up to 300 characters long.', max_length=300)),
+                ('is_active', models.BooleanField(default=False, help_text='Designates whether this project should be treated as active.', verbose_name='Active')),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('admins', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='project_admin', to='auth.Group')),
+            ],
+            options={
+                'permissions': (('read_project', 'Can read project'),),
+            },
+        ),
+        migrations.CreateModel(
+            name='JenkinsUser',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+            },
+            bases=('auth.user',),
+        ),
+        migrations.CreateModel(
+            name='RegistrationProfile',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+            },
+            bases=('registration.registrationprofile',),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='project_owner', to='jenkins_auth.JenkinsUser'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='users',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='project_user', to='auth.Group'),
+        ),
+        migrations.AddField(
+            model_name='jenkinsuserprofile',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='jenkins_auth.JenkinsUser'),
+        ),
+    ]
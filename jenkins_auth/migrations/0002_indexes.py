@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Indexes for the filters and sorts used by the staff lists and the API.
+# Only the project indexes belong to a model of this app, the others are on
+# the tables of the auth and registration apps so are created with SQL.
+# (name, table, columns)
+INDEXES = [
+    ('jenkins_auth_user_active_last_name', 'auth_user',
+     ('is_active', 'last_name')),
+    ('jenkins_auth_user_active_last_login', 'auth_user',
+     ('is_active', 'last_login')),
+    ('jenkins_auth_user_is_staff', 'auth_user', ('is_staff',)),
+    ('jenkins_auth_project_active_created_on', 'jenkins_auth_project',
+     ('is_active', 'created_on')),
+    ('jenkins_auth_project_active_name', 'jenkins_auth_project',
+     ('is_active', 'name')),
+    ('jenkins_auth_regprofile_activated', 'registration_registrationprofile',
+     ('activated',)),
+    ('jenkins_auth_regprofile_activation_key',
+     'registration_registrationprofile', ('activation_key',)),
+]
+
+
+def create_indexes(apps, schema_editor):
+    """
+    On PostgreSQL the indexes are built concurrently so the tables are not
+    locked while they are built, this cannot be done in a transaction so the
+    migration is not atomic.
+
+    """
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    if connection.vendor == 'postgresql':
+        template = 'CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ({})'
+    elif connection.vendor == 'mysql':
+        template = 'CREATE INDEX {} ON {} ({})'
+    else:
+        template = 'CREATE INDEX IF NOT EXISTS {} ON {} ({})'
+    for name, table, columns in INDEXES:
+        schema_editor.execute(template.format(
+            quote(name), quote(table),
+            ', '.join(quote(column) for column in columns)))
+
+
+def drop_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    for name, table, columns in INDEXES:
+        if connection.vendor == 'mysql':
+            sql = 'DROP INDEX {} ON {}'.format(quote(name), quote(table))
+        elif connection.vendor == 'postgresql':
+            sql = 'DROP INDEX CONCURRENTLY IF EXISTS {}'.format(quote(name))
+        else:
+            sql = 'DROP INDEX IF EXISTS {}'.format(quote(name))
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('auth', '0008_alter_user_username_max_length'),
+        ('registration', '0003_migrate_activatedstatus'),
+        ('jenkins_auth', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+            state_operations=[
+                migrations.AlterIndexTogether(
+                    name='project',
+                    index_together=set([('is_active', 'created_on'),
+                                        ('is_active', 'name')]),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 14:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jenkins_auth', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('from_email', models.CharField(max_length=254)),
+                ('recipients', models.TextField()),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('send_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('failed', models.BooleanField(default=False, help_text='Designates that sending has been given up.')),
+                ('sent_on', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='outgoingemail',
+            index_together=set([('sent_on', 'failed', 'send_after')]),
+        ),
+    ]
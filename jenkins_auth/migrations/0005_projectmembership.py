@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 15:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jenkins_auth', '0004_staffnotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectMembership',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('admin', 'Admin'), ('user', 'User')], max_length=5)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='jenkins_auth.Project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='project_memberships', to='jenkins_auth.JenkinsUser')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='projectmembership',
+            unique_together=set([('project', 'role', 'user')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='projectmembership',
+            index_together=set([('user', 'role', 'project')]),
+        ),
+        # the groups are removed by the next migration, before the columns
+        migrations.AlterField(
+            model_name='project',
+            name='admins',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='project_admin', to='auth.Group'),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='users',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='project_user', to='auth.Group'),
+        ),
+    ]
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+
+# Copy the members of the admin and user groups of each project into
+# ProjectMembership and delete the groups. The projects are read in primary
+# key order, BATCH_SIZE at a time, and each batch is copied in its own short
+# transaction so the tables are not locked for the whole migration. A batch
+# clears the groups of its projects, so an interrupted run can be restarted.
+# Two groups per project keeps the ids in one query under the SQLite limit.
+BATCH_SIZE = 400
+
+ADMIN_PERMISSIONS = ('change_project', 'delete_project', 'read_project')
+USER_PERMISSIONS = ('read_project',)
+
+
+def copy_groups(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Group = apps.get_model('auth', 'Group')
+    Project = apps.get_model('jenkins_auth', 'Project')
+    ProjectMembership = apps.get_model('jenkins_auth', 'ProjectMembership')
+    group_member = Group._meta.get_field('user').through
+
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=db):
+            projects = list(Project.objects.using(db).
+                            filter(pk__gt=last_pk).
+                            order_by('pk').
+                            values_list('pk', 'admins_id', 'users_id')
+                            [:BATCH_SIZE])
+            if not projects:
+                break
+            last_pk = projects[-1][0]
+            # group id -> (project id, role)
+            roles = {}
+            for project_id, admins_id, users_id in projects:
+                if admins_id is not None:
+                    roles[admins_id] = (project_id, 'admin')
+                if users_id is not None:
+                    roles[users_id] = (project_id, 'user')
+            if not roles:
+                continue
+            rows = (group_member.objects.using(db).
+                    filter(group_id__in=list(roles)).
+                    values_list('group_id', 'user_id'))
+            ProjectMembership.objects.using(db).bulk_create([
+                ProjectMembership(project_id=roles[group_id][0],
+                                  role=roles[group_id][1], user_id=user_id)
+                for group_id, user_id in rows])
+            # clear the foreign keys first so deleting the groups does not
+            # cascade to the projects
+            (Project.objects.using(db).
+             filter(pk__in=[project[0] for project in projects]).
+             update(admins=None, users=None))
+            Group.objects.using(db).filter(pk__in=list(roles)).delete()
+
+
+def restore_groups(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Group = apps.get_model('auth', 'Group')
+    Permission = apps.get_model('auth', 'Permission')
+    Project = apps.get_model('jenkins_auth', 'Project')
+    ProjectMembership = apps.get_model('jenkins_auth', 'ProjectMembership')
+    group_member = Group._meta.get_field('user').through
+    group_permission = Group.permissions.through
+
+    permission_ids = dict(
+        Permission.objects.using(db).
+        filter(content_type__app_label='jenkins_auth',
+               content_type__model='project').
+        values_list('codename', 'id'))
+    role_permissions = {
+        'admins': [permission_ids[codename] for codename in ADMIN_PERMISSIONS
+                   if codename in permission_ids],
+        'users': [permission_ids[codename] for codename in USER_PERMISSIONS
+                  if codename in permission_ids],
+    }
+    group_roles = {'admin': 'admins', 'user': 'users'}
+
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=db):
+            projects = list(Project.objects.using(db).
+                            filter(pk__gt=last_pk, admins__isnull=True).
+                            order_by('pk').
+                            values_list('pk', 'name')[:BATCH_SIZE])
+            if not projects:
+                break
+            last_pk = projects[-1][0]
+            names = []
+            for project_id, name in projects:
+                names.append('{} | admins'.format(name))
+                names.append('{} | users'.format(name))
+            Group.objects.using(db).bulk_create(
+                [Group(name=name) for name in names])
+            group_ids = dict(Group.objects.using(db).
+                             filter(name__in=names).
+                             values_list('name', 'id'))
+
+            links = []
+            for project_id, name in projects:
+                ids = {}
+                for role in ('admins', 'users'):
+                    ids[role] = group_ids['{} | {}'.format(name, role)]
+                    links.extend(
+                        group_permission(group_id=ids[role],
+                                         permission_id=permission_id)
+                        for permission_id in role_permissions[role])
+                (Project.objects.using(db).filter(pk=project_id).
+                 update(admins=ids['admins'], users=ids['users']))
+            group_permission.objects.using(db).bulk_create(links)
+
+            project_names = dict(projects)
+            rows = (ProjectMembership.objects.using(db).
+                    filter(project_id__in=list(project_names)).
+                    values_list('project_id', 'role', 'user_id'))
+            group_member.objects.using(db).bulk_create([
+                group_member(group_id=group_ids['{} | {}'.format(
+                    project_names[project_id], group_roles[role])],
+                    user_id=user_id)
+                for project_id, role, user_id in rows])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('jenkins_auth', '0005_projectmembership'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_groups, restore_groups),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 15:03
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jenkins_auth', '0006_copy_project_groups'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='project',
+            name='admins',
+        ),
+        migrations.RemoveField(
+            model_name='project',
+            name='users',
+        ),
+    ]
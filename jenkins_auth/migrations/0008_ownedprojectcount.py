@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 15:08
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def count_projects(apps, schema_editor):
+    db = schema_editor.connection.alias
+    OwnedProjectCount = apps.get_model('jenkins_auth', 'OwnedProjectCount')
+    Project = apps.get_model('jenkins_auth', 'Project')
+    counts = (Project.objects.using(db).order_by().values_list('owner').
+              annotate(Count('pk')))
+    OwnedProjectCount.objects.using(db).bulk_create(
+        [OwnedProjectCount(user_id=owner_id, count=count)
+         for owner_id, count in counts])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jenkins_auth', '0007_remove_project_groups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OwnedProjectCount',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='owned_project_count', serialize=False, to='jenkins_auth.JenkinsUser')),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_projects, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 15:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jenkins_auth', '0008_ownedprojectcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationPurgeRequest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('requested_on', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
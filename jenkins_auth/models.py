@@ -28,14 +28,17 @@ ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 '''
-from django.contrib.auth.models import Group, User
-from django.core.mail import send_mail
-from django.db import models
+import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.urls import reverse
+from django.utils import timezone
 from registration.models import RegistrationManager as RegistrationManagerBase
 from registration.models import RegistrationProfile as RegistrationProfileBase
 from registration.models import SHA1_RE
-from registration.users import UserModel
 
 
 # from jenkins_auth.utils import validate_shibboleth_username
@@ -43,24 +46,21 @@ from registration.users import UserModel
 class JenkinsUserManager(models.Manager):
 
     def email_staff(self, subject, message, _from):
-        send_mail(
-            subject,
-            message,
-            _from,
-            self.get_staff_emails(),
-            fail_silently=False,
-        )
+        """
+        Queue an email to the staff, it is sent by the send_queued_emails
+        command.
+
+        """
+        OutgoingEmail.objects.queue(
+            subject, message, _from, self.get_staff_emails())
 
     def get_staff_emails(self):
         """
         Get a list of staff email addresses.
 
         """
-        staff = JenkinsUser.objects.filter(is_staff=True)
-        email = set()
-        for person in staff:
-            email.add(person.email)
-        return email
+        return set(self.filter(is_staff=True).exclude(email='').
+                   values_list('email', flat=True))
 
 
 class JenkinsUser(User):
@@ -94,6 +94,21 @@ class JenkinsUserProfile(models.Model):
         return self.shib_uid == self.user.username
 
 
+class ProjectQuerySet(models.QuerySet):
+
+    def with_member(self, user, role):
+        """
+        Get the projects in which a user has a role.
+
+        @param user (JenkinsUser) the user
+        @param role (str) ProjectMembership.ADMIN or ProjectMembership.USER
+
+        @return (QuerySet) the projects
+
+        """
+        return self.filter(memberships__user=user, memberships__role=role)
+
+
 class Project(models.Model):
     name = models.CharField('Project name', max_length=200, unique=True,
                             help_text='A human readable name for the project that must be unique.')
@@ -103,21 +118,124 @@ class Project(models.Model):
     # automatically delete the project
     owner = models.ForeignKey(
         JenkinsUser, related_name='project_owner', on_delete=models.PROTECT)
-    admins = models.ForeignKey(
-        Group, related_name='project_admin', on_delete=models.CASCADE)
-    users = models.ForeignKey(
-        Group, related_name='project_user', on_delete=models.CASCADE)
     is_active = models.BooleanField(
         'Active', default=False, help_text='Designates whether this project should be treated as active.')
     created_on = models.DateTimeField(auto_now_add=True)
 
+    objects = ProjectQuerySet.as_manager()
+
     def get_absolute_url(self):
         return reverse('project-detail', kwargs={'pk': self.pk})
 
+    def get_members(self, role):
+        """
+        Get the users that have a role in this project.
+
+        @param role (str) ProjectMembership.ADMIN or ProjectMembership.USER
+
+        @return (QuerySet) the users
+
+        """
+        return JenkinsUser.objects.filter(project_memberships__project=self,
+                                          project_memberships__role=role)
+
     class Meta:
         permissions = (
             ('read_project', 'Can read project'),
         )
+        # the staff project lists filter on is_active and sort on these
+        index_together = (
+            ('is_active', 'created_on'),
+            ('is_active', 'name'),
+        )
+
+
+class ProjectMembership(models.Model):
+    """
+    The role a user has in a project. Admins may change and delete the
+    project, users may read it.
+
+    """
+    ADMIN = 'admin'
+    USER = 'user'
+    ROLE_CHOICES = (
+        (ADMIN, 'Admin'),
+        (USER, 'User'),
+    )
+
+    user = models.ForeignKey(
+        JenkinsUser, related_name='project_memberships',
+        on_delete=models.CASCADE)
+    project = models.ForeignKey(
+        Project, related_name='memberships', on_delete=models.CASCADE)
+    role = models.CharField(max_length=5, choices=ROLE_CHOICES)
+
+    class Meta:
+        # the members of a project are listed by role and the projects of a
+        # user are listed by role, so each needs the role before the other id
+        unique_together = (
+            ('project', 'role', 'user'),
+        )
+        index_together = (
+            ('user', 'role', 'project'),
+        )
+
+
+class OwnedProjectCountManager(models.Manager):
+
+    def get_count(self, user):
+        """
+        @param user (JenkinsUser) the user
+
+        @return (int) the number of projects the user owns
+
+        """
+        return (self.filter(user=user).values_list('count', flat=True).
+                first() or 0)
+
+    def adjust(self, changes):
+        """
+        Add to the number of projects owned by users. This should be called in
+        the transaction that creates, deletes or changes the owner of the
+        projects. Each count is changed with an UPDATE, which locks the row
+        until the transaction ends, so concurrent changes are not lost.
+
+        @param changes (dict) user id mapped to the change in the number of
+            projects they own
+
+        """
+        for user_id, change in changes.items():
+            if change > 0:
+                if self.filter(user_id=user_id).update(
+                        count=F('count') + change):
+                    continue
+                try:
+                    with transaction.atomic():
+                        self.create(user_id=user_id, count=change)
+                except IntegrityError:
+                    # created by a concurrent transaction
+                    self.filter(user_id=user_id).update(
+                        count=F('count') + change)
+            elif change < 0:
+                # a count that is already wrong is left for
+                # check_owned_project_counts to repair
+                self.filter(user_id=user_id, count__gte=-change).update(
+                    count=F('count') + change)
+
+
+class OwnedProjectCount(models.Model):
+    """
+    The number of projects a user owns, maintained by the functions in utils
+    that create and delete projects so that it is read rather than counted.
+    A user without a row owns no projects.
+
+    """
+    user = models.OneToOneField(
+        JenkinsUser, primary_key=True, related_name='owned_project_count',
+        on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+    objects = OwnedProjectCountManager()
 
 
 class RegistrationManager(RegistrationManagerBase):
@@ -177,7 +295,20 @@ class RegistrationManager(RegistrationManagerBase):
                 return profile.user
         return False
 
-    def delete_expired_users(self):
+    def expired(self):
+        """
+        The profiles that were never activated and whose activation key has
+        expired, i.e. the user joined at least ACCOUNT_ACTIVATION_DAYS ago.
+        The same test as ``activation_key_expired`` but done in the
+        database.
+
+        @return (QuerySet) the expired registration profiles
+
+        """
+        return self.filter(activated=False,
+                           user__date_joined__lte=activation_expiry_date())
+
+    def delete_expired_users(self, batch_size=500, progress=None):
         """
         Remove expired instances of ``RegistrationProfile`` and their
         associated ``User``s.
@@ -220,16 +351,40 @@ class RegistrationManager(RegistrationManagerBase):
         does not have an associated ``RegistrationProfile`` will not
         be deleted.
 
+        The profiles are selected in primary key order, batch_size at a time,
+        and each batch of users is deleted by delete_users in its own short
+        transaction, with the same number of queries whatever the size of
+        the batch. Users that own a project are not deleted.
+
+        @param batch_size (int) the number of registrations deleted per
+            transaction
+        @param progress (function) if given, called with the running total
+            after each batch
+
+        @return (int) the number of users deleted
+
         """
-        for profile in self.all():
-            try:
-                if profile.activation_key_expired():
-                    user = profile.user
-                    if not profile.activated:
-                        user.delete()
-                        profile.delete()
-            except UserModel().DoesNotExist:
-                profile.delete()
+        # utils imports this module
+        from jenkins_auth.utils import delete_users
+
+        deleted = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                batch = list(self.expired().filter(pk__gt=last_pk).
+                             order_by('pk').
+                             values_list('pk', 'user')[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+                # deleting the users also deletes their profiles, check the
+                # profile again in case it was activated since the select
+                deleted += delete_users(JenkinsUser.objects.filter(
+                    pk__in=[user_id for _, user_id in batch],
+                    registrationprofile__activated=False))
+            if progress is not None:
+                progress(deleted)
+        return deleted
 
 
 class RegistrationProfile(RegistrationProfileBase):
@@ -243,6 +398,127 @@ class RegistrationProfile(RegistrationProfileBase):
         proxy = True
 
 
+class OutgoingEmailManager(models.Manager):
+
+    def queue(self, subject, body, from_email, recipients):
+        """
+        Add an email to the outbox. If this is called in a transaction the
+        email is only sent if the transaction commits.
+
+        @param recipients (iterable) the email addresses to send to
+
+        @return (OutgoingEmail) the queued email
+
+        """
+        return self.create(subject=subject, body=body, from_email=from_email,
+                           recipients='\n'.join(recipients))
+
+    def queue_messages(self, messages):
+        """
+        Add many emails to the outbox with one insert.
+
+        @param messages (list) EmailMessages
+
+        """
+        self.bulk_create(
+            [OutgoingEmail(subject=message.subject, body=message.body,
+                           from_email=message.from_email,
+                           recipients='\n'.join(message.to))
+             for message in messages])
+
+    def pending(self):
+        """
+        @return (QuerySet) the emails that have not been sent and are due to
+            be tried, oldest first
+
+        """
+        return (self.filter(sent_on__isnull=True, failed=False).
+                filter(send_after__lte=timezone.now()).
+                order_by('send_after', 'pk'))
+
+
+class OutgoingEmail(models.Model):
+    """
+    An email waiting to be sent, or that has been sent.
+
+    Emails are written to this table in the same transaction as the change
+    they are about, rather than sent during the request, and are delivered by
+    the send_queued_emails command.
+
+    """
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    # one address per line
+    recipients = models.TextField()
+    created_on = models.DateTimeField(auto_now_add=True)
+    # the email is not tried again until this time
+    send_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    failed = models.BooleanField(
+        default=False, help_text='Designates that sending has been given up.')
+    sent_on = models.DateTimeField(null=True, blank=True)
+
+    objects = OutgoingEmailManager()
+
+    def recipient_list(self):
+        return [address for address in self.recipients.split('\n')
+                if address]
+
+    class Meta:
+        # the worker looks for unsent emails that are due
+        index_together = (
+            ('sent_on', 'failed', 'send_after'),
+        )
+
+
+class StaffNotification(models.Model):
+    """
+    A user waiting for approval that has not yet been included in a digest
+    email to the staff, see STAFF_DIGEST_INTERVAL.
+
+    Once a digest has been queued the notifications in it are marked with
+    notified_on, the most recent one is kept to know when the last digest
+    was sent.
+
+    """
+    user = models.ForeignKey(JenkinsUser, on_delete=models.CASCADE)
+    created_on = models.DateTimeField(auto_now_add=True)
+    notified_on = models.DateTimeField(null=True, blank=True)
+
+
+class RegistrationPurgeRequest(models.Model):
+    """
+    A purge of the expired registrations asked for by the staff. The purge is
+    run, and the requests deleted, by the purge_expired_registrations command
+    run with --requested.
+
+    """
+    requested_on = models.DateTimeField(auto_now_add=True)
+
+
+class StaleUserDeactivationRequest(models.Model):
+    """
+    A deactivation of the stale users asked for by the staff. It is run, and
+    the requests deleted, by the deactivate_stale_users command run with
+    --requested.
+
+    """
+    requested_on = models.DateTimeField(auto_now_add=True)
+
+
+def activation_expiry_date():
+    """
+    Registrations made on or before this date have expired.
+
+    @return (datetime) now less ACCOUNT_ACTIVATION_DAYS
+
+    """
+    return timezone.now() - datetime.timedelta(
+        days=settings.ACCOUNT_ACTIVATION_DAYS)
+
+
 def validate_shibboleth_username(value):
     """
     Custom username validator.
@@ -0,0 +1,189 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+import datetime
+import logging
+
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Max
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+from jenkins_auth.models import JenkinsUser, OutgoingEmail, StaffNotification
+from jenkins_auth.settings import OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_DELAY, \
+    STAFF_DIGEST_INTERVAL
+from jenkins_auth.utils import get_service_email_address
+
+
+LOGGER = logging.getLogger(__name__)
+
+# A claimed email is not picked up by another worker for this long
+CLAIM_SECONDS = 600
+
+# The number of characters of an error that are kept with the email
+LAST_ERROR_LENGTH = 1000
+
+ACCOUNT_REQUEST_DIGEST_EMAIL = 'jenkins_auth/account_request_digest_email.txt'
+
+
+def send_queued_emails(batch_size=100, connection=None):
+    """
+    Send the emails in the outbox that are due, over one connection to the
+    mail server.
+
+    A batch of emails is claimed, by moving their send_after time forward, so
+    that a second worker does not send them too. An email that cannot be
+    sent is tried again after a delay that doubles with each attempt, after
+    OUTBOX_MAX_ATTEMPTS attempts it is marked as failed.
+
+    @param batch_size (int) the number of emails to claim at a time
+    @param connection (object) the email backend connection, by default the
+        one from EMAIL_BACKEND
+
+    @return (tuple) the number of emails sent and the number that could not
+        be sent
+
+    """
+    if connection is None:
+        connection = get_connection()
+    sent = 0
+    failed = 0
+    # emails that fail in this run are not tried again until the next run
+    started = timezone.now()
+    try:
+        while True:
+            emails = _claim(batch_size, started)
+            if not emails:
+                break
+            for email in emails:
+                try:
+                    # opens the connection if it is not already open
+                    connection.open()
+                    EmailMessage(email.subject, email.body, email.from_email,
+                                 email.recipient_list(),
+                                 connection=connection).send()
+                except Exception as ex:
+                    failed += 1
+                    _retry_later(email, ex)
+                    # the connection may be broken, so it is opened again
+                    # for the next email
+                    _close(connection)
+                else:
+                    sent += 1
+                    # straight away, so that the email is not sent again if
+                    # the worker stops before the end of the batch
+                    OutgoingEmail.objects.filter(pk=email.pk).update(
+                        sent_on=timezone.now())
+    finally:
+        _close(connection)
+    return sent, failed
+
+
+def queue_staff_digest(interval=STAFF_DIGEST_INTERVAL):
+    """
+    Queue one email to the staff listing the users that have asked for an
+    account since the last digest, if at least interval seconds have passed
+    since the last digest. Users that have been approved or rejected in the
+    meantime are left out.
+
+    @param interval (int) the minimum number of seconds between digests
+
+    @return (int) the number of users in the digest, 0 if no digest was
+        queued
+
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # lock the notifications so that two workers do not both send them
+        pending = list(StaffNotification.objects.select_for_update().
+                       filter(notified_on__isnull=True).
+                       values_list('pk', 'user_id'))
+        if not pending:
+            return 0
+        last = StaffNotification.objects.aggregate(
+            last=Max('notified_on'))['last']
+        if last is not None and (
+                now - last < datetime.timedelta(seconds=interval)):
+            return 0
+
+        users = list(JenkinsUser.objects.filter(
+            pk__in=[user_id for pk, user_id in pending], is_active=False).
+            only('username', 'first_name', 'last_name').
+            order_by('date_joined', 'pk'))
+        StaffNotification.objects.filter(
+            pk__in=[pk for pk, user_id in pending]).update(notified_on=now)
+        # only the latest digest is needed for the interval
+        StaffNotification.objects.filter(notified_on__lt=now).delete()
+        if not users:
+            return 0
+
+        site = Site.objects.get_current()
+        message = render_to_string(ACCOUNT_REQUEST_DIGEST_EMAIL,
+                                   {'users': users, 'site': site})
+        subject = 'User accounts require approval ({})'.format(len(users))
+        JenkinsUser.objects.email_staff(
+            subject, message, get_service_email_address(None))
+    return len(users)
+
+
+def _claim(batch_size, started):
+    with transaction.atomic():
+        emails = list(OutgoingEmail.objects.pending().
+                      filter(send_after__lte=started).
+                      select_for_update()[:batch_size])
+        OutgoingEmail.objects.filter(
+            pk__in=[email.pk for email in emails]).update(
+                send_after=timezone.now() +
+                datetime.timedelta(seconds=CLAIM_SECONDS))
+    return emails
+
+
+def _retry_later(email, ex):
+    attempts = email.attempts + 1
+    # not str(ex), the message from the mail server may not be ASCII
+    error = force_text(ex)[:LAST_ERROR_LENGTH]
+    LOGGER.warning('Failed to send email %s, attempt %s: %s',
+                   email.pk, attempts, error)
+    delay = OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    OutgoingEmail.objects.filter(pk=email.pk).update(
+        attempts=attempts,
+        last_error=error,
+        failed=attempts >= OUTBOX_MAX_ATTEMPTS,
+        send_after=timezone.now() + datetime.timedelta(seconds=delay))
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
@@ -0,0 +1,344 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from jenkins_auth.models import JenkinsUser, JenkinsUserProfile, Project
+from jenkins_auth.settings import SEARCH_BACKEND
+
+
+# the fields of a user or project that are searched
+USER_SEARCH_FIELDS = ('username', 'first_name', 'last_name', 'email',
+                      'jenkinsuserprofile__shib_uid')
+PROJECT_SEARCH_FIELDS = ('name', 'description')
+# the fields of a user that are the title of their index entry
+USER_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    @return (SearchBackend) the backend named in the SEARCH_BACKEND setting
+
+    """
+    global _backend
+    if _backend is None:
+        _backend = import_string(SEARCH_BACKEND)()
+    return _backend
+
+
+def search_words(query):
+    """
+    Split a search query into words, dropping any punctuation.
+
+    @param query (str) the text typed into the search box
+
+    @return (list) the words
+
+    """
+    return re.findall(r'\w+', query, re.UNICODE)
+
+
+class SearchBackend(object):
+    """
+    The interface of a search backend.
+
+    A backend that keeps its own index must update it when the index_*
+    and remove_* methods are called. These are called from signals when a
+    single object is saved or deleted, and by the code that bulk inserts
+    users or projects.
+
+    """
+
+    def create_index(self):
+        """
+        Create the index if it does not exist.
+
+        @return (bool) True if the index was created, so is still empty
+
+        """
+        return False
+
+    def rebuild_index(self):
+        """
+        Index all of the users and projects again.
+
+        """
+        pass
+
+    def index_users(self, queryset):
+        """
+        Add or update the users in the index.
+
+        @param queryset (QuerySet) the users to index
+
+        """
+        pass
+
+    def index_projects(self, queryset):
+        """
+        Add or update the projects in the index.
+
+        @param queryset (QuerySet) the projects to index
+
+        """
+        pass
+
+    def remove_user(self, pk):
+        pass
+
+    def remove_users(self, pks):
+        """
+        Remove many users from the index at once.
+
+        @param pks (list) the ids of the users
+
+        """
+        for pk in pks:
+            self.remove_user(pk)
+
+    def remove_project(self, pk):
+        pass
+
+    def search_users(self, query, limit):
+        """
+        @param query (str) the text typed into the search box
+        @param limit (int) the maximum number of results
+
+        @return (list) the ids of the matching users, best match first
+
+        """
+        raise NotImplementedError
+
+    def search_projects(self, query, limit):
+        """
+        @param query (str) the text typed into the search box
+        @param limit (int) the maximum number of results
+
+        @return (list) the ids of the matching projects, best match first
+
+        """
+        raise NotImplementedError
+
+    def filter_users(self, queryset, query, names_only=False):
+        """
+        Restrict a queryset of users to those where every word of the query
+        is the start of a word in one of the searched fields. Unlike
+        search_users the result can be ordered and paged by the database.
+
+        @param queryset (QuerySet) the users to filter
+        @param query (str) the text typed into the search box
+        @param names_only (bool) if True only USER_NAME_FIELDS are searched,
+            not the email or Shibboleth id
+
+        @return (QuerySet) the matching users
+
+        """
+        raise NotImplementedError
+
+
+class SimpleSearchBackend(SearchBackend):
+    """
+    Search with case insensitive substring matches on the columns. This
+    needs no index so works on any database, but every search scans the
+    tables and the results are not ranked.
+
+    """
+
+    def _search(self, queryset, fields, query, order, limit):
+        words = search_words(query)
+        if not words:
+            return []
+        for word in words:
+            condition = Q()
+            for field in fields:
+                condition |= Q(**{field + '__icontains': word})
+            queryset = queryset.filter(condition)
+        return list(queryset.order_by(*order).
+                    values_list('pk', flat=True).distinct()[:limit])
+
+    def search_users(self, query, limit):
+        return self._search(JenkinsUser.objects.all(), USER_SEARCH_FIELDS,
+                            query, ('last_name', 'first_name', 'pk'), limit)
+
+    def search_projects(self, query, limit):
+        return self._search(Project.objects.all(), PROJECT_SEARCH_FIELDS,
+                            query, ('name', 'pk'), limit)
+
+    def filter_users(self, queryset, query, names_only=False):
+        fields = USER_NAME_FIELDS if names_only else USER_SEARCH_FIELDS
+        for word in search_words(query):
+            condition = Q()
+            for field in fields:
+                condition |= Q(**{field + '__istartswith': word})
+            queryset = queryset.filter(condition)
+        return queryset
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    Search using an SQLite FTS5 virtual table.
+
+    Users and projects share one table. The rowid of a user is twice the
+    user id and that of a project is twice the project id plus one, so an
+    entry can be replaced or removed by rowid. Each entry has a title, the
+    names, which is given more weight when ranking than the body.
+
+    """
+    table = 'jenkins_auth_search'
+
+    def create_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND "
+                "name = %s", [self.table])
+            if cursor.fetchone() is not None:
+                return False
+            cursor.execute(
+                "CREATE VIRTUAL TABLE {} USING fts5("
+                "title, body, prefix='2 3')".format(self.table))
+        return True
+
+    def rebuild_index(self):
+        self.create_index()
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(self.table))
+        self.index_users(JenkinsUser.objects.all())
+        self.index_projects(Project.objects.all())
+
+    def _index(self, queryset, offset, select):
+        """
+        Replace the index entries of the objects in the queryset.
+
+        @param offset (int) 0 for users, 1 for projects
+        @param select (str) selects the rowid, title and body of the objects
+            whose id is in the sub query {ids}
+
+        """
+        ids, params = queryset.values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {} WHERE rowid IN '
+                '(SELECT id * 2 + {} FROM ({}))'.format(
+                    self.table, offset, ids), params)
+            cursor.execute(
+                'INSERT INTO {} (rowid, title, body) {}'.format(
+                    self.table, select.format(ids=ids)), params)
+
+    def index_users(self, queryset):
+        self._index(
+            queryset, 0,
+            "SELECT u.id * 2, "
+            "u.first_name || ' ' || u.last_name || ' ' || u.username, "
+            "u.email || ' ' || IFNULL(p.shib_uid, '') "
+            "FROM {user} u LEFT OUTER JOIN {profile} p ON p.user_id = u.id "
+            "WHERE u.id IN ({{ids}})".format(
+                user=JenkinsUser._meta.db_table,
+                profile=JenkinsUserProfile._meta.db_table))
+
+    def index_projects(self, queryset):
+        self._index(
+            queryset, 1,
+            "SELECT id * 2 + 1, name, description FROM {} "
+            "WHERE id IN ({{ids}})".format(Project._meta.db_table))
+
+    def _remove(self, rowid):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {} WHERE rowid = %s'.format(self.table), [rowid])
+
+    def remove_user(self, pk):
+        self._remove(pk * 2)
+
+    def remove_users(self, pks):
+        if not pks:
+            return
+        # the ids are integers, so are written into the query to stay under
+        # the limit on the number of parameters
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {} WHERE rowid IN ({})'.format(
+                self.table, ', '.join(str(int(pk) * 2) for pk in pks)))
+
+    def remove_project(self, pk):
+        self._remove(pk * 2 + 1)
+
+    def _match(self, words, column=None):
+        """
+        @return (str) an FTS5 query in which every word must match the start
+            of a token, in the column if one is given
+
+        """
+        prefix = u'{} : '.format(column) if column else u''
+        return u' '.join(u'{}"{}"*'.format(prefix, word) for word in words)
+
+    def _search(self, query, parity, limit):
+        words = search_words(query)
+        if not words:
+            return []
+        match = self._match(words)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM {0} WHERE {0} MATCH %s AND rowid %% 2 = %s '
+                'ORDER BY bm25({0}, 10.0, 1.0) LIMIT %s'.format(self.table),
+                [match, parity, limit])
+            return [rowid // 2 for rowid, in cursor.fetchall()]
+
+    def search_users(self, query, limit):
+        return self._search(query, 0, limit)
+
+    def search_projects(self, query, limit):
+        return self._search(query, 1, limit)
+
+    def filter_users(self, queryset, query, names_only=False):
+        """
+        The users are looked up by primary key from the rows matched by the
+        prefix indexes of the FTS table, rather than by reading every user.
+
+        """
+        words = search_words(query)
+        if not words:
+            return queryset
+        match = self._match(words, 'title' if names_only else None)
+        meta = queryset.model._meta
+        pk = '{}.{}'.format(connection.ops.quote_name(meta.db_table),
+                            connection.ops.quote_name(meta.pk.column))
+        # joined rather than pk__in so that SQLite reads the matches first
+        # and looks up each user by primary key
+        return queryset.extra(
+            tables=[self.table],
+            where=['{} = {}.rowid / 2'.format(pk, self.table),
+                   '{} MATCH %s'.format(self.table),
+                   '{}.rowid %% 2 = 0'.format(self.table)],
+            params=[match])
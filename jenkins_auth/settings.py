@@ -65,7 +65,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'shibboleth.middleware.ShibbolethRemoteUserMiddleware',
+    'jenkins_auth.middleware.CachedShibbolethRemoteUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,6 +91,17 @@ TEMPLATES = [
     },
 ]
 
+# In production the templates are compiled once per process by the cached
+# loader, all of them when the WSGI application starts, see wsgi.py
+if not DEBUG:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 
 WSGI_APPLICATION = 'jenkins_auth.wsgi.application'
 
@@ -151,9 +162,53 @@ STATICFILES_DIRS = (
 
 AUTHENTICATION_BACKENDS = (
     'shibboleth.backends.ShibbolethRemoteUserBackend',
-    'django.contrib.auth.backends.ModelBackend'
+    'django.contrib.auth.backends.ModelBackend',
+    'jenkins_auth.backends.ProjectPermissionBackend',
 )
 
+# The number of seconds a users project permissions are cached for. The cache
+# is cleared when the users project memberships change, for this to work across processes
+# a shared cache (memcached, database, ...) must be configured in CACHES.
+PROJECT_PERMISSION_CACHE_TIMEOUT = 300
+
+# The number of seconds the user id and profile flags for a persistent-id are
+# cached for by the Shibboleth middleware. The cache is cleared when the user
+# or their profile changes.
+SHIBBOLETH_USER_CACHE_TIMEOUT = 300
+
+# Failed logins, with the login form or basic auth, are counted for each
+# username and each client address over a sliding window of
+# LOGIN_FAILURE_WINDOW seconds. Once a limit is reached further logins are
+# refused without checking the password. The API_USER is only limited by
+# address, so that Jenkins cannot be locked out by others. LocMemFailureTracker
+# keeps the counts in the process, with several processes use
+# CacheFailureTracker and a shared cache in CACHES.
+LOGIN_THROTTLE_BACKEND = 'jenkins_auth.throttle.LocMemFailureTracker'
+LOGIN_FAILURE_LIMIT = 10
+LOGIN_IP_FAILURE_LIMIT = 50
+LOGIN_FAILURE_WINDOW = 300
+# Behind a proxy, e.g. Apache or nginx, every request comes from the address
+# of the proxy, so name the request header in which the proxy passes on the
+# address of the client, e.g. 'HTTP_X_FORWARDED_FOR'. Only set this if every
+# request comes through the proxy, the header can be forged otherwise.
+LOGIN_THROTTLE_IP_HEADER = None
+
+# Sessions are kept in the database by default. For a busy site use
+# 'django.contrib.sessions.backends.cached_db', which reads the sessions
+# through a cache that must be shared by all of the processes, see CACHES, or
+# 'django.contrib.sessions.backends.signed_cookies', which keeps the sessions
+# in the browser, so they cannot be ended from the server. With the database
+# engines run purge_expired_sessions from cron. See local_settings.py.ini.
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+# The backend used by the staff search. SQLiteSearchBackend keeps an FTS5
+# index, on other databases use SimpleSearchBackend or a backend written for
+# the databases own full text search.
+SEARCH_BACKEND = 'jenkins_auth.search.SQLiteSearchBackend'
+
+# The maximum number of users, and of projects, shown by the staff search
+SEARCH_RESULT_LIMIT = 50
+
 # Settings for the Registration app
 # One-week activation window; you may, of course, use a different value.
 ACCOUNT_ACTIVATION_DAYS = 7
@@ -176,6 +231,17 @@ LOCAL_ACCOUNTS = False
 EMAIL_HOST = "localhost"
 EMAIL_PORT = 25
 
+# Emails are queued in the outbox and sent by the send_queued_emails command.
+# A failed email is tried again after OUTBOX_RETRY_DELAY seconds, the delay
+# doubling after each attempt, up to OUTBOX_MAX_ATTEMPTS attempts.
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_RETRY_DELAY = 60
+
+# When this is 0 the staff are emailed each time a user asks for an account.
+# Otherwise the requests are collected and the staff are sent one digest at
+# most every STAFF_DIGEST_INTERVAL seconds, by the send_queued_emails command.
+STAFF_DIGEST_INTERVAL = 0
+
 # this user needs to be created and then is used for API calls
 API_USER = 'jenkins'
 
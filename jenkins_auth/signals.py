@@ -0,0 +1,160 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver, Signal
+
+from jenkins_auth.backends import invalidate_project_permissions
+from jenkins_auth.middleware import invalidate_shib_users
+from jenkins_auth.models import JenkinsUser, JenkinsUserProfile, Project
+from jenkins_auth.search import USER_SEARCH_FIELDS, PROJECT_SEARCH_FIELDS, \
+    get_search_backend
+
+
+# Sent once after the members of a project have been changed.
+# added and removed map each ProjectMembership role to a set of user ids.
+project_members_changed = Signal(providing_args=['project', 'added', 'removed'])
+
+
+@receiver(post_save, sender=JenkinsUser)
+@receiver(post_save, sender=JenkinsUser._meta.concrete_model)
+def user_created(sender, instance, created, **kwargs):
+    """
+    Make sure nothing is cached for a new user.
+
+    """
+    if created:
+        invalidate_project_permissions([instance.pk])
+
+
+@receiver(post_save, sender=JenkinsUser)
+@receiver(post_save, sender=JenkinsUser._meta.concrete_model)
+def user_username_saved(sender, instance, update_fields, **kwargs):
+    """
+    The cached Shibboleth details depend on the username, they are left alone
+    on a login, which only saves last_login.
+
+    """
+    if update_fields is None or 'username' in update_fields:
+        invalidate_shib_users([instance.username])
+
+
+@receiver(post_delete, sender=JenkinsUser)
+@receiver(post_delete, sender=JenkinsUser._meta.concrete_model)
+def user_removed(sender, instance, **kwargs):
+    invalidate_shib_users([instance.username])
+
+
+@receiver(post_save, sender=JenkinsUserProfile)
+@receiver(post_delete, sender=JenkinsUserProfile)
+def shib_profile_changed(sender, instance, **kwargs):
+    """
+    Whether the user is a Shibboleth user depends on the profile.
+
+    """
+    invalidate_shib_users(JenkinsUser.objects.filter(
+        pk=instance.user_id).values_list('username', flat=True))
+
+
+@receiver(project_members_changed)
+def project_members_updated(sender, project, added, removed, **kwargs):
+    """
+    Members have been added to or removed from a project.
+
+    """
+    user_ids = set()
+    for changes in (added, removed):
+        for ids in changes.values():
+            user_ids.update(ids)
+    invalidate_project_permissions(user_ids)
+
+
+def _indexed(update_fields, fields):
+    """
+    @return (bool) True if a save with update_fields may have changed one of
+        the indexed fields
+
+    """
+    return update_fields is None or not update_fields.isdisjoint(fields)
+
+
+@receiver(post_migrate)
+def create_search_index(sender, **kwargs):
+    """
+    Create the search index. A new index, as on the first migrate after an
+    upgrade, is filled from the users and projects that already exist.
+
+    """
+    if sender.name == 'jenkins_auth':
+        backend = get_search_backend()
+        if backend.create_index():
+            backend.rebuild_index()
+
+
+@receiver(post_save, sender=JenkinsUser)
+@receiver(post_save, sender=JenkinsUser._meta.concrete_model)
+def user_saved(sender, instance, update_fields, **kwargs):
+    """
+    Update the search index, unless only other fields were saved, as happens
+    on every login.
+
+    """
+    if _indexed(update_fields, USER_SEARCH_FIELDS):
+        get_search_backend().index_users(
+            JenkinsUser.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=JenkinsUser)
+@receiver(post_delete, sender=JenkinsUser._meta.concrete_model)
+def user_deleted(sender, instance, **kwargs):
+    get_search_backend().remove_user(instance.pk)
+
+
+@receiver(post_save, sender=JenkinsUserProfile)
+@receiver(post_delete, sender=JenkinsUserProfile)
+def user_profile_changed(sender, instance, **kwargs):
+    """
+    The shib_uid of the user is indexed.
+
+    """
+    get_search_backend().index_users(
+        JenkinsUser.objects.filter(pk=instance.user_id))
+
+
+@receiver(post_save, sender=Project)
+def project_saved(sender, instance, update_fields, **kwargs):
+    if _indexed(update_fields, PROJECT_SEARCH_FIELDS):
+        get_search_backend().index_projects(
+            Project.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Project)
+def project_deleted(sender, instance, **kwargs):
+    get_search_backend().remove_project(instance.pk)
@@ -0,0 +1,181 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+import csv
+import datetime
+import json
+
+from django.http import StreamingHttpResponse
+from django.utils import six, timezone
+from django.utils.encoding import force_text
+
+from jenkins_auth.staff.pagination import keyset_filter
+
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# The number of rows read from the database at a time
+EXPORT_BATCH_SIZE = 2000
+
+# Spreadsheets read a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class ExportMixin(object):
+    """
+    Export the rows of a list view as CSV or JSON lines.
+
+    When the GET parameter 'format' is 'csv' or 'jsonl' the whole list, not
+    just the current page, is streamed as a file download. Only the
+    export_columns are read from the database, in batches of
+    EXPORT_BATCH_SIZE rows in keyset order, so memory use does not depend on
+    the number of rows and the first rows are sent straight away.
+
+    """
+    # the field lookups to export, '__' is replaced by '_' in the header
+    export_columns = ('id',)
+    # the start of the file name
+    export_name = 'export'
+
+    def get(self, request, *args, **kwargs):
+        """
+        Overrides method from BaseListView.
+
+        """
+        export_format = request.GET.get('format')
+        if export_format in EXPORT_CONTENT_TYPES:
+            return self.export(export_format)
+        return super(ExportMixin, self).get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super(ExportMixin, self).get_context_data(**kwargs)
+        context['export_formats'] = sorted(EXPORT_CONTENT_TYPES)
+        return context
+
+    def export(self, export_format):
+        """
+        @param export_format (str) 'csv' or 'jsonl'
+
+        @return (StreamingHttpResponse) the rows as a file download
+
+        """
+        rows = export_rows(self.get_queryset(), self.keyset,
+                           self.export_columns)
+        headers = [column.replace('__', '_') for column in self.export_columns]
+        if export_format == 'csv':
+            lines = _csv_lines(headers, rows)
+        else:
+            lines = _jsonl_lines(headers, rows)
+        response = StreamingHttpResponse(
+            lines, content_type=EXPORT_CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = (
+            'attachment; filename="{}-{}.{}"'.format(
+                self.export_name, timezone.now().date().isoformat(),
+                export_format))
+        return response
+
+
+def export_rows(queryset, keyset, columns, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Read the columns of every row of the queryset, ordered by the keyset,
+    batch_size rows at a time.
+
+    @param keyset (tuple) the fields the rows are ordered by, the last one
+        must be unique
+    @param columns (tuple) the field lookups to read
+
+    @return (generator) a tuple of column values for each row
+
+    """
+    lookups = list(columns) + [name for name in keyset if name not in columns]
+    key_index = [lookups.index(name) for name in keyset]
+    after = None
+    while True:
+        batch = queryset
+        if after is not None:
+            batch = batch.filter(keyset_filter(keyset, after, 'gt'))
+        count = 0
+        row = None
+        for row in (batch.order_by(*keyset).values_list(*lookups)
+                    [:batch_size].iterator()):
+            count += 1
+            yield row[:len(columns)]
+        if count < batch_size:
+            return
+        after = [row[i] for i in key_index]
+
+
+def _to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return force_text(value)
+
+
+class _Echo(object):
+    """
+    A file like object that returns what is written to it, so csv.writer can
+    write a row at a time to a StreamingHttpResponse.
+
+    """
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    text = _to_text(value)
+    if isinstance(value, six.string_types) and text.startswith(
+            FORMULA_PREFIXES):
+        # names are entered by the users, quote them so that a spreadsheet
+        # shows them rather than running them
+        text = u"'" + text
+    # the Python 2 csv module only writes bytes
+    return text if six.PY3 else text.encode('utf-8')
+
+
+def _csv_lines(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+def _jsonl_lines(headers, rows):
+    for row in rows:
+        yield json.dumps(
+            dict(zip(headers,
+                     [value if value is None or isinstance(value, (bool, int))
+                      else _to_text(value) for value in row])),
+            sort_keys=True) + '\n'
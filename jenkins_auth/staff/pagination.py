@@ -0,0 +1,154 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage(object):
+    """
+    A page of results from KeysetPaginationMixin.
+
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginationMixin(object):
+    """
+    Keyset (seek) pagination for a ListView.
+
+    Rather than using an offset, the next page is found by filtering on the
+    sort key of the last row of the current page, so any page costs the same
+    as the first. The GET parameters 'after' and 'before' hold the sort key
+    of the row to continue from.
+
+    The keyset is the list of fields the rows are ordered by, it must end with
+    a unique field so that the order is stable.
+
+    """
+    keyset = ('id',)
+    paginate_by = 50
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Overrides method from MultipleObjectMixin.
+
+        """
+        fields = [queryset.model._meta.get_field(name)
+                  for name in self.keyset]
+        after = _decode_cursor(self.request.GET.get('after'), fields)
+        before = _decode_cursor(self.request.GET.get('before'), fields)
+
+        if before is not None:
+            rows = list(queryset.
+                        filter(keyset_filter(self.keyset, before, 'lt')).
+                        order_by(*['-' + name for name in self.keyset])
+                        [:page_size + 1])
+            has_previous = len(rows) > page_size
+            rows = rows[:page_size][::-1]
+            has_next = True
+        else:
+            if after is not None:
+                queryset = queryset.filter(
+                    keyset_filter(self.keyset, after, 'gt'))
+            rows = list(queryset.order_by(*self.keyset)[:page_size + 1])
+            has_next = len(rows) > page_size
+            rows = rows[:page_size]
+            has_previous = after is not None
+
+        page = KeysetPage(rows)
+        if rows and has_next:
+            page.next_cursor = _encode_cursor(rows[-1], fields)
+        if rows and has_previous:
+            page.previous_cursor = _encode_cursor(rows[0], fields)
+        return (None, page, rows, page.has_other_pages())
+
+
+def keyset_filter(keyset, values, lookup):
+    """
+    Build the filter for the rows that sort after (lookup='gt') or before
+    (lookup='lt') the given key.
+    (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+
+    """
+    condition = Q()
+    for i, name in enumerate(keyset):
+        term = Q(**{'{}__{}'.format(name, lookup): values[i]})
+        for previous_name, value in zip(keyset[:i], values[:i]):
+            term &= Q(**{previous_name: value})
+        condition |= term
+    return condition
+
+
+def _encode_cursor(obj, fields):
+    values = [field.value_to_string(obj) for field in fields]
+    return base64.urlsafe_b64encode(
+        json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor, fields):
+    """
+    @return (list) the field values, or None if the cursor is missing or not
+        valid
+
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        return [field.to_python(value)
+                for field, value in zip(fields, values)]
+    except (TypeError, ValueError, ValidationError):
+        return None
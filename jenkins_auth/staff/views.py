@@ -35,18 +35,30 @@ from django.contrib.auth.mixins import LoginRequiredMixin,\
 from django.contrib.messages.views import SuccessMessageMixin
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import BooleanField, Case, Prefetch, Value, When
 from django.http import HttpResponseRedirect
 from django.template.loader import render_to_string
 from django.urls import reverse_lazy
-from django.utils import timezone
-from django.views.generic import DeleteView, ListView, UpdateView, View, DetailView
+from django.views.generic import DeleteView, ListView, UpdateView, View, DetailView, \
+    TemplateView
 from django.views.generic.edit import FormMixin
 
-from jenkins_auth.models import Project
-from jenkins_auth.models import RegistrationProfile
-from jenkins_auth.settings import ACCOUNT_EXPIRATION_DAYS, API_USER, ADMIN_USER
+from jenkins_auth.models import OutgoingEmail, OwnedProjectCount, Project
+from jenkins_auth.models import ProjectMembership
+from jenkins_auth.models import RegistrationProfile, activation_expiry_date
+from jenkins_auth.search import get_search_backend
+from jenkins_auth.settings import ACCOUNT_EXPIRATION_DAYS, API_USER, ADMIN_USER, \
+    SEARCH_RESULT_LIMIT
 from jenkins_auth.staff.forms import EmailMessageForm
-from jenkins_auth.utils import delete_project, logically_delete_user, get_service_email_address
+from jenkins_auth.staff.export import ExportMixin
+from jenkins_auth.staff.pagination import KeysetPaginationMixin
+from jenkins_auth.throttle import METRICS, get_failure_tracker
+from jenkins_auth.utils import delete_project, logically_delete_user, get_service_email_address, \
+    get_member_page, queue_expired_registration_purge, delete_projects, \
+    get_stale_users, queue_stale_user_deactivation, \
+    get_account_counts
 
 
 User = get_user_model()
@@ -78,12 +90,24 @@ USER_TEMPLATE = 'jenkins_auth/staff/account_form.html'
 USER_REJECT_TEMPLATE = 'jenkins_auth/staff/account_confirm_reject.html'
 USER_DELETE_TEMPLATE = 'user/profile_confirm_delete.html'
 
+# the columns shown in the account lists
+USER_LIST_FIELDS = ('username', 'first_name', 'last_name', 'email',
+                    'date_joined', 'last_login')
+
+# the columns of the account and project list exports
+USER_EXPORT_COLUMNS = ('id',) + USER_LIST_FIELDS + ('is_active', 'is_staff')
+PROJECT_EXPORT_COLUMNS = ('id', 'name', 'description', 'owner__username',
+                          'owner__email', 'created_on', 'is_active')
+
 PROJECT_LIST_ACTIVE_TEMPLATE = 'jenkins_auth/staff/project_list_active.html'
 PROJECT_LIST_APPROVAL_TEMPLATE = 'jenkins_auth/staff/project_list_approval.html'
 PROJECT_TEMPLATE = 'jenkins_auth/staff/project_form.html'
 PROJECT_REJECT_TEMPLATE = 'jenkins_auth/staff/project_confirm_reject.html'
 PROJECT_DELETE_TEMPLATE = 'jenkins_auth/project_confirm_delete.html'
 
+SEARCH_TEMPLATE = 'jenkins_auth/staff/search.html'
+LOGIN_THROTTLE_TEMPLATE = 'jenkins_auth/staff/login_throttle.html'
+
 # emails
 ACTIVATION_COMPLETE_EMAIL = 'registration/activation_complete_email.txt'
 PROJECT_APPROVED_EMAIL = 'jenkins_auth/staff/project_approved_email.txt'
@@ -98,13 +122,17 @@ class Staff(LoginRequiredMixin, PermissionRequiredMixin):
         return self.request.user.is_staff
 
 
-class UserList(Staff, ListView):
+class UserList(Staff, ExportMixin, KeysetPaginationMixin, ListView):
     """
     The active users.
 
     """
     model = User
     template_name = USER_LIST_ACTIVE_TEMPLATE
+    keyset = ('last_name', 'id')
+    export_columns = USER_EXPORT_COLUMNS
+    export_name = 'accounts-active'
+    show_projects = True
 
     def get_queryset(self):
         """
@@ -112,13 +140,30 @@ class UserList(Staff, ListView):
         """
         return (User.objects.filter(is_active=True).
                 exclude(username=API_USER).
-                exclude(username=ADMIN_USER).
-                order_by('last_name'))
+                exclude(username=ADMIN_USER))
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Only load the columns that are shown, and fetch the projects owned by
+        the users on the page with one extra query.
+
+        """
+        queryset = queryset.only(*USER_LIST_FIELDS)
+        if self.show_projects:
+            queryset = queryset.prefetch_related(
+                Prefetch('project_owner',
+                         queryset=Project.objects.only('name', 'owner').
+                         order_by('name')))
+        return super(UserList, self).paginate_queryset(queryset, page_size)
 
     def get_context_data(self, **kwargs):
         context = super(UserList, self).get_context_data(**kwargs)
-        context['tabs'] = ACCOUNT_TABS
-        context['show_projects'] = True
+        # add the number of accounts to each tab, e.g. staff_user_stale
+        # gets the 'stale' count
+        counts = get_account_counts()
+        context['tabs'] = [tab + [counts[tab[0][len('staff_user_'):]]]
+                           for tab in ACCOUNT_TABS]
+        context['show_projects'] = self.show_projects
         return context
 
 
@@ -128,19 +173,15 @@ class UserListStale(UserList):
 
     """
     template_name = USER_LIST_STALE_TEMPLATE
+    export_name = 'accounts-stale'
+    keyset = ('last_login', 'id')
 
     def get_queryset(self):
         """
         user is_active = True
         user last_login > ACCOUNT_EXPIRATION_DAYS
         """
-        old_date = timezone.now() - \
-            timezone.timedelta(days=ACCOUNT_EXPIRATION_DAYS)
-        return (User.objects.filter(is_active=True).
-                filter(last_login__lte=old_date).
-                exclude(username=API_USER).
-                exclude(username=ADMIN_USER).
-                order_by('last_login'))
+        return get_stale_users()
 
 
 class UserListDeleted(UserList):
@@ -149,6 +190,8 @@ class UserListDeleted(UserList):
 
     """
     template_name = USER_LIST_DELETED_TEMPLATE
+    export_name = 'accounts-deleted'
+    show_projects = False
 
     def get_queryset(self):
         """
@@ -156,12 +199,7 @@ class UserListDeleted(UserList):
         user registration profile = null
         """
         return User.objects.filter(is_active=False).filter(
-            registrationprofile__isnull=True).order_by('last_name')
-
-    def get_context_data(self, **kwargs):
-        context = super(UserListDeleted, self).get_context_data(**kwargs)
-        context['show_projects'] = False
-        return context
+            registrationprofile__isnull=True)
 
 
 class UserListRegistration(UserList):
@@ -170,18 +208,21 @@ class UserListRegistration(UserList):
 
     """
     template_name = USER_LIST_REGISTRATION_TEMPLATE
+    export_name = 'accounts-registration'
+    keyset = ('date_joined', 'id')
+    show_projects = False
 
     def get_queryset(self):
         """
         registration profile activated = False
 
         """
-        profiles = RegistrationProfile.objects.filter(
-            activated=False).order_by('user__date_joined')
-        users = []
-        for reg_prof in profiles:
-            users.append(reg_prof.user)
-        return users
+        return (User.objects.filter(registrationprofile__activated=False).
+                annotate(expired=Case(
+                    When(date_joined__lte=activation_expiry_date(),
+                         then=Value(True)),
+                    default=Value(False),
+                    output_field=BooleanField())))
 
     def get_context_data(self, **kwargs):
         """
@@ -189,12 +230,7 @@ class UserListRegistration(UserList):
 
         """
         context = super(UserListRegistration, self).get_context_data(**kwargs)
-        expired_registration = False
-        profiles = RegistrationProfile.objects.filter(activated=False)
-        for profile in profiles:
-            if profile.activation_key_expired():
-                expired_registration = True
-        context['show_delete'] = expired_registration
+        context['show_delete'] = RegistrationProfile.objects.expired().exists()
         return context
 
 
@@ -204,22 +240,20 @@ class UserListApproval(UserList):
 
     """
     template_name = USER_LIST_APPROVAL_TEMPLATE
+    export_name = 'accounts-approval'
+    keyset = ('date_joined', 'id')
+    show_projects = False
 
     def get_queryset(self):
         """
         user registration profile activated = True
         user is_active = False
         """
-        profiles = RegistrationProfile.objects.filter(
-            activated=True).filter(user__is_active=False).order_by('user__last_login')
-        users = []
-        for reg_prof in profiles:
-            users.append(reg_prof.user)
-        return users
+        return pending_users()
 
     def get_context_data(self, **kwargs):
         context = super(UserListApproval, self).get_context_data(**kwargs)
-        context['show_projects'] = False
+        context['bulk_action_url'] = reverse_lazy('staff_user_bulk')
         context['waiting_approval'] = True
         return context
 
@@ -229,6 +263,7 @@ class UserListStaff(UserList):
     The users that are staff.
     """
     template_name = USER_LIST_STAFF_TEMPLATE
+    export_name = 'accounts-staff'
 
     def get_queryset(self):
         """
@@ -238,8 +273,7 @@ class UserListStaff(UserList):
         return (User.objects.filter(is_active=True).
                 filter(is_staff=True).
                 exclude(username=API_USER).
-                exclude(username=ADMIN_USER).
-                order_by('last_name'))
+                exclude(username=ADMIN_USER))
 
 
 class UserDetail(Staff, DetailView):
@@ -253,11 +287,10 @@ class UserDetail(Staff, DetailView):
     def get_context_data(self, **kwargs):
         context = super(UserDetail, self).get_context_data(**kwargs)
         user = self.get_object()
-        users_groups = user.groups.all()
-        project_admin_list = Project.objects.filter(admins__in=users_groups)
-        context['project_admin_list'] = project_admin_list
-        project_user_list = Project.objects.filter(users__in=users_groups)
-        context['project_user_list'] = project_user_list
+        context['project_admin_list'] = Project.objects.with_member(
+            user, ProjectMembership.ADMIN)
+        context['project_user_list'] = Project.objects.with_member(
+            user, ProjectMembership.USER)
 
         if user.is_active:
             context['status'] = 'active'
@@ -285,10 +318,11 @@ class UserApprove(Staff, UpdateView):
     template_name = USER_TEMPLATE
     success_url = reverse_lazy('staff_user_approval')
 
+    @transaction.atomic
     def form_valid(self, form):
         form.instance.is_active = True
         form.instance.save()
-        # email user
+        # queue the email to the user in the same transaction
         user = self.get_object()
         context = super(UserApprove, self).get_context_data()
         context.update({
@@ -298,11 +332,11 @@ class UserApprove(Staff, UpdateView):
         message = render_to_string(ACTIVATION_COMPLETE_EMAIL, context)
         subject = 'Account creation on {site_name} approved'.format(
             site_name=get_current_site(self.request).name)
-        user.email_user(
+        OutgoingEmail.objects.queue(
             subject,
             message,
-            get_service_email_address(
-                self.request))
+            get_service_email_address(self.request),
+            [user.email])
 
         return super(UserApprove, self).form_valid(form)
 
@@ -327,7 +361,7 @@ class UserDelete(Staff, DeleteView):
         user = self.get_object()
 
         # We cannot delete a user if they still own projects
-        project_count = Project.objects.filter(owner=user).count()
+        project_count = OwnedProjectCount.objects.get_count(user)
         if project_count > 0:
             messages.error(request, 'Account cannot be deleted as they own {} projects'.format(
                 project_count))
@@ -359,8 +393,8 @@ class UserReject(Staff, FormMixin, DeleteView):
     def get_context_data(self, **kwargs):
         context = super(UserReject, self).get_context_data(**kwargs)
         user = self.get_object()
-        message = "Dear {user}, \nUnfortunately your request for the creation of an account for {username} has been declined.\n\nSincerely,\n{signed}".format(
-            user=user.get_full_name(), username=user.username, signed=get_current_site(self.request).name)
+        message = _user_rejected_message(
+            user, get_current_site(self.request))
         data = {'message': message}
         context['form'] = EmailMessageForm(data)
         return context
@@ -377,18 +411,18 @@ class UserReject(Staff, FormMixin, DeleteView):
         if not form.is_valid():
             return form.form_invalid()
 
-        # email user
+        # queue the email to the user in the same transaction as the delete
         staff_message = form.cleaned_data['message']
         subject = 'Account creation on {site_name} rejected'.format(
             site_name=get_current_site(self.request).name)
-        user.email_user(
-            subject,
-            staff_message,
-            get_service_email_address(
-                self.request))
-
-        logically_delete_user(user)
-        user.delete()
+        with transaction.atomic():
+            OutgoingEmail.objects.queue(
+                subject,
+                staff_message,
+                get_service_email_address(self.request),
+                [user.email])
+            logically_delete_user(user)
+            user.delete()
 
         # There is no SuccessMessageMixin on the DeleteView, so set the message
         # here
@@ -396,39 +430,77 @@ class UserReject(Staff, FormMixin, DeleteView):
         return HttpResponseRedirect(self.success_url)
 
 
+class UserDeactivateStale(Staff, View):
+    """
+    Logically delete all of the stale users, except for project owners. The
+    deactivation is queued for the deactivate_stale_users command.
+
+    """
+    success_url = reverse_lazy('staff_user_stale')
+    success_message = ("Stale accounts, except for project owners, will be "
+                       "deactivated shortly")
+
+    def post(self, request, *args, **kwargs):
+        queue_stale_user_deactivation()
+        messages.success(request, self.success_message)
+        return HttpResponseRedirect(self.success_url)
+
+
 class UserDeleteExpiredRegistrations(Staff, View):
     """
-    Delete expired user registrations from the database.
+    Delete expired user registrations from the database. The deletion is
+    queued for the purge_expired_registrations command.
 
     """
     success_url = reverse_lazy('staff_user_registration')
-    success_message = "Expired user registrations deleted"
+    success_message = "Expired user registrations will be deleted shortly"
 
     def post(self, request, *args, **kwargs):
-        RegistrationProfile.objects.delete_expired_users()
+        queue_expired_registration_purge()
         messages.success(request, self.success_message)
         return HttpResponseRedirect(self.success_url)
 
 
-class ProjectList(Staff, ListView):
+class ProjectList(Staff, ExportMixin, KeysetPaginationMixin, ListView):
     model = Project
     template_name = PROJECT_LIST_ACTIVE_TEMPLATE
+    keyset = ('name', 'id')
+    export_columns = PROJECT_EXPORT_COLUMNS
+    export_name = 'projects-active'
 
     def get_queryset(self):
         """
         Return the projects that are active.
         """
-        return Project.objects.filter(is_active=True).order_by('name')
+        return Project.objects.filter(is_active=True)
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Only load the columns that are shown, with the owner in the same
+        query.
+
+        """
+        queryset = (queryset.select_related('owner').
+                    only('name', 'created_on', 'owner__id',
+                         'owner__first_name', 'owner__last_name'))
+        return super(ProjectList, self).paginate_queryset(queryset, page_size)
 
 
 class ProjectListApproval(ProjectList):
     template_name = PROJECT_LIST_APPROVAL_TEMPLATE
+    export_name = 'projects-approval'
+    keyset = ('created_on', 'id')
 
     def get_queryset(self):
         """
         Return the new projects that are waiting for staff approval.
         """
-        return Project.objects.filter(is_active=False).order_by('created_on')
+        return Project.objects.filter(is_active=False)
+
+    def get_context_data(self, **kwargs):
+        context = super(ProjectListApproval, self).get_context_data(**kwargs)
+        context['bulk_action_url'] = reverse_lazy('staff_project_bulk')
+        return context
 
 
 class ProjectDetail(Staff, SuccessMessageMixin, DetailView):
@@ -443,6 +515,12 @@ class ProjectDetail(Staff, SuccessMessageMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super(ProjectDetail, self).get_context_data(**kwargs)
         context['is_staff_interface'] = True
+        context['admin_page'] = get_member_page(
+            self.request, self.object.pk, ProjectMembership.ADMIN,
+            'admins_page')
+        context['user_page'] = get_member_page(
+            self.request, self.object.pk, ProjectMembership.USER,
+            'users_page')
         return context
 
 
@@ -457,11 +535,12 @@ class ProjectApprove(Staff, SuccessMessageMixin, UpdateView):
     success_url = reverse_lazy('staff_project_approval')
     success_message = "Project application was successfully approved"
 
+    @transaction.atomic
     def form_valid(self, form):
         form.instance.is_active = True
         form.instance.save()
 
-        # email project owner
+        # queue the email to the project owner in the same transaction
         project = self.get_object()
         context = super(ProjectApprove, self).get_context_data()
         context.update({
@@ -471,11 +550,11 @@ class ProjectApprove(Staff, SuccessMessageMixin, UpdateView):
         message = render_to_string(PROJECT_APPROVED_EMAIL, context)
         subject = 'Project application for "{project}" approved'.format(
             project=project.name)
-        project.owner.email_user(
+        OutgoingEmail.objects.queue(
             subject,
             message,
-            get_service_email_address(
-                self.request))
+            get_service_email_address(self.request),
+            [project.owner.email])
 
         return super(ProjectApprove, self).form_valid(form)
 
@@ -496,8 +575,8 @@ class ProjectReject(Staff, FormMixin, DeleteView):
     def get_context_data(self, **kwargs):
         context = super(ProjectReject, self).get_context_data(**kwargs)
         project = self.get_object()
-        message = "Dear {user}, \nUnfortunately your request for the creation of the project {project} has been declined.\n\nSincerely,\n{signed}".format(
-            user=project.owner.get_full_name(), project=project.name, signed=get_current_site(self.request).name)
+        message = _project_rejected_message(
+            project, get_current_site(self.request))
         data = {'message': message}
         context['form'] = EmailMessageForm(data)
         return context
@@ -511,18 +590,19 @@ class ProjectReject(Staff, FormMixin, DeleteView):
         if not form.is_valid():
             return form.form_invalid()
 
-        # email project owner
+        # queue the email to the project owner in the same transaction as
+        # the delete
         staff_message = form.cleaned_data['message']
         project = self.get_object()
         subject = 'Project application for "{project}" rejected'.format(
             project=project.name)
-        project.owner.email_user(
-            subject,
-            staff_message,
-            get_service_email_address(
-                self.request))
-
-        delete_project(self.get_object())
+        with transaction.atomic():
+            OutgoingEmail.objects.queue(
+                subject,
+                staff_message,
+                get_service_email_address(self.request),
+                [project.owner.email])
+            delete_project(project)
 
         # There is no SuccessMessageMixin on the DeleteView, so set the message
         # here
@@ -552,3 +632,197 @@ class ProjectDelete(Staff, DeleteView):
         # here
         messages.success(self.request, self.success_message)
         return HttpResponseRedirect(self.success_url)
+
+
+class BulkAction(Staff, View):
+    """
+    Approve or reject the objects selected in a list.
+
+    The POST parameter 'action' is 'approve' or 'reject' and 'ids' holds the
+    ids of the selected objects. The objects are changed and the notification
+    emails are queued in one transaction.
+
+    Sub classes implement approve and reject.
+
+    """
+    success_url = None
+    # formatted with the number of objects and the action
+    success_message = '{count} {action}'
+
+    def post(self, request, *args, **kwargs):
+        action = request.POST.get('action')
+        ids = [int(pk) for pk in request.POST.getlist('ids') if pk.isdigit()]
+        if action not in ('approve', 'reject') or not ids:
+            messages.error(request, 'Select at least one row and an action')
+            return HttpResponseRedirect(self.success_url)
+
+        site = get_current_site(request)
+        from_email = get_service_email_address(request)
+        with transaction.atomic():
+            emails = getattr(self, action)(ids, site, from_email)
+            OutgoingEmail.objects.queue_messages(emails)
+
+        messages.success(request, self.success_message.format(
+            count=len(emails),
+            action='approved' if action == 'approve' else 'rejected'))
+        return HttpResponseRedirect(self.success_url)
+
+    def approve(self, ids, site, from_email):
+        """
+        @param ids (list) the ids of the selected objects
+        @param site (Site) the current site
+        @param from_email (str) the address the emails are sent from
+
+        @return (list) an EmailMessage for each object that was approved
+
+        """
+        raise NotImplementedError
+
+    def reject(self, ids, site, from_email):
+        """
+        @param ids (list) the ids of the selected objects
+        @param site (Site) the current site
+        @param from_email (str) the address the emails are sent from
+
+        @return (list) an EmailMessage for each object that was rejected
+
+        """
+        raise NotImplementedError
+
+
+class UserBulkAction(BulkAction):
+    """
+    Approve or reject users that are waiting for approval.
+
+    """
+    success_url = reverse_lazy('staff_user_approval')
+    success_message = '{count} account applications {action}'
+
+    def _selected(self, ids):
+        return list(pending_users().filter(pk__in=ids).select_for_update().
+                    only('username', 'first_name', 'last_name', 'email'))
+
+    def approve(self, ids, site, from_email):
+        users = self._selected(ids)
+        User.objects.filter(pk__in=[user.pk for user in users]).update(
+            is_active=True)
+        subject = 'Account creation on {site_name} approved'.format(
+            site_name=site.name)
+        return [EmailMessage(subject,
+                             render_to_string(ACTIVATION_COMPLETE_EMAIL,
+                                              {'user': user, 'site': site}),
+                             from_email, [user.email])
+                for user in users]
+
+    def reject(self, ids, site, from_email):
+        users = self._selected(ids)
+        # deleting the users also deletes their profiles and memberships
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        subject = 'Account creation on {site_name} rejected'.format(
+            site_name=site.name)
+        return [EmailMessage(subject, _user_rejected_message(user, site),
+                             from_email, [user.email])
+                for user in users]
+
+
+class ProjectBulkAction(BulkAction):
+    """
+    Approve or reject projects that are waiting for approval.
+
+    """
+    success_url = reverse_lazy('staff_project_approval')
+    success_message = '{count} project applications {action}'
+
+    def _selected(self, ids):
+        return list(Project.objects.filter(pk__in=ids, is_active=False).
+                    select_related('owner').select_for_update())
+
+    def approve(self, ids, site, from_email):
+        projects = self._selected(ids)
+        Project.objects.filter(
+            pk__in=[project.pk for project in projects]).update(
+                is_active=True)
+        return [EmailMessage(
+            'Project application for "{project}" approved'.format(
+                project=project.name),
+            render_to_string(PROJECT_APPROVED_EMAIL,
+                             {'project': project, 'site': site}),
+            from_email, [project.owner.email])
+            for project in projects]
+
+    def reject(self, ids, site, from_email):
+        projects = self._selected(ids)
+        delete_projects([project.pk for project in projects])
+        return [EmailMessage(
+            'Project application for "{project}" rejected'.format(
+                project=project.name),
+            _project_rejected_message(project, site),
+            from_email, [project.owner.email])
+            for project in projects]
+
+
+def pending_users():
+    """
+    @return (QuerySet) the users that have confirmed their email and are
+        waiting for staff approval
+
+    """
+    return (User.objects.filter(registrationprofile__activated=True).
+            filter(is_active=False))
+
+
+def _user_rejected_message(user, site):
+    return "Dear {user}, \nUnfortunately your request for the creation of an account for {username} has been declined.\n\nSincerely,\n{signed}".format(
+        user=user.get_full_name(), username=user.username, signed=site.name)
+
+
+def _project_rejected_message(project, site):
+    return "Dear {user}, \nUnfortunately your request for the creation of the project {project} has been declined.\n\nSincerely,\n{signed}".format(
+        user=project.owner.get_full_name(), project=project.name, signed=site.name)
+
+
+class Search(Staff, TemplateView):
+    """
+    Search for users and projects, the best matches are listed first.
+
+    """
+    template_name = SEARCH_TEMPLATE
+
+    def get_context_data(self, **kwargs):
+        context = super(Search, self).get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        context['query'] = query
+        if query:
+            backend = get_search_backend()
+            context['users'] = _in_order(
+                User.objects.only(*USER_LIST_FIELDS),
+                backend.search_users(query, SEARCH_RESULT_LIMIT))
+            context['projects'] = _in_order(
+                Project.objects.select_related('owner'),
+                backend.search_projects(query, SEARCH_RESULT_LIMIT))
+        return context
+
+
+class LoginThrottle(Staff, TemplateView):
+    """
+    Show the counts kept by the login throttle. With LocMemFailureTracker
+    these are the counts of the process that serves the page.
+
+    """
+    template_name = LOGIN_THROTTLE_TEMPLATE
+
+    def get_context_data(self, **kwargs):
+        context = super(LoginThrottle, self).get_context_data(**kwargs)
+        tracker = get_failure_tracker()
+        metrics = tracker.metrics()
+        context['metrics'] = [(metric, metrics[metric]) for metric in METRICS]
+        context['backend'] = type(tracker).__name__
+        return context
+
+
+def _in_order(queryset, ids):
+    """
+    @return (list) the objects with the given ids, in the same order
+    """
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
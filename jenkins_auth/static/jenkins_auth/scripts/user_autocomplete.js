@@ -0,0 +1,92 @@
+/**
+ * Search for users to add to a <select multiple data-autocomplete-url="...">.
+ *
+ * The select only contains the users that have been chosen. Typing in the
+ * search box fetches matching users from the server a page at a time,
+ * clicking on a match adds it to the select. Double clicking on a user in the
+ * select removes them.
+ */
+(function($) {
+	'use strict';
+
+	var DELAY = 250;
+
+	function init(select) {
+		var $select = $(select);
+		var url = $select.data('autocomplete-url');
+		var $input = $('<input type="text" class="form-control user-autocomplete-input"'
+				+ ' placeholder="Search by name, username or email" />');
+		var $results = $('<ul class="list-group user-autocomplete-results"></ul>');
+		var term = '';
+		var page = 1;
+		var timer = null;
+
+		$select.before($input).before($results);
+
+		function addUser(user) {
+			var $option = $select.find('option').filter(function() {
+				return this.value === String(user.id);
+			});
+			if ($option.length === 0) {
+				$option = $('<option></option>').val(user.id).text(user.text);
+				$select.append($option);
+			}
+			$option.prop('selected', true);
+		}
+
+		function search(append) {
+			$.getJSON(url, {q: term, page: page}, function(data) {
+				if (!append) {
+					$results.empty();
+				}
+				$results.find('.user-autocomplete-more').remove();
+				$.each(data.results, function(i, user) {
+					$('<li class="list-group-item"></li>').text(user.text)
+						.data('user', user).appendTo($results);
+				});
+				if (data.more) {
+					$('<li class="list-group-item user-autocomplete-more">More...</li>')
+						.appendTo($results);
+				}
+			});
+		}
+
+		$input.on('input', function() {
+			clearTimeout(timer);
+			timer = setTimeout(function() {
+				term = $.trim($input.val());
+				page = 1;
+				if (term) {
+					search(false);
+				} else {
+					$results.empty();
+				}
+			}, DELAY);
+		});
+
+		$results.on('click', 'li', function() {
+			var $item = $(this);
+			if ($item.hasClass('user-autocomplete-more')) {
+				page += 1;
+				search(true);
+			} else {
+				addUser($item.data('user'));
+			}
+		});
+
+		$select.on('dblclick', 'option', function() {
+			$(this).remove();
+		});
+
+		// everything in the select is a member, so submit all of them
+		$select.closest('form').on('submit', function() {
+			$select.find('option').prop('selected', true);
+		});
+	}
+
+	$(function() {
+		$('select[data-autocomplete-url]').each(function() {
+			init(this);
+		});
+	});
+})(jQuery);
@@ -54,3 +54,23 @@ def form_as_bootstrap(form, label_col='col-sm-2', data_col='col-sm-10'):
 
     """
     return {'bs_form': form, 'label_col': label_col, 'data_col': data_col}
+
+
+@register.simple_tag
+def user_role(user):
+    """
+    The role of a user, used to key cached fragments that only depend on
+    what the user is allowed to see.
+
+    @param user (User) the user
+
+    @return (str) 'anonymous', 'user', or the users staff and superuser
+        flags, e.g. 'staff-superuser'
+
+    """
+    if not user.is_authenticated:
+        return 'anonymous'
+    roles = [role for role, flag in (('staff', user.is_staff),
+                                     ('superuser', user.is_superuser))
+             if flag]
+    return '-'.join(roles) or 'user'
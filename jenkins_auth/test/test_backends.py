@@ -0,0 +1,106 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+
+import django
+django.setup()
+
+from django.test import TestCase
+
+from jenkins_auth.backends import ProjectPermissionBackend
+from jenkins_auth.models import JenkinsUser, Project, ProjectMembership
+from jenkins_auth.utils import set_project_members
+
+
+class ProjectPermissionBackendTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = JenkinsUser.objects.create(username="owner")
+        self.admin = JenkinsUser.objects.create(username="admin_1")
+        self.user = JenkinsUser.objects.create(username="user_1")
+        self.other = JenkinsUser.objects.create(username="other")
+        self.project = Project.objects.create(
+            name="project A",
+            owner=self.owner)
+        ProjectMembership.objects.create(
+            project=self.project, user=self.admin,
+            role=ProjectMembership.ADMIN)
+        ProjectMembership.objects.create(
+            project=self.project, user=self.user,
+            role=ProjectMembership.USER)
+        self.backend = ProjectPermissionBackend()
+
+    def test_owner(self):
+        """The owner has all project permissions"""
+        for perm in ['read_project', 'change_project', 'delete_project']:
+            self.assertTrue(self.backend.has_perm(
+                self.owner, 'jenkins_auth.' + perm, self.project))
+
+    def test_admin(self):
+        self.assertTrue(self.backend.has_perm(
+            self.admin, 'jenkins_auth.read_project', self.project))
+        self.assertTrue(self.backend.has_perm(
+            self.admin, 'jenkins_auth.change_project', self.project))
+
+    def test_user(self):
+        self.assertTrue(self.backend.has_perm(
+            self.user, 'jenkins_auth.read_project', self.project))
+        self.assertFalse(self.backend.has_perm(
+            self.user, 'jenkins_auth.change_project', self.project))
+
+    def test_other(self):
+        self.assertFalse(self.backend.has_perm(
+            self.other, 'jenkins_auth.read_project', self.project))
+
+    def test_no_object(self):
+        self.assertFalse(self.backend.has_perm(
+            self.owner, 'jenkins_auth.read_project'))
+
+    def test_per_request_cache(self):
+        """The permissions are only queried once per user object"""
+        self.backend.has_perm(
+            self.user, 'jenkins_auth.read_project', self.project)
+        with self.assertNumQueries(0):
+            self.backend.has_perm(
+                self.user, 'jenkins_auth.change_project', self.project)
+
+    def test_cache_invalidated(self):
+        """Changing the project members clears the cached permissions"""
+        user = JenkinsUser.objects.get(username="user_1")
+        self.assertTrue(self.backend.has_perm(
+            user, 'jenkins_auth.read_project', self.project))
+        set_project_members(self.project, [self.admin.pk], [])
+        user = JenkinsUser.objects.get(username="user_1")
+        self.assertFalse(self.backend.has_perm(
+            user, 'jenkins_auth.read_project', self.project))
+        set_project_members(self.project, [self.admin.pk, user.pk], [])
+        user = JenkinsUser.objects.get(username="user_1")
+        self.assertTrue(self.backend.has_perm(
+            user, 'jenkins_auth.change_project', self.project))
@@ -0,0 +1,442 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+
+import copy
+import datetime
+import io
+import os
+import shutil
+import tempfile
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.contrib.auth.models import Group
+from django.contrib.sessions.models import Session
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from jenkins_auth.models import JenkinsUser, JenkinsUserProfile, Project, RegistrationProfile
+from jenkins_auth.models import OwnedProjectCount, ProjectMembership, \
+    RegistrationPurgeRequest, StaffNotification, \
+    StaleUserDeactivationRequest, activation_expiry_date
+from jenkins_auth.search import get_search_backend
+from jenkins_auth.utils import create_project, delete_expired_sessions
+
+
+class CreateProjectsTestCase(TestCase):
+
+    def setUp(self):
+        JenkinsUser.objects.create(username="owner")
+
+    def test_create_projects(self):
+        out = StringIO()
+        call_command('create_projects', 'owner', 'named',
+                     count=3, prefix='course', stdout=out)
+        self.assertEqual(
+            set(Project.objects.values_list('name', flat=True)),
+            {'named', 'course 1', 'course 2', 'course 3'})
+        self.assertTrue('Created 4 projects' in out.getvalue())
+
+    def test_unknown_owner(self):
+        self.assertRaises(
+            CommandError, call_command, 'create_projects', 'nobody', 'p')
+
+
+class ImportProjectsTestCase(TestCase):
+    CSV = (
+        u'project,role,username,description\n'
+        u'course 1,owner,owner,The first course\n'
+        u'course 1,admin,user_1,\n'
+        u'course 1,user,user_2,\n'
+        u'course 1,user,user_2,\n'
+        u'course 2,owner,user_1,\n'
+        u'course 2,user,nobody,\n'
+        u'course 3,user,user_2,\n'
+        u'course 3,teacher,user_2,\n'
+        u'cours de Jos\xe9,owner,jos\xe9,Le cours de Jos\xe9\n'
+        u'course 1,user,jos\xe9,\n')
+    JSONL = (
+        u'{"project": "course 1", "role": "owner", "username": "owner"}\n'
+        u'\n'
+        u'{"project": "course 1", "role": "user", "username": "user_1"}\n')
+
+    def setUp(self):
+        JenkinsUser.objects.create(username="owner")
+        JenkinsUser.objects.create(username="user_1")
+        JenkinsUser.objects.create(username="user_2")
+        JenkinsUser.objects.create(username=u"jos\xe9")
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with io.open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        return path
+
+    def test_import_csv(self):
+        out = StringIO()
+        call_command('import_projects', self._write('p.csv', self.CSV),
+                     batch_size=3, stdout=out)
+        project = Project.objects.get(name='course 1')
+        self.assertEqual(project.description, 'The first course')
+        self.assertEqual(
+            set(project.get_members(ProjectMembership.ADMIN).
+                values_list('username', flat=True)),
+            {'owner', 'user_1'})
+        self.assertEqual(
+            set(project.get_members(ProjectMembership.USER).
+                values_list('username', flat=True)),
+            {'user_2', u'jos\xe9'})
+        self.assertEqual(
+            Project.objects.get(name='course 2').owner.username, 'user_1')
+        project = Project.objects.get(name=u'cours de Jos\xe9')
+        self.assertEqual(project.owner.username, u'jos\xe9')
+        self.assertEqual(project.description, u'Le cours de Jos\xe9')
+        output = out.getvalue()
+        self.assertTrue('Read 10 rows' in output)
+        self.assertTrue('projects created: 3' in output)
+        self.assertTrue('members added: 3' in output)
+        self.assertTrue('members already present: 1' in output)
+        self.assertTrue('unknown users: 1' in output)
+        self.assertTrue('unknown projects: 1' in output)
+        self.assertTrue('invalid rows: 1' in output)
+
+    def test_import_jsonl(self):
+        call_command('import_projects', self._write('p.jsonl', self.JSONL),
+                     stdout=StringIO())
+        project = Project.objects.get(name='course 1')
+        self.assertEqual(
+            list(project.get_members(ProjectMembership.USER).
+                 values_list('username', flat=True)),
+            ['user_1'])
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('import_projects', self._write('p.csv', self.CSV),
+                     dry_run=True, stdout=out)
+        self.assertTrue('projects created: 3' in out.getvalue())
+        self.assertEqual(Project.objects.count(), 0)
+        self.assertEqual(ProjectMembership.objects.count(), 0)
+
+
+class ImportShibbolethUsersTestCase(TestCase):
+    CSV = (
+        u'persistent_id,first_name,last_name,email\n'
+        u'shib-1,Ann,Smith,ann@example.org\n'
+        u'shib-2,Bob,Jones,bob@example.org\n'
+        u'shib-2,Bob,Jones,bob@example.org\n'
+        u'existing,Cat,Brown,cat@example.org\n'
+        u',No,Id,\n'
+        u'shib-3,Jos\xe9,Mu\xf1oz,jose@example.org\n')
+
+    def setUp(self):
+        JenkinsUser.objects.create(username="existing", first_name="Old")
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'users.csv')
+        with io.open(self.path, 'w', encoding='utf-8') as stream:
+            stream.write(self.CSV)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_import(self):
+        out = StringIO()
+        call_command('import_shibboleth_users', self.path, stdout=out)
+        user = JenkinsUser.objects.get(username='shib-1')
+        self.assertEqual(user.get_full_name(), 'Ann Smith')
+        self.assertEqual(user.email, 'ann@example.org')
+        self.assertTrue(user.is_active)
+        self.assertFalse(user.has_usable_password())
+        self.assertTrue(user.jenkinsuserprofile.is_shib_user())
+        self.assertTrue(
+            RegistrationProfile.objects.get(user=user).activated)
+        self.assertEqual(
+            JenkinsUser.objects.get(username='existing').first_name, 'Old')
+        self.assertEqual(
+            JenkinsUser.objects.get(username='shib-3').get_full_name(),
+            u'Jos\xe9 Mu\xf1oz')
+        self.assertEqual(JenkinsUserProfile.objects.count(), 3)
+        output = out.getvalue()
+        self.assertTrue('users created: 3' in output)
+        self.assertTrue('users already exist: 1' in output)
+        self.assertTrue('duplicate rows: 1' in output)
+        self.assertTrue('invalid rows: 1' in output)
+
+    def test_import_inactive(self):
+        call_command('import_shibboleth_users', self.path, inactive=True,
+                     stdout=StringIO())
+        self.assertFalse(JenkinsUser.objects.get(username='shib-1').is_active)
+
+
+class PurgeExpiredRegistrationsTestCase(TestCase):
+
+    def setUp(self):
+        date_joined = timezone.now() - datetime.timedelta(
+            days=settings.ACCOUNT_ACTIVATION_DAYS + 1)
+        for i in range(5):
+            user = JenkinsUser.objects.create(
+                username='expired_{}'.format(i), date_joined=date_joined)
+            RegistrationProfile.objects.create(user=user)
+        # activated, so kept however old it is
+        user = JenkinsUser.objects.create(
+            username='activated', date_joined=date_joined)
+        RegistrationProfile.objects.create(user=user, activated=True)
+        user = JenkinsUser.objects.create(username='new')
+        RegistrationProfile.objects.create(user=user)
+        self.project = Project(name='project', owner=user)
+        create_project(self.project)
+        self.group = Group.objects.create(name='group')
+
+    def test_purge(self):
+        out = StringIO()
+        call_command('purge_expired_registrations', batch_size=2,
+                     verbosity=2, stdout=out)
+        self.assertEqual(
+            set(JenkinsUser.objects.values_list('username', flat=True)),
+            {'activated', 'new'})
+        self.assertEqual(RegistrationProfile.objects.count(), 2)
+        output = out.getvalue()
+        self.assertTrue('deleted 2' in output)
+        self.assertTrue('deleted 4' in output)
+        self.assertTrue('Deleted 5 expired registrations' in output)
+
+    def test_requested_purge(self):
+        out = StringIO()
+        call_command('purge_expired_registrations', requested=True,
+                     stdout=out)
+        self.assertEqual(out.getvalue(), '')
+        self.assertEqual(JenkinsUser.objects.count(), 7)
+
+        RegistrationPurgeRequest.objects.create()
+        out = StringIO()
+        call_command('purge_expired_registrations', requested=True,
+                     stdout=out)
+        self.assertTrue('Deleted 5 expired registrations' in out.getvalue())
+        self.assertEqual(
+            set(JenkinsUser.objects.values_list('username', flat=True)),
+            {'activated', 'new'})
+        self.assertFalse(RegistrationPurgeRequest.objects.exists())
+
+    def test_requested_purge_not_sending_mail(self):
+        RegistrationPurgeRequest.objects.create()
+        call_command('send_queued_emails', stdout=StringIO())
+        self.assertEqual(JenkinsUser.objects.count(), 7)
+
+    def test_activated_since_select(self):
+        """
+        A registration activated between the select and the delete of its
+        batch is neither deleted nor counted.
+
+        """
+        manager = copy.copy(RegistrationProfile.objects)
+        # also selects the activated registration, as if it had been
+        # activated after the select
+        manager.expired = lambda: RegistrationProfile.objects.filter(
+            user__date_joined__lte=activation_expiry_date())
+        self.assertEqual(manager.delete_expired_users(batch_size=4), 5)
+        self.assertTrue(
+            JenkinsUser.objects.filter(username='activated').exists())
+
+    def test_query_count(self):
+        """
+        The users of a batch and the rows that refer to them are deleted
+        with one query per table, whatever the size of the batch.
+
+        """
+        for user in JenkinsUser.objects.filter(username__startswith='expired'):
+            JenkinsUserProfile.objects.create(user=user,
+                                              shib_uid=user.username)
+            ProjectMembership.objects.create(
+                user=user, project=self.project, role=ProjectMembership.USER)
+            StaffNotification.objects.create(user=user)
+            user.groups.add(self.group)
+        # select the registrations, select the users, delete from 8 tables
+        # that refer to the users, delete the users, remove them from the
+        # search index, then find no more registrations
+        with self.assertNumQueries(17):
+            self.assertEqual(
+                RegistrationProfile.objects.delete_expired_users(), 5)
+        self.assertEqual(JenkinsUserProfile.objects.count(), 0)
+        self.assertEqual(ProjectMembership.objects.filter(
+            role=ProjectMembership.USER).count(), 0)
+        self.assertEqual(get_search_backend().search_users('expired', 10), [])
+        if connection.vendor == 'sqlite':
+            # no rows are left referring to a deleted user
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA foreign_key_check')
+                self.assertEqual(
+                    [row for row in cursor.fetchall()
+                     if row[2] == JenkinsUser._meta.db_table], [])
+
+    def test_project_owner(self):
+        """A user that owns a project is not deleted"""
+        owner = JenkinsUser.objects.get(username='expired_0')
+        Project.objects.filter(pk=self.project.pk).update(owner=owner)
+        self.assertEqual(
+            RegistrationProfile.objects.delete_expired_users(), 4)
+        self.assertTrue(
+            JenkinsUser.objects.filter(username='expired_0').exists())
+
+    def test_progress(self):
+        deleted = []
+        RegistrationProfile.objects.delete_expired_users(
+            batch_size=2, progress=deleted.append)
+        self.assertEqual(deleted, [2, 4, 5])
+
+
+class DeactivateStaleUsersTestCase(TestCase):
+
+    def setUp(self):
+        last_login = timezone.now() - datetime.timedelta(days=1000)
+        group = Group.objects.create(name='group')
+        for i in range(5):
+            user = JenkinsUser.objects.create(
+                username='stale_{}'.format(i), last_login=last_login,
+                is_staff=True)
+            user.groups.add(group)
+            RegistrationProfile.objects.create(user=user, activated=True)
+        owner = JenkinsUser.objects.create(username='owner',
+                                           last_login=last_login)
+        project = Project(name='project', owner=owner)
+        create_project(project)
+        ProjectMembership.objects.create(
+            project=project, user=JenkinsUser.objects.get(username='stale_0'),
+            role=ProjectMembership.USER)
+        JenkinsUser.objects.create(username='recent',
+                                   last_login=timezone.now())
+
+    def test_deactivate(self):
+        out = StringIO()
+        call_command('deactivate_stale_users', batch_size=2, verbosity=2,
+                     stdout=out)
+        self.assertEqual(
+            set(JenkinsUser.objects.filter(is_active=True).
+                values_list('username', flat=True)),
+            {'owner', 'recent'})
+        self.assertFalse(JenkinsUser.objects.filter(is_staff=True).exists())
+        self.assertEqual(Group.objects.get(name='group').user_set.count(), 0)
+        # the owner keeps their project memberships
+        self.assertEqual(
+            list(ProjectMembership.objects.values_list('user__username',
+                                                       flat=True)),
+            ['owner'])
+        self.assertEqual(RegistrationProfile.objects.count(), 0)
+        output = out.getvalue()
+        self.assertTrue('deactivated 4' in output)
+        self.assertTrue('users deactivated: 5' in output)
+        self.assertTrue('group memberships removed: 5' in output)
+        self.assertTrue('project memberships removed: 1' in output)
+        self.assertTrue('project owners skipped: 1' in output)
+
+    def test_requested(self):
+        out = StringIO()
+        call_command('deactivate_stale_users', requested=True, stdout=out)
+        self.assertEqual(out.getvalue(), '')
+        self.assertEqual(JenkinsUser.objects.filter(is_active=True).count(), 7)
+
+        StaleUserDeactivationRequest.objects.create()
+        out = StringIO()
+        call_command('deactivate_stale_users', requested=True, stdout=out)
+        self.assertTrue('users deactivated: 5' in out.getvalue())
+        self.assertEqual(JenkinsUser.objects.filter(is_active=True).count(), 2)
+        self.assertFalse(StaleUserDeactivationRequest.objects.exists())
+
+    def test_days(self):
+        call_command('deactivate_stale_users', days=2000, stdout=StringIO())
+        self.assertEqual(JenkinsUser.objects.filter(is_active=True).count(), 7)
+
+
+class CheckOwnedProjectCountsTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = JenkinsUser.objects.create(username='owner')
+        create_project(Project(name='project', owner=self.owner))
+
+    def test_correct(self):
+        out = StringIO()
+        call_command('check_owned_project_counts', stdout=out)
+        self.assertTrue('All counts are correct' in out.getvalue())
+
+    def test_repair(self):
+        OwnedProjectCount.objects.filter(user=self.owner).delete()
+        self.assertRaises(CommandError, call_command,
+                          'check_owned_project_counts', stdout=StringIO())
+        out = StringIO()
+        call_command('check_owned_project_counts', repair=True, stdout=out)
+        output = out.getvalue()
+        self.assertTrue('owner: stored 0, owns 1' in output)
+        self.assertTrue('Repaired 1 counts' in output)
+        self.assertEqual(OwnedProjectCount.objects.get_count(self.owner), 1)
+
+
+class PurgeExpiredSessionsTestCase(TestCase):
+
+    def setUp(self):
+        expired = timezone.now() - datetime.timedelta(days=1)
+        for i in range(5):
+            Session.objects.create(session_key='expired{}'.format(i),
+                                   session_data='', expire_date=expired)
+        Session.objects.create(
+            session_key='current', session_data='',
+            expire_date=timezone.now() + datetime.timedelta(days=1))
+
+    def test_purge(self):
+        out = StringIO()
+        call_command('purge_expired_sessions', batch_size=2, verbosity=2,
+                     stdout=out)
+        self.assertEqual(list(Session.objects.values_list('session_key',
+                                                          flat=True)),
+                         ['current'])
+        output = out.getvalue()
+        self.assertTrue('deleted 4' in output)
+        self.assertTrue('Deleted 5 expired sessions' in output)
+
+    @override_settings(
+        SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_not_in_database(self):
+        self.assertIsNone(delete_expired_sessions())
+        self.assertEqual(Session.objects.count(), 6)
+
+
+class BenchmarkSessionsTestCase(TestCase):
+
+    def test_unknown_user(self):
+        self.assertRaises(CommandError, call_command, 'benchmark_sessions',
+                          'unknown', stdout=StringIO())
@@ -0,0 +1,158 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+
+import re
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test import RequestFactory
+from django.test import TestCase
+from django.utils import timezone
+
+from jenkins_auth.forms import get_member_queryset
+from jenkins_auth.models import JenkinsUser, Project, ProjectMembership
+from jenkins_auth.models import RegistrationProfile
+from jenkins_auth.search import SQLiteSearchBackend
+from jenkins_auth.staff import views as staff_views
+from jenkins_auth.staff.pagination import keyset_filter
+from jenkins_auth.utils import get_stale_users
+
+
+def query_plan(queryset):
+    """
+    @return (list) the lines of the SQLite query plan of the queryset
+
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    """
+    @return (list) the lines of the plan that read the whole of a table,
+        a full text MATCH is answered from the index of the virtual table
+
+    """
+    return [line for line in plan
+            if line.startswith('SCAN ') and line != 'SCAN CONSTANT ROW' and
+            not re.search(r'VIRTUAL TABLE INDEX \d+:M', line)]
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    The querysets of the staff lists and the API should use an index rather
+    than scan a whole table.
+
+    The counts of the staff tabs are not included, they aggregate over all of
+    the users so must read them all.
+
+    """
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('the query plans are read from SQLite')
+        self.factory = RequestFactory()
+
+    def _list_querysets(self, view_class):
+        """
+        The queries for the first and a later page of a staff list.
+
+        """
+        view = view_class()
+        view.request = self.factory.get('/')
+        view.kwargs = {}
+        queryset = view.get_queryset()
+        values = [timezone.now() if name in ('last_login', 'date_joined',
+                                             'created_on')
+                  else 'x' if name in ('last_name', 'name') else 1
+                  for name in view.keyset]
+        return [queryset.order_by(*view.keyset)[:51],
+                queryset.filter(keyset_filter(view.keyset, values, 'gt')).
+                order_by(*view.keyset)[:51]]
+
+    def test_full_scan(self):
+        # first_name is not indexed
+        self.assertNotEqual(
+            full_scans(query_plan(JenkinsUser.objects.filter(first_name='x'))),
+            [])
+
+    def test_plans(self):
+        user = JenkinsUser.objects.create(username='user')
+        querysets = []
+        for view_class in (staff_views.UserList, staff_views.UserListStale,
+                           staff_views.UserListDeleted,
+                           staff_views.UserListRegistration,
+                           staff_views.UserListApproval,
+                           staff_views.UserListStaff,
+                           staff_views.ProjectList,
+                           staff_views.ProjectListApproval):
+            querysets.extend(self._list_querysets(view_class))
+        querysets.extend([
+            # the projects owned by the users on a page
+            Project.objects.filter(owner__in=[1, 2, 3]),
+            RegistrationProfile.objects.expired(),
+            RegistrationProfile.objects.filter(activation_key='x'),
+            get_stale_users().filter(project_owner__isnull=True).order_by('pk'),
+            # the API
+            JenkinsUser.objects.filter(username='user'),
+            Project.objects.with_member(user, ProjectMembership.ADMIN).
+            filter(is_active=True),
+            Project.objects.with_member(user, ProjectMembership.USER).
+            filter(is_active=True),
+            # the project permissions and the member pages of a project
+            ProjectMembership.objects.filter(user=user).
+            values_list('project_id', 'role'),
+            JenkinsUser.objects.filter(project_memberships__project=1,
+                                       project_memberships__role='admin'),
+        ])
+        for queryset in querysets:
+            plan = query_plan(queryset)
+            self.assertEqual(full_scans(plan), [], '\n'.join(plan))
+
+    def test_user_search(self):
+        """
+        The user picker of the project form reads the matches from the full
+        text index and looks up each user, rather than reading every user.
+
+        """
+        for names_only in (True, False):
+            plan = query_plan(
+                SQLiteSearchBackend().filter_users(
+                    get_member_queryset(), 'smi bob', names_only=names_only).
+                order_by('last_name', 'first_name', 'id')[:21])
+            self.assertEqual(full_scans(plan), [], '\n'.join(plan))
+            self.assertTrue(
+                any('auth_user USING INTEGER PRIMARY KEY' in line
+                    for line in plan), '\n'.join(plan))
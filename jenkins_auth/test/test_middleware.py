@@ -0,0 +1,137 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+
+import django
+django.setup()
+
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.test import Client, RequestFactory, TestCase
+from django.utils.functional import SimpleLazyObject
+
+from jenkins_auth.middleware import CachedShibbolethRemoteUserMiddleware, \
+    get_shib_user
+from jenkins_auth.models import JenkinsUser, JenkinsUserProfile
+
+
+def _not_loaded():
+    raise AssertionError('The user was loaded')
+
+
+class ShibUserCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = JenkinsUser.objects.create(username='shib-id')
+        JenkinsUserProfile.objects.create(user=user, shib_uid='shib-id')
+        JenkinsUser.objects.create(username='local')
+
+    def test_get_shib_user(self):
+        user = JenkinsUser.objects.get(username='shib-id')
+        self.assertEqual(get_shib_user('shib-id'),
+                         {'user_id': user.pk, 'is_shib_user': True})
+        with self.assertNumQueries(0):
+            get_shib_user('shib-id')
+        self.assertFalse(get_shib_user('local')['is_shib_user'])
+        self.assertIsNone(get_shib_user('unknown'))
+
+    def test_profile_changed(self):
+        self.assertTrue(get_shib_user('shib-id')['is_shib_user'])
+        JenkinsUserProfile.objects.filter(shib_uid='shib-id').get().delete()
+        self.assertFalse(get_shib_user('shib-id')['is_shib_user'])
+        user = JenkinsUser.objects.get(username='shib-id')
+        JenkinsUserProfile.objects.create(user=user, shib_uid='shib-id')
+        self.assertTrue(get_shib_user('shib-id')['is_shib_user'])
+
+    def test_user_deleted(self):
+        self.assertIsNotNone(get_shib_user('local'))
+        JenkinsUser.objects.get(username='local').delete()
+        self.assertIsNone(get_shib_user('local'))
+
+    def test_non_ascii_username(self):
+        user = JenkinsUser.objects.create(username=u'jos\xe9 mu\xf1oz')
+        self.assertEqual(get_shib_user(u'jos\xe9 mu\xf1oz'),
+                         {'user_id': user.pk, 'is_shib_user': False})
+        JenkinsUserProfile.objects.create(user=user,
+                                          shib_uid=u'jos\xe9 mu\xf1oz')
+        self.assertTrue(get_shib_user(u'jos\xe9 mu\xf1oz')['is_shib_user'])
+
+    def test_login_keeps_cache(self):
+        get_shib_user('shib-id')
+        user = JenkinsUser.objects.get(username='shib-id')
+        user.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            get_shib_user('shib-id')
+
+
+class CachedShibbolethMiddlewareTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = JenkinsUser.objects.create(username='shib-id')
+        JenkinsUserProfile.objects.create(user=self.user, shib_uid='shib-id')
+        self.middleware = CachedShibbolethRemoteUserMiddleware()
+
+    def _request(self, session_user_id):
+        request = RequestFactory().get('/', REMOTE_USER='shib-id')
+        request.session = {SESSION_KEY: str(session_user_id)}
+        request.user = SimpleLazyObject(_not_loaded)
+        return request
+
+    def test_session_user(self):
+        get_shib_user('shib-id')
+        request = self._request(self.user.pk)
+        with self.assertNumQueries(0):
+            self.middleware.process_request(request)
+        self.assertEqual(request.shib_user,
+                         {'user_id': self.user.pk, 'is_shib_user': True})
+
+    def test_other_session_user(self):
+        request = self._request(self.user.pk + 1)
+        # the user is loaded by ShibbolethRemoteUserMiddleware
+        self.assertRaises(AssertionError, self.middleware.process_request,
+                          request)
+
+    def test_shib_view(self):
+        c = Client()
+        c.force_login(self.user,
+                      backend='django.contrib.auth.backends.ModelBackend')
+        response = c.get('/accounts/shib/')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, '/')
+        JenkinsUserProfile.objects.filter(user=self.user).update(
+            shib_uid='other')
+        # an update does not send post_save, the cached details are used
+        response = c.get('/accounts/shib/')
+        self.assertEqual(response.status_code, 302)
+        JenkinsUserProfile.objects.get(user=self.user).save()
+        response = c.get('/accounts/shib/')
+        self.assertEqual(response.status_code, 500)
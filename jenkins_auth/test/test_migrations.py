@@ -0,0 +1,95 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+
+import django
+django.setup()
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class ProjectMembershipMigrationTestCase(TransactionTestCase):
+    """
+    The members of the project groups are copied to ProjectMembership and
+    back again.
+
+    """
+    before = [('jenkins_auth', '0004_staffnotification')]
+    after = [('jenkins_auth', '0007_remove_project_groups')]
+
+    def _migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        # back to the latest migrations for the following tests
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_copy_and_restore(self):
+        apps = self._migrate(self.before)
+        Group = apps.get_model('auth', 'Group')
+        User = apps.get_model('auth', 'User')
+        Project = apps.get_model('jenkins_auth', 'Project')
+        owner = User.objects.create(username='owner')
+        member = User.objects.create(username='member')
+        for i in range(3):
+            admins = Group.objects.create(name='p {} | admins'.format(i))
+            users = Group.objects.create(name='p {} | users'.format(i))
+            admins.user_set.add(owner)
+            users.user_set.add(member)
+            Project.objects.create(name='p {}'.format(i), owner=owner,
+                                   admins=admins, users=users)
+
+        apps = self._migrate(self.after)
+        ProjectMembership = apps.get_model('jenkins_auth',
+                                           'ProjectMembership')
+        self.assertEqual(
+            sorted(ProjectMembership.objects.values_list(
+                'project__name', 'role', 'user__username')),
+            [('p 0', 'admin', 'owner'), ('p 0', 'user', 'member'),
+             ('p 1', 'admin', 'owner'), ('p 1', 'user', 'member'),
+             ('p 2', 'admin', 'owner'), ('p 2', 'user', 'member')])
+        self.assertFalse(apps.get_model('auth', 'Group').objects.exists())
+
+        apps = self._migrate(self.before)
+        Project = apps.get_model('jenkins_auth', 'Project')
+        project = Project.objects.get(name='p 1')
+        self.assertEqual(project.admins.name, 'p 1 | admins')
+        self.assertEqual(
+            list(project.admins.user_set.values_list('username', flat=True)),
+            ['owner'])
+        self.assertEqual(
+            list(project.users.user_set.values_list('username', flat=True)),
+            ['member'])
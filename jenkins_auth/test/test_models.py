@@ -35,13 +35,17 @@ import django
 django.setup()
 
 from django.conf import settings
-from django.contrib.auth.models import Group
 from django.contrib.sites.models import Site
 from django.test import TestCase
 from django.utils.timezone import now as datetime_now
 
 from jenkins_auth.models import JenkinsUser, JenkinsUserProfile, RegistrationProfile, Project
-from jenkins_auth.utils import logically_delete_user, delete_project
+from jenkins_auth.models import OwnedProjectCount, ProjectMembership
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+
+from jenkins_auth.utils import logically_delete_user, delete_project, set_project_members, \
+    create_project, create_projects, delete_projects, check_owned_project_counts
 
 
 class JenkinsUserTestCase(TestCase):
@@ -96,14 +100,10 @@ class ProjectTestCase(TestCase):
 
     def setUp(self):
         ju = JenkinsUser.objects.create(username="user_1")
-        admins = Group.objects.create(name="p A admins")
-        users = Group.objects.create(name="p A users")
         Project.objects.create(
             name="project A",
             description="test project A",
-            owner=ju,
-            admins=admins,
-            users=users)
+            owner=ju)
 
     def test_jenkins_user_delete(self):
         """Project owner cannot be deleted"""
@@ -150,6 +150,15 @@ class RegistrationProfileTestCase(TestCase):
         RegistrationProfile.objects.delete_expired_users()
         self.assertEqual(JenkinsUser.objects.count(), 1)
 
+    def test_expired(self):
+        """Check the expired profiles match activation_key_expired"""
+        expired = RegistrationProfile.objects.expired()
+        self.assertEqual([profile.user.username for profile in expired],
+                         ['expired_reg'])
+        for profile in RegistrationProfile.objects.all():
+            self.assertEqual(profile in expired,
+                             profile.activation_key_expired())
+
 
 class UtilsTestCase(TestCase):
 
@@ -163,17 +172,10 @@ class UtilsTestCase(TestCase):
             shib_uid="shib_id")
         RegistrationProfile.objects.create(user=ju_1,
                                            activated=True)
-        admins = Group.objects.create(name="p A admins")
-        users = Group.objects.create(name="p A users")
-        ju_1.groups.add(admins)
-        ju_1.groups.add(users)
-
-        Project.objects.create(
+        create_project(Project(
             name="project A",
             description="test project A",
-            owner=ju_1,
-            admins=admins,
-            users=users)
+            owner=ju_1))
 
     def test_logically_delete_user(self):
         """Clean out anything associated with the user"""
@@ -183,7 +185,7 @@ class UtilsTestCase(TestCase):
         self.assertTrue(ju.is_superuser)
         self.assertTrue(ju.registrationprofile.activated)
         RegistrationProfile.objects.get(user=ju)
-        self.assertEqual(ju.groups.count(), 2)
+        self.assertEqual(ju.project_memberships.count(), 1)
 
         logically_delete_user(ju)
 
@@ -194,15 +196,155 @@ class UtilsTestCase(TestCase):
             RegistrationProfile.DoesNotExist,
             RegistrationProfile.objects.get,
             user=ju)
-        self.assertEqual(ju.groups.count(), 0)
+        self.assertEqual(ju.project_memberships.count(), 0)
 #         self.assertIsNone(ju.user_permissions)
 
     def test_delete_project(self):
-        """Delete the project and associated Groups"""
+        """Delete the project and its memberships"""
         self.assertEqual(Project.objects.count(), 1)
-        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(ProjectMembership.objects.count(), 1)
 
         delete_project(Project.objects.get(name="project A"))
 
         self.assertEqual(Project.objects.count(), 0)
-        self.assertEqual(Group.objects.count(), 0)
+        self.assertEqual(ProjectMembership.objects.count(), 0)
+
+    def test_set_project_members(self):
+        """Only the differences are applied"""
+        project = Project.objects.get(name="project A")
+        ju_1 = JenkinsUser.objects.get(username="shib_id")
+        ju_2 = JenkinsUser.objects.create(username="user_2")
+        ju_3 = JenkinsUser.objects.create(username="user_3")
+
+        set_project_members(project, [ju_1.id, ju_2.id], [ju_3.id])
+        self.assertEqual(
+            set(project.get_members(ProjectMembership.ADMIN).
+                values_list('username', flat=True)),
+            {'shib_id', 'user_2'})
+        self.assertEqual(
+            set(project.get_members(ProjectMembership.USER).
+                values_list('username', flat=True)),
+            {'user_3'})
+
+        set_project_members(project, [ju_2.id], [ju_1.id, ju_3.id])
+        self.assertEqual(
+            set(project.get_members(ProjectMembership.ADMIN).
+                values_list('username', flat=True)),
+            {'user_2'})
+        self.assertEqual(
+            set(project.get_members(ProjectMembership.USER).
+                values_list('username', flat=True)),
+            {'shib_id', 'user_3'})
+
+    def test_set_project_members_queries(self):
+        """The number of queries does not depend on the number of members"""
+        project = Project.objects.get(name="project A")
+        JenkinsUser.objects.bulk_create(
+            [JenkinsUser(username="user_{}".format(i)) for i in range(500)])
+        ids = list(JenkinsUser.objects.values_list('id', flat=True))
+
+        with self.assertNumQueries(5):
+            set_project_members(project, ids[:10], ids[10:20])
+        with self.assertNumQueries(5):
+            # under the SQLite limit of rows in one insert
+            set_project_members(project, ids[:150], ids[150:300])
+        self.assertEqual(
+            project.get_members(ProjectMembership.ADMIN).count(), 150)
+
+    def test_set_project_members_many_removed(self):
+        """Removing more members than SQLite allows parameters in a query"""
+        project = Project.objects.get(name="project A")
+        JenkinsUser.objects.bulk_create(
+            [JenkinsUser(username="user_{}".format(i)) for i in range(1200)])
+        ids = list(JenkinsUser.objects.values_list('id', flat=True))
+        set_project_members(project, ids[:100], ids[100:])
+
+        with CaptureQueriesContext(connection) as queries:
+            set_project_members(project, [], ids[:1])
+        deletes = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('DELETE')]
+        # 100 admins in one delete, the other 1101 users in three
+        self.assertEqual(len(deletes), 4)
+        self.assertTrue(all(sql.count(',') < 999 for sql in deletes))
+        self.assertEqual(
+            list(ProjectMembership.objects.filter(project=project).
+                 values_list('user_id', 'role')),
+            [(ids[0], ProjectMembership.USER)])
+
+    def test_create_project(self):
+        """The project and the owner membership"""
+        ju = JenkinsUser.objects.get(username="shib_id")
+        create_project(Project(name="project B", owner=ju))
+        project = Project.objects.get(name="project B")
+        self.assertEqual(
+            list(project.memberships.values_list('user', 'role')),
+            [(ju.pk, ProjectMembership.ADMIN)])
+        self.assertTrue(ju.has_perm('jenkins_auth.change_project', project))
+
+    def test_create_project_duplicate(self):
+        """Nothing is created if the project already exists"""
+        ju = JenkinsUser.objects.get(username="shib_id")
+        self.assertRaises(
+            IntegrityError,
+            create_project,
+            Project(name="project A", owner=ju))
+        self.assertEqual(ProjectMembership.objects.count(), 1)
+
+    def test_project_members(self):
+        """The projects of a user and the users of a project by role"""
+        ju = JenkinsUser.objects.get(username="shib_id")
+        project = Project.objects.get(name="project A")
+        self.assertEqual(
+            list(Project.objects.with_member(ju, ProjectMembership.ADMIN)),
+            [project])
+        self.assertFalse(
+            Project.objects.with_member(ju, ProjectMembership.USER).exists())
+        self.assertEqual(
+            list(project.get_members(ProjectMembership.ADMIN)), [ju])
+
+    def test_create_projects_queries(self):
+        """The number of queries does not depend on the number of projects"""
+        ju = JenkinsUser.objects.get(username="shib_id")
+        create_projects([Project(name="warm up", owner=ju)])
+        with self.assertNumQueries(8):
+            create_projects(
+                [Project(name="p {}".format(i), owner=ju) for i in range(2)])
+        with self.assertNumQueries(8):
+            create_projects(
+                [Project(name="q {}".format(i), owner=ju) for i in range(100)])
+        self.assertEqual(Project.objects.count(), 104)
+
+    def test_owned_project_counts(self):
+        """Creating and deleting projects keeps the count of the owner"""
+        ju_1 = JenkinsUser.objects.get(username="shib_id")
+        ju_2 = JenkinsUser.objects.create(username="user_2")
+        self.assertEqual(OwnedProjectCount.objects.get_count(ju_1), 1)
+        self.assertEqual(OwnedProjectCount.objects.get_count(ju_2), 0)
+
+        create_projects([Project(name="p 1", owner=ju_1),
+                         Project(name="p 2", owner=ju_2),
+                         Project(name="p 3", owner=ju_2)])
+        self.assertEqual(OwnedProjectCount.objects.get_count(ju_1), 2)
+        self.assertEqual(OwnedProjectCount.objects.get_count(ju_2), 2)
+
+        delete_project(Project.objects.get(name="project A"))
+        delete_projects(Project.objects.filter(
+            name__in=["p 1", "p 2"]).values_list('pk', flat=True))
+        self.assertEqual(OwnedProjectCount.objects.get_count(ju_1), 0)
+        self.assertEqual(OwnedProjectCount.objects.get_count(ju_2), 1)
+        self.assertEqual(check_owned_project_counts(), {})
+
+    def test_check_owned_project_counts(self):
+        """Wrong counts are found and repaired"""
+        ju_1 = JenkinsUser.objects.get(username="shib_id")
+        ju_2 = JenkinsUser.objects.create(username="user_2")
+        # not counted
+        Project.objects.create(name="project B", owner=ju_2)
+        OwnedProjectCount.objects.filter(user=ju_1).update(count=5)
+
+        expected = {ju_1.pk: (5, 1), ju_2.pk: (0, 1)}
+        self.assertEqual(check_owned_project_counts(), expected)
+        self.assertEqual(check_owned_project_counts(repair=True), expected)
+        self.assertEqual(check_owned_project_counts(), {})
+        self.assertEqual(OwnedProjectCount.objects.get_count(ju_1), 1)
+        self.assertEqual(OwnedProjectCount.objects.get_count(ju_2), 1)
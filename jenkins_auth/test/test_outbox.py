@@ -0,0 +1,312 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+
+import asyncore
+import smtpd
+import smtplib
+import socket
+import threading
+
+import django
+django.setup()
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from jenkins_auth.models import JenkinsUser, OutgoingEmail, StaffNotification
+from jenkins_auth.outbox import LAST_ERROR_LENGTH, queue_staff_digest, \
+    send_queued_emails
+from jenkins_auth.settings import OUTBOX_MAX_ATTEMPTS
+
+
+class SMTPStandIn(smtpd.SMTPServer):
+    """
+    A local mail server that keeps the messages it receives.
+
+    """
+
+    def __init__(self):
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', 0), None)
+        self.port = self.socket.getsockname()[1]
+        self.messages = []
+        self.connections = 0
+
+    def handle_accept(self):
+        self.connections += 1
+        smtpd.SMTPServer.handle_accept(self)
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        self.messages.append((mailfrom, rcpttos))
+
+
+def _unused_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class OutboxTestCase(TestCase):
+
+    def test_queue(self):
+        OutgoingEmail.objects.queue('subject', 'body', 'from@example.org',
+                                    ['a@example.org', 'b@example.org'])
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.recipient_list(),
+                         ['a@example.org', 'b@example.org'])
+        self.assertEqual(list(OutgoingEmail.objects.pending()), [email])
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_email_staff(self):
+        JenkinsUser.objects.create(username='staff-1', is_staff=True,
+                                   email='staff-1@example.org')
+        JenkinsUser.objects.email_staff('subject', 'body', 'from@example.org')
+        self.assertEqual(
+            OutgoingEmail.objects.get().recipient_list(),
+            ['staff-1@example.org'])
+
+    def test_send(self):
+        for i in range(3):
+            OutgoingEmail.objects.queue(
+                'subject-{}'.format(i), 'body', 'from@example.org',
+                ['user-{}@example.org'.format(i)])
+        self.assertEqual(send_queued_emails(batch_size=2), (3, 0))
+        self.assertEqual([email.subject for email in mail.outbox],
+                         ['subject-0', 'subject-1', 'subject-2'])
+        self.assertFalse(OutgoingEmail.objects.filter(
+            sent_on__isnull=True).exists())
+        # nothing is sent twice
+        self.assertEqual(send_queued_emails(), (0, 0))
+
+    def test_stopped(self):
+        """The emails sent before the worker stopped are not sent again"""
+        for i in range(3):
+            OutgoingEmail.objects.queue(
+                'subject-{}'.format(i), 'body', 'from@example.org',
+                ['user-{}@example.org'.format(i)])
+        with self.assertRaises(SystemExit):
+            send_queued_emails(connection=StoppingConnection())
+        self.assertEqual(
+            list(OutgoingEmail.objects.filter(sent_on__isnull=False).
+                 values_list('subject', flat=True)),
+            ['subject-0'])
+
+    def test_send_after(self):
+        OutgoingEmail.objects.queue('subject', 'body', 'from@example.org',
+                                    ['user@example.org'])
+        OutgoingEmail.objects.update(
+            send_after=timezone.now() + timezone.timedelta(minutes=5))
+        self.assertEqual(send_queued_emails(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_command(self):
+        OutgoingEmail.objects.queue('subject', 'body', 'from@example.org',
+                                    ['user@example.org'])
+        out = StringIO()
+        call_command('send_queued_emails', stdout=out)
+        self.assertEqual(out.getvalue(), 'Sent 1 emails, 0 failed\n')
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class StaffDigestTestCase(TestCase):
+
+    def setUp(self):
+        for i in range(2):
+            JenkinsUser.objects.create(username='staff-{}'.format(i),
+                                       is_staff=True,
+                                       email='staff-{}@example.org'.format(i))
+        for i in range(3):
+            user = JenkinsUser.objects.create(
+                username='user-{}'.format(i), first_name='First',
+                last_name='Last-{}'.format(i), is_active=False)
+            StaffNotification.objects.create(user=user)
+
+    def test_staff_emails_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(JenkinsUser.objects.get_staff_emails(),
+                             {'staff-0@example.org', 'staff-1@example.org'})
+
+    def test_digest(self):
+        JenkinsUser.objects.filter(username='user-2').update(is_active=True)
+        self.assertEqual(queue_staff_digest(interval=3600), 2)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(sorted(email.recipient_list()),
+                         ['staff-0@example.org', 'staff-1@example.org'])
+        self.assertTrue('2 users have requested an account' in email.body)
+        self.assertTrue('First Last-0 (user-0)' in email.body)
+        self.assertTrue('First Last-1 (user-1)' in email.body)
+        # approved in the meantime
+        self.assertFalse('user-2' in email.body)
+        self.assertFalse(StaffNotification.objects.filter(
+            notified_on__isnull=True).exists())
+
+    def test_interval(self):
+        self.assertEqual(queue_staff_digest(interval=3600), 3)
+        user = JenkinsUser.objects.create(username='user-3', is_active=False)
+        StaffNotification.objects.create(user=user)
+        # too soon after the last digest
+        self.assertEqual(queue_staff_digest(interval=3600), 0)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+        StaffNotification.objects.exclude(notified_on=None).update(
+            notified_on=timezone.now() - timezone.timedelta(hours=2))
+        self.assertEqual(queue_staff_digest(interval=3600), 1)
+        self.assertEqual(OutgoingEmail.objects.count(), 2)
+        # only the notifications of the last digest are kept
+        self.assertEqual(StaffNotification.objects.count(), 1)
+
+    def test_nothing_pending(self):
+        StaffNotification.objects.all().delete()
+        self.assertEqual(queue_staff_digest(interval=3600), 0)
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+
+class OutboxSMTPTestCase(TestCase):
+
+    def setUp(self):
+        self.server = SMTPStandIn()
+        self.thread = threading.Thread(
+            target=asyncore.loop, kwargs={'timeout': 0.1})
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.close()
+        self.thread.join()
+
+    def test_send_over_one_connection(self):
+        for i in range(3):
+            OutgoingEmail.objects.queue(
+                'subject-{}'.format(i), 'body', 'from@example.org',
+                ['user-{}@example.org'.format(i)])
+        with override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.server.port,
+                EMAIL_USE_TLS=False, EMAIL_HOST_USER='',
+                EMAIL_HOST_PASSWORD=''):
+            self.assertEqual(send_queued_emails(), (3, 0))
+        self.assertEqual(
+            [rcpttos for mailfrom, rcpttos in self.server.messages],
+            [['user-0@example.org'], ['user-1@example.org'],
+             ['user-2@example.org']])
+        self.assertEqual(self.server.connections, 1)
+
+
+class RefusingConnection(object):
+    """
+    An email backend connection on which every email fails with the error.
+
+    """
+
+    def __init__(self, error):
+        self.error = error
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        raise self.error
+
+
+class StoppingConnection(RefusingConnection):
+    """
+    Sends one email, then stops the worker, as SIGTERM would.
+
+    """
+
+    def __init__(self):
+        self.sent = 0
+
+    def send_messages(self, messages):
+        if self.sent:
+            raise SystemExit()
+        self.sent += len(messages)
+        return len(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+    EMAIL_HOST='127.0.0.1', EMAIL_PORT=_unused_port(), EMAIL_TIMEOUT=1,
+    EMAIL_USE_TLS=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='')
+class OutboxRetryTestCase(TestCase):
+
+    def setUp(self):
+        OutgoingEmail.objects.queue('subject', 'body', 'from@example.org',
+                                    ['user@example.org'])
+
+    def test_backoff(self):
+        before = timezone.now()
+        self.assertEqual(send_queued_emails(), (0, 1))
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.attempts, 1)
+        self.assertTrue(email.last_error)
+        self.assertFalse(email.failed)
+        self.assertIsNone(email.sent_on)
+        self.assertTrue(email.send_after > before)
+        # not due yet
+        self.assertEqual(send_queued_emails(), (0, 0))
+
+        # the delay doubles with each attempt
+        OutgoingEmail.objects.update(send_after=timezone.now())
+        before = timezone.now()
+        send_queued_emails()
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.attempts, 2)
+        self.assertTrue(email.send_after - before >=
+                        timezone.timedelta(seconds=2 * 60))
+
+    def test_non_ascii_error(self):
+        error = smtplib.SMTPDataError(554, u'Bo\xeete pleine '.encode('utf-8'))
+        self.assertEqual(
+            send_queued_emails(connection=RefusingConnection(error)), (0, 1))
+        self.assertTrue(OutgoingEmail.objects.get().last_error)
+
+        OutgoingEmail.objects.update(send_after=timezone.now())
+        error = Exception(u'Bo\xeete pleine ' * 1000)
+        self.assertEqual(
+            send_queued_emails(connection=RefusingConnection(error)), (0, 1))
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.attempts, 2)
+        self.assertEqual(email.last_error,
+                         (u'Bo\xeete pleine ' * 1000)[:LAST_ERROR_LENGTH])
+
+    def test_give_up(self):
+        OutgoingEmail.objects.update(attempts=OUTBOX_MAX_ATTEMPTS - 1)
+        send_queued_emails()
+        email = OutgoingEmail.objects.get()
+        self.assertTrue(email.failed)
+        self.assertEqual(list(OutgoingEmail.objects.pending()), [])
@@ -0,0 +1,181 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+
+import django
+django.setup()
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from jenkins_auth.models import JenkinsUser, JenkinsUserProfile, Project
+from jenkins_auth.search import SimpleSearchBackend, SQLiteSearchBackend, \
+    search_words
+from jenkins_auth.signals import create_search_index
+from jenkins_auth.utils import create_project, create_projects
+
+
+User = get_user_model()
+
+class SearchTestCase(TestCase):
+    backend = SQLiteSearchBackend()
+
+    def setUp(self):
+        self.joe = JenkinsUser.objects.create(
+            username='jbloggs', first_name='Joe', last_name='Bloggs',
+            email='joe@example.org')
+        self.jane = JenkinsUser.objects.create(
+            username='jane', first_name='Jane', last_name='Doe',
+            email='jane.doe@bloggs.example.org')
+        JenkinsUserProfile.objects.create(
+            user=self.jane, shib_uid='CBIV/Ddgyl825NoF6EM77QAQl0E=42')
+        self.project = Project(name='Physics 101', owner=self.joe,
+                               description='Simulations of bloggs')
+        create_project(self.project)
+
+    def test_search_words(self):
+        self.assertEqual(search_words(' joe  "bloggs" @example.org '),
+                         ['joe', 'bloggs', 'example', 'org'])
+
+    def test_search_users(self):
+        search = self.backend.search_users
+        self.assertEqual(search('joe', 10), [self.joe.pk])
+        self.assertEqual(search('Ja Do', 10), [self.jane.pk])
+        self.assertEqual(search('CBIV', 10), [self.jane.pk])
+        self.assertEqual(search('nobody', 10), [])
+        self.assertEqual(search('', 10), [])
+        self.assertEqual(search('bloggs', 1), [self.joe.pk])
+
+    def test_search_non_ascii(self):
+        jose = JenkinsUser.objects.create(
+            username='jmunoz', first_name=u'Jos\xe9', last_name=u'Mu\xf1oz')
+        self.assertEqual(self.backend.search_users(u'Jos\xe9 Mu\xf1', 10),
+                         [jose.pk])
+
+    def test_ranking(self):
+        # a match on the name ranks above a match on the email
+        self.assertEqual(self.backend.search_users('bloggs', 10),
+                         [self.joe.pk, self.jane.pk])
+
+    def test_search_projects(self):
+        search = self.backend.search_projects
+        self.assertEqual(search('phys 101', 10), [self.project.pk])
+        self.assertEqual(search('simulation', 10), [self.project.pk])
+        self.assertEqual(search('joe', 10), [])
+
+    def test_update(self):
+        self.joe.last_name = 'Smith'
+        self.joe.save()
+        self.assertEqual(self.backend.search_users('smith', 10),
+                         [self.joe.pk])
+        self.project.name = 'Chemistry'
+        self.project.save()
+        self.assertEqual(self.backend.search_projects('chem', 10),
+                         [self.project.pk])
+        self.assertEqual(self.backend.search_projects('physics', 10), [])
+
+    def test_update_other_fields(self):
+        with self.assertNumQueries(1):
+            self.joe.save(update_fields=['last_login'])
+
+    def test_delete(self):
+        self.jane.jenkinsuserprofile.delete()
+        self.assertEqual(self.backend.search_users('CBIV', 10), [])
+        self.project.delete()
+        self.assertEqual(self.backend.search_projects('physics', 10), [])
+        self.jane.delete()
+        self.assertEqual(self.backend.search_users('jane', 10), [])
+
+    def test_bulk_create(self):
+        create_projects([Project(name='Bulk {}'.format(i), owner=self.jane)
+                         for i in range(3)])
+        self.assertEqual(len(self.backend.search_projects('bulk', 10)), 3)
+
+    def test_index_created(self):
+        """The existing rows are indexed when the index is first created"""
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE {}'.format(SQLiteSearchBackend.table))
+        create_search_index(sender=apps.get_app_config('jenkins_auth'))
+        self.assertEqual(self.backend.search_users('CBIV', 10), [self.jane.pk])
+        self.assertEqual(self.backend.search_projects('physics', 10),
+                         [self.project.pk])
+
+    def test_rebuild(self):
+        JenkinsUser.objects.filter(pk=self.joe.pk).update(first_name='Fred')
+        self.assertEqual(self.backend.search_users('fred', 10), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertEqual(self.backend.search_users('fred', 10), [self.joe.pk])
+        self.assertEqual(self.backend.search_projects('physics', 10),
+                         [self.project.pk])
+
+
+class SimpleSearchTestCase(SearchTestCase):
+    backend = SimpleSearchBackend()
+
+    def test_ranking(self):
+        # ordered by name
+        self.assertEqual(self.backend.search_users('bloggs', 10),
+                         [self.joe.pk, self.jane.pk])
+
+    def test_rebuild(self):
+        # there is no index, so changes are seen straight away
+        JenkinsUser.objects.filter(pk=self.joe.pk).update(first_name='Fred')
+        self.assertEqual(self.backend.search_users('fred', 10), [self.joe.pk])
+
+
+class StaffSearchTestCase(TestCase):
+    c = Client()
+
+    def setUp(self):
+        staff = User.objects.create_user(
+            'staff-1', password='pwd-1', is_staff=True)
+        User.objects.create_user('user-1', password='pwd-1', first_name='Joe')
+        create_project(Project(name='Joe project', owner=staff))
+
+    def test_search(self):
+        self.c.login(username='staff-1', password='pwd-1')
+        response = self.c.get('/staff/search/', {'q': 'joe'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user.username for user in response.context['users']],
+                         ['user-1'])
+        self.assertEqual(
+            [project.name for project in response.context['projects']],
+            ['Joe project'])
+
+    def test_not_staff(self):
+        self.c.login(username='user-1', password='pwd-1')
+        response = self.c.get('/staff/search/', {'q': 'joe'})
+        self.assertNotEqual(response.status_code, 200)
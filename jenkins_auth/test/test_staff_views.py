@@ -0,0 +1,449 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+
+import django
+django.setup()
+
+
+from django.test import Client
+from django.test import TestCase
+from django.core import mail
+import csv
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from jenkins_auth.models import OutgoingEmail, Project, ProjectMembership
+from jenkins_auth.models import RegistrationProfile, RegistrationPurgeRequest
+from jenkins_auth.models import StaleUserDeactivationRequest
+from jenkins_auth.outbox import send_queued_emails
+from jenkins_auth.settings import API_USER, ADMIN_USER
+from jenkins_auth.staff.export import export_rows
+from jenkins_auth.utils import create_projects, get_account_counts, \
+    run_requested_registration_purge, run_requested_stale_user_deactivation
+
+
+User = get_user_model()
+
+
+class StaffListPaginationTestCase(TestCase):
+    c = Client()
+
+    def setUp(self):
+        User.objects.create_user("staff-1", password="pwd-1", is_staff=True,
+                                 last_name='Aaa')
+        # several users share a last name so the id has to break the tie
+        User.objects.bulk_create(
+            [User(username='user-{}'.format(i),
+                  last_name='Name-{:02d}'.format(i // 3))
+             for i in range(120)])
+        owner = User.objects.get(username='staff-1')
+        create_projects(
+            [Project(name='project-{:03d}'.format(i), owner=owner)
+             for i in range(60)])
+
+    def _walk(self, url):
+        """
+        Follow the next links from the first page to the last, then the
+        previous links back again.
+
+        """
+        pages = []
+        response = self.c.get(url)
+        pages.append(list(response.context['object_list']))
+        while response.context['page_obj'].has_next():
+            response = self.c.get(
+                url, {'after': response.context['page_obj'].next_cursor})
+            pages.append(list(response.context['object_list']))
+        backwards = [list(response.context['object_list'])]
+        while response.context['page_obj'].has_previous():
+            response = self.c.get(
+                url, {'before': response.context['page_obj'].previous_cursor})
+            backwards.insert(0, list(response.context['object_list']))
+        self.assertEqual(pages, backwards)
+        return pages
+
+    def test_user_list(self):
+        self.c.login(username='staff-1', password='pwd-1')
+        pages = self._walk('/staff/user/')
+        self.assertEqual([len(page) for page in pages], [50, 50, 21])
+        users = [user for page in pages for user in page]
+        self.assertEqual(
+            users,
+            list(User.objects.filter(is_active=True).
+                 exclude(username__in=[API_USER, ADMIN_USER]).
+                 order_by('last_name', 'id')))
+
+    def test_project_approval_list(self):
+        self.c.login(username='staff-1', password='pwd-1')
+        pages = self._walk('/staff/project/approval/')
+        self.assertEqual([len(page) for page in pages], [50, 10])
+        projects = [project for page in pages for project in page]
+        self.assertEqual(projects,
+                         list(Project.objects.order_by('id')))
+
+    def test_invalid_cursor(self):
+        self.c.login(username='staff-1', password='pwd-1')
+        response = self.c.get('/staff/project/', {'after': 'not-a-cursor'})
+        self.assertEquals(response.status_code, 200)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+
+class StaffListQueryCountTestCase(TestCase):
+    """
+    Each list should take the same number of queries however many rows are
+    shown.
+
+    """
+    c = Client()
+
+    urls = ['/staff/user/', '/staff/user/approval/', '/staff/user/stale/',
+            '/staff/user/deleted/', '/staff/user/staff/',
+            '/staff/user/registration/', '/staff/project/',
+            '/staff/project/approval/']
+
+    def setUp(self):
+        User.objects.create_user("staff-1", password="pwd-1", is_staff=True)
+        self.c.login(username='staff-1', password='pwd-1')
+
+    def _add_rows(self, start, count):
+        old_date = timezone.now() - timezone.timedelta(days=1000)
+        for i in range(start, start + count):
+            user = User.objects.create_user(
+                'active-{}'.format(i), first_name='First',
+                last_name='Last', is_staff=True)
+            user.last_login = old_date
+            user.save()
+            create_projects(
+                [Project(name='project-{}-a'.format(i), owner=user),
+                 Project(name='project-{}-b'.format(i), owner=user,
+                         is_active=True)])
+            User.objects.create_user('deleted-{}'.format(i), is_active=False)
+            user = User.objects.create_user(
+                'registration-{}'.format(i), is_active=False)
+            RegistrationProfile.objects.create_profile(user)
+            user = User.objects.create_user(
+                'approval-{}'.format(i), is_active=False)
+            RegistrationProfile.objects.create_profile(user, activated=True)
+
+    def test_constant_queries(self):
+        self._add_rows(0, 2)
+        counts = {}
+        for url in self.urls:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.c.get(url)
+            self.assertEquals(response.status_code, 200)
+            self.assertTrue(len(response.context['object_list']) > 0)
+            counts[url] = len(queries)
+
+        self._add_rows(2, 10)
+        for url in self.urls:
+            with self.assertNumQueries(counts[url]):
+                response = self.c.get(url)
+            self.assertTrue(len(response.context['object_list']) > 2)
+
+
+class UserListRegistrationTestCase(TestCase):
+    c = Client()
+
+    def setUp(self):
+        User.objects.create_user("staff-1", password="pwd-1", is_staff=True)
+        user = User.objects.create_user('new', is_active=False)
+        RegistrationProfile.objects.create_profile(user)
+        self.c.login(username='staff-1', password='pwd-1')
+
+    def test_not_expired(self):
+        response = self.c.get('/staff/user/registration/')
+        self.assertEqual([user.expired for user in response.context['object_list']],
+                         [False])
+        self.assertFalse(response.context['show_delete'])
+
+    def test_expired(self):
+        date_joined = timezone.now() - timezone.timedelta(
+            days=settings.ACCOUNT_ACTIVATION_DAYS)
+        user = User.objects.create_user(
+            'old', is_active=False, date_joined=date_joined)
+        RegistrationProfile.objects.create_profile(user)
+        response = self.c.get('/staff/user/registration/')
+        self.assertEqual([user.expired for user in response.context['object_list']],
+                         [True, False])
+        self.assertTrue(response.context['show_delete'])
+
+    def test_delete_expired(self):
+        date_joined = timezone.now() - timezone.timedelta(
+            days=settings.ACCOUNT_ACTIVATION_DAYS)
+        user = User.objects.create_user(
+            'old', is_active=False, date_joined=date_joined)
+        RegistrationProfile.objects.create_profile(user)
+        response = self.c.post('/staff/user/registration/delete', follow=True)
+        self.assertEquals(response.status_code, 200)
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['Expired user registrations will be deleted shortly'])
+        # the purge is queued for the purge_expired_registrations command
+        self.assertTrue(User.objects.filter(username='old').exists())
+        self.c.post('/staff/user/registration/delete')
+        self.assertEqual(RegistrationPurgeRequest.objects.count(), 1)
+
+        self.assertEqual(run_requested_registration_purge(), 1)
+        self.assertFalse(User.objects.filter(username='old').exists())
+        self.assertFalse(RegistrationPurgeRequest.objects.exists())
+        # nothing to do until the staff ask again
+        self.assertIsNone(run_requested_registration_purge())
+
+
+class StaffListExportTestCase(TestCase):
+    c = Client()
+
+    def setUp(self):
+        User.objects.create_user("staff-1", password="pwd-1", is_staff=True,
+                                 last_name='Aaa', email='staff@example.org')
+        User.objects.bulk_create(
+            [User(username='user-{}'.format(i),
+                  last_name='Name-{:02d}'.format(i // 3))
+             for i in range(20)])
+        owner = User.objects.get(username='staff-1')
+        create_projects([Project(name='project, "{}"'.format(i), owner=owner)
+                         for i in range(3)])
+        self.c.login(username='staff-1', password='pwd-1')
+
+    def test_export_rows(self):
+        queryset = User.objects.all()
+        rows = list(export_rows(queryset, ('last_name', 'id'),
+                                ('username',), batch_size=7))
+        self.assertEqual(
+            rows,
+            list(queryset.order_by('last_name', 'id').values_list('username')))
+
+    def test_csv(self):
+        response = self.c.get('/staff/user/', {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Disposition'].startswith(
+            'attachment; filename="accounts-active-'))
+        content = b''.join(response.streaming_content).decode('utf-8')
+        rows = list(csv.reader(content.splitlines()))
+        self.assertEqual(rows[0], ['id', 'username', 'first_name',
+                                   'last_name', 'email', 'date_joined',
+                                   'last_login', 'is_active', 'is_staff'])
+        self.assertEqual(len(rows), 22)
+        self.assertEqual(rows[1][1:5],
+                         ['staff-1', '', 'Aaa', 'staff@example.org'])
+
+    def test_jsonl(self):
+        response = self.c.get('/staff/project/approval/', {'format': 'jsonl'})
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['name'] for row in rows],
+                         ['project, "0"', 'project, "1"', 'project, "2"'])
+        self.assertEqual(rows[0]['owner_username'], 'staff-1')
+        self.assertEqual(rows[0]['is_active'], False)
+
+    def test_csv_non_ascii(self):
+        User.objects.create_user('user-jose', first_name=u'Jos\xe9',
+                                 last_name=u'Mu\xf1oz')
+        response = self.c.get('/staff/user/', {'format': 'csv'})
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(len(content.splitlines()), 23)
+        self.assertTrue(u',user-jose,Jos\xe9,Mu\xf1oz,,' in content)
+
+    def test_csv_formula(self):
+        User.objects.create_user('user-formula', first_name='=1+1',
+                                 last_name='@SUM(A1)')
+        response = self.c.get('/staff/user/', {'format': 'csv'})
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(",user-formula,'=1+1,'@SUM(A1),," in content)
+        # not in the JSON lines
+        response = self.c.get('/staff/user/', {'format': 'jsonl'})
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue('"first_name": "=1+1"' in content)
+
+    def test_csv_quoting(self):
+        response = self.c.get('/staff/project/approval/', {'format': 'csv'})
+        content = b''.join(response.streaming_content).decode('utf-8')
+        rows = list(csv.reader(content.splitlines()))
+        self.assertEqual(rows[1][1], 'project, "0"')
+
+
+class BulkActionTestCase(TestCase):
+
+    def setUp(self):
+        # a new client each test, so no messages are left over
+        self.c = Client()
+        staff = User.objects.create_user("staff-1", password="pwd-1",
+                                         is_staff=True)
+        for i in range(4):
+            user = User.objects.create_user(
+                'pending-{}'.format(i), is_active=False,
+                email='pending-{}@example.org'.format(i))
+            RegistrationProfile.objects.create_profile(user, activated=True)
+        create_projects([Project(name='project-{}'.format(i), owner=staff)
+                         for i in range(4)])
+        self.c.login(username='staff-1', password='pwd-1')
+
+    def test_approve_users(self):
+        ids = list(User.objects.filter(
+            username__in=['pending-0', 'pending-1']).values_list(
+                'pk', flat=True))
+        response = self.c.post('/staff/user/approval/bulk/',
+                               {'action': 'approve', 'ids': ids}, follow=True)
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['2 account applications approved'])
+        self.assertEqual(
+            set(User.objects.filter(username__startswith='pending',
+                                    is_active=True).
+                values_list('username', flat=True)),
+            {'pending-0', 'pending-1'})
+        # the emails are queued, and sent by the outbox worker
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(OutgoingEmail.objects.values_list('recipients', flat=True)),
+            ['pending-0@example.org', 'pending-1@example.org'])
+        self.assertEqual(send_queued_emails(), (2, 0))
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox),
+                         ['pending-0@example.org', 'pending-1@example.org'])
+        self.assertTrue('approved' in mail.outbox[0].subject)
+
+    def test_reject_users(self):
+        ids = list(User.objects.filter(
+            username__in=['pending-0', 'staff-1']).values_list(
+                'pk', flat=True))
+        response = self.c.post('/staff/user/approval/bulk/',
+                               {'action': 'reject', 'ids': ids}, follow=True)
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['1 account applications rejected'])
+        # only users waiting for approval are rejected
+        self.assertFalse(User.objects.filter(username='pending-0').exists())
+        self.assertTrue(User.objects.filter(username='staff-1').exists())
+
+    def test_approve_projects(self):
+        ids = list(Project.objects.filter(
+            name__in=['project-0', 'project-1']).values_list('pk', flat=True))
+        self.c.post('/staff/project/approval/bulk/',
+                    {'action': 'approve', 'ids': ids})
+        self.assertEqual(
+            set(Project.objects.filter(is_active=True).
+                values_list('name', flat=True)),
+            {'project-0', 'project-1'})
+
+    def test_reject_projects(self):
+        ids = list(Project.objects.filter(
+            name__in=['project-0', 'project-1']).values_list('pk', flat=True))
+        self.c.post('/staff/project/approval/bulk/',
+                    {'action': 'reject', 'ids': ids})
+        self.assertEqual(
+            set(Project.objects.values_list('name', flat=True)),
+            {'project-2', 'project-3'})
+        self.assertFalse(
+            ProjectMembership.objects.filter(project__in=ids).exists())
+
+    def test_nothing_selected(self):
+        response = self.c.post('/staff/project/approval/bulk/',
+                               {'action': 'approve'}, follow=True)
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['Select at least one row and an action'])
+
+    def test_list_checkboxes(self):
+        response = self.c.get('/staff/user/approval/')
+        self.assertContains(response, 'type="checkbox" name="ids"', count=4)
+        response = self.c.get('/staff/user/')
+        self.assertNotContains(response, 'type="checkbox" name="ids"')
+
+
+class UserDeactivateStaleTestCase(TestCase):
+
+    def setUp(self):
+        self.c = Client()
+        User.objects.create_user("staff-1", password="pwd-1", is_staff=True)
+        last_login = timezone.now() - timezone.timedelta(days=1000)
+        User.objects.create_user('stale-1', last_login=last_login)
+        self.c.login(username='staff-1', password='pwd-1')
+
+    def test_deactivate(self):
+        response = self.c.post('/staff/user/stale/deactivate', follow=True)
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['Stale accounts, except for project owners, will be '
+             'deactivated shortly'])
+        # the deactivation is left to the deactivate_stale_users command
+        self.assertTrue(User.objects.get(username='stale-1').is_active)
+        self.assertEqual(StaleUserDeactivationRequest.objects.count(), 1)
+        # asking twice queues a single deactivation
+        self.c.post('/staff/user/stale/deactivate')
+        self.assertEqual(StaleUserDeactivationRequest.objects.count(), 1)
+
+        summary = run_requested_stale_user_deactivation()
+        self.assertEqual(summary['users deactivated'], 1)
+        self.assertFalse(User.objects.get(username='stale-1').is_active)
+        self.assertIsNone(run_requested_stale_user_deactivation())
+
+
+class AccountCountsTestCase(TestCase):
+
+    def setUp(self):
+        self.c = Client()
+        User.objects.create_user("staff-1", password="pwd-1", is_staff=True)
+        last_login = timezone.now() - timezone.timedelta(days=1000)
+        User.objects.create_user('stale-1', last_login=last_login)
+        User.objects.create_user('stale-2', last_login=last_login)
+        User.objects.create_user('deleted-1', is_active=False)
+        user = User.objects.create_user('approval-1', is_active=False)
+        RegistrationProfile.objects.create_profile(user, activated=True)
+        for i in range(3):
+            user = User.objects.create_user(
+                'registration-{}'.format(i), is_active=False)
+            RegistrationProfile.objects.create_profile(user)
+
+    def test_counts(self):
+        with self.assertNumQueries(1):
+            counts = get_account_counts()
+        self.assertEqual(counts, {'approval': 1, 'active': 3, 'stale': 2,
+                                  'deleted': 1, 'staff': 1,
+                                  'registration': 3})
+
+    def test_no_users(self):
+        User.objects.all().delete()
+        self.assertEqual(get_account_counts()['active'], 0)
+
+    def test_badges(self):
+        self.c.login(username='staff-1', password='pwd-1')
+        response = self.c.get('/staff/user/stale/')
+        self.assertEqual([tab[3] for tab in response.context['tabs']],
+                         [1, 3, 2, 1, 1, 3])
+        self.assertContains(response, '<span class="badge">2</span>')
@@ -0,0 +1,145 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+
+import copy
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.utils.six import StringIO
+
+from jenkins_auth.utils import precompile_templates
+
+
+User = get_user_model()
+
+CACHED_TEMPLATES = copy.deepcopy(settings.TEMPLATES)
+CACHED_TEMPLATES[0]['APP_DIRS'] = False
+CACHED_TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+
+class UserRoleTestCase(TestCase):
+
+    def _role(self, user):
+        return Template('{% load jenkins_auth_extras %}{% user_role user %}').\
+            render(Context({'user': user}))
+
+    def test_roles(self):
+        self.assertEqual(self._role(AnonymousUser()), 'anonymous')
+        self.assertEqual(self._role(User(username='u')), 'user')
+        self.assertEqual(self._role(User(username='s', is_staff=True)),
+                         'staff')
+        self.assertEqual(self._role(User(username='a', is_superuser=True)),
+                         'superuser')
+        self.assertEqual(
+            self._role(User(username='b', is_staff=True, is_superuser=True)),
+            'staff-superuser')
+
+
+class FragmentCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.c = Client()
+        User.objects.create_user('staff-1', password='pwd-1', is_staff=True,
+                                 first_name='Staff')
+        User.objects.create_user('user-1', password='pwd-1',
+                                 first_name='Plain')
+
+    def _navbar(self, username):
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(username=username)
+        return render_to_string('navbar.html', request=request)
+
+    def test_navbar_per_role(self):
+        staff = self._navbar('staff-1')
+        self.assertTrue('/staff/search/' in staff)
+        self.assertTrue('Hello Staff' in staff)
+        user = self._navbar('user-1')
+        self.assertFalse('/staff/search/' in user)
+        # the greeting is not cached
+        self.assertTrue('Hello Plain' in user)
+
+    def test_account_tabs_follow_counts(self):
+        self.c.login(username='staff-1', password='pwd-1')
+        response = self.c.get('/staff/user/')
+        self.assertContains(response, '<li class="active"><a href="/staff/user/"')
+        self.assertContains(response, '<span class="badge">2</span>')
+        User.objects.create_user('user-2')
+        response = self.c.get('/staff/user/')
+        self.assertContains(response, '<span class="badge">3</span>')
+        response = self.c.get('/staff/user/staff/')
+        self.assertContains(
+            response, '<li class="active"><a href="/staff/user/staff/"')
+
+
+class PrecompileTemplatesTestCase(TestCase):
+
+    def test_not_cached(self):
+        with override_settings(TEMPLATES=[dict(CACHED_TEMPLATES[0],
+                                               APP_DIRS=True, OPTIONS={})]):
+            self.assertEqual(precompile_templates(), 0)
+
+    def test_cached(self):
+        with override_settings(TEMPLATES=CACHED_TEMPLATES):
+            self.assertTrue(precompile_templates() > 0)
+
+
+class BenchmarkTemplatesTestCase(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('staff-1', is_staff=True)
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_templates', 'staff-1', repeat=2, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 10)
+        self.assertTrue(lines[1].startswith('home '))
+
+    def test_not_staff(self):
+        User.objects.create_user('user-1')
+        self.assertRaises(CommandError, call_command, 'benchmark_templates',
+                          'user-1', stdout=StringIO())
@@ -0,0 +1,251 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+
+import base64
+import time
+
+import django
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import MD5PasswordHasher
+from django.core.cache import cache
+from django.test import Client, RequestFactory, TestCase, override_settings
+
+from jenkins_auth.settings import API_USER, LOGIN_FAILURE_LIMIT, \
+    LOGIN_IP_FAILURE_LIMIT
+from jenkins_auth.throttle import CacheFailureTracker, LocMemFailureTracker, \
+    get_client_ip, get_failure_tracker
+
+
+User = get_user_model()
+
+
+class CountingHasher(MD5PasswordHasher):
+    """
+    Counts the passwords hashed.
+
+    """
+    algorithm = 'counting_md5'
+    hashed = 0
+
+    def encode(self, password, salt):
+        CountingHasher.hashed += 1
+        return super(CountingHasher, self).encode(password, salt)
+
+
+def _basic_auth(username, password):
+    credentials = '{}:{}'.format(username, password).encode('utf-8')
+    return 'Basic {}'.format(base64.b64encode(credentials).decode('ascii'))
+
+
+@override_settings(
+    PASSWORD_HASHERS=['jenkins_auth.test.test_throttle.CountingHasher'])
+class ThrottleViewsTestCase(TestCase):
+
+    def setUp(self):
+        get_failure_tracker().clear()
+        User.objects.create_user(API_USER, password='pwd-1')
+        User.objects.create_user('user-1', password='pwd-1')
+        CountingHasher.hashed = 0
+        self.c = Client()
+
+    def tearDown(self):
+        get_failure_tracker().clear()
+
+    def test_basic_auth_hashing_stops(self):
+        header = _basic_auth('user-1', 'wrong')
+        statuses = [self.c.get('/user/user-1',
+                               HTTP_AUTHORIZATION=header).status_code
+                    for _ in range(LOGIN_FAILURE_LIMIT * 3)]
+        self.assertEqual(statuses,
+                         [401] * LOGIN_FAILURE_LIMIT +
+                         [429] * LOGIN_FAILURE_LIMIT * 2)
+        # no password was hashed once the limit was reached
+        self.assertEqual(CountingHasher.hashed, LOGIN_FAILURE_LIMIT)
+        # the right password is refused too
+        response = self.c.get('/user/user-1',
+                              HTTP_AUTHORIZATION=_basic_auth('user-1', 'pwd-1'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(get_failure_tracker().metrics(),
+                         {'allowed': LOGIN_FAILURE_LIMIT,
+                          'blocked': LOGIN_FAILURE_LIMIT * 2 + 1,
+                          'failures': LOGIN_FAILURE_LIMIT})
+
+    def test_api_user_not_locked(self):
+        """
+        Failures for the API user from one address do not lock it out for
+        Jenkins, which logs in from another.
+
+        """
+        header = _basic_auth(API_USER, 'wrong')
+        statuses = [self.c.get('/user/user-1', HTTP_AUTHORIZATION=header,
+                               REMOTE_ADDR='10.0.0.1').status_code
+                    for _ in range(LOGIN_IP_FAILURE_LIMIT + 1)]
+        # only the address limit applies
+        self.assertEqual(statuses,
+                         [401] * LOGIN_IP_FAILURE_LIMIT + [429])
+        response = self.c.get('/user/user-1',
+                              HTTP_AUTHORIZATION=_basic_auth(API_USER, 'pwd-1'),
+                              REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    def test_basic_auth_success_resets(self):
+        for _ in range(LOGIN_FAILURE_LIMIT - 1):
+            self.c.get('/user/user-1',
+                       HTTP_AUTHORIZATION=_basic_auth('user-1', 'wrong'))
+        response = self.c.get('/user/user-1',
+                              HTTP_AUTHORIZATION=_basic_auth('user-1', 'pwd-1'))
+        # logged in, though only the API user may read the roles
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(get_failure_tracker().is_blocked('user-1', None))
+
+    def test_login_hashing_stops(self):
+        for _ in range(LOGIN_FAILURE_LIMIT * 2):
+            response = self.c.post('/accounts/login/',
+                                   {'username': 'user-1', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 429)
+        self.assertContains(response, 'Too many failed logins', status_code=429)
+        self.assertEqual(CountingHasher.hashed, LOGIN_FAILURE_LIMIT)
+
+    def test_login_success_resets(self):
+        for _ in range(LOGIN_FAILURE_LIMIT - 1):
+            self.c.post('/accounts/login/',
+                        {'username': 'user-1', 'password': 'wrong'})
+        response = self.c.post('/accounts/login/',
+                               {'username': 'user-1', 'password': 'pwd-1'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(get_failure_tracker().is_blocked('user-1', None))
+
+    def test_address_limit(self):
+        # a different username each time, so only the address limit applies
+        for i in range(LOGIN_IP_FAILURE_LIMIT):
+            self.c.post('/accounts/login/',
+                        {'username': 'user-{}'.format(i), 'password': 'wrong'})
+        hashed = CountingHasher.hashed
+        response = self.c.post('/accounts/login/',
+                               {'username': 'other', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(CountingHasher.hashed, hashed)
+
+
+class GetClientIpTestCase(TestCase):
+
+    def test_remote_addr(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1',
+                                       HTTP_X_FORWARDED_FOR='10.0.0.2')
+        self.assertEqual(get_client_ip(request, None), '10.0.0.1')
+
+    def test_proxy_header(self):
+        # the client sent the first address, the proxy added the last
+        request = RequestFactory().get(
+            '/', REMOTE_ADDR='10.0.0.1',
+            HTTP_X_FORWARDED_FOR='10.0.0.3, 10.0.0.2')
+        self.assertEqual(
+            get_client_ip(request, 'HTTP_X_FORWARDED_FOR'), '10.0.0.2')
+        # not sent through the proxy
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(
+            get_client_ip(request, 'HTTP_X_FORWARDED_FOR'), '10.0.0.1')
+
+
+class LoginThrottlePageTestCase(TestCase):
+    c = Client()
+
+    def setUp(self):
+        get_failure_tracker().clear()
+        User.objects.create_user('staff-1', password='pwd-1', is_staff=True)
+        User.objects.create_user('user-1', password='pwd-1')
+
+    def tearDown(self):
+        get_failure_tracker().clear()
+
+    def test_metrics(self):
+        tracker = get_failure_tracker()
+        tracker.is_blocked('user-2', '10.0.0.1')
+        tracker.add_failure('user-2', '10.0.0.1')
+        self.c.login(username='staff-1', password='pwd-1')
+        response = self.c.get('/staff/throttle/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['metrics'],
+                         [('allowed', 1), ('blocked', 0), ('failures', 1)])
+
+    def test_not_staff(self):
+        self.c.login(username='user-1', password='pwd-1')
+        response = self.c.get('/staff/throttle/')
+        self.assertNotEqual(response.status_code, 200)
+
+
+class FailureTrackerTestCase(TestCase):
+
+    def _check(self, tracker):
+        for _ in range(2):
+            self.assertFalse(tracker.is_blocked('user-1', '10.0.0.1'))
+            tracker.add_failure('user-1', '10.0.0.1')
+        self.assertTrue(tracker.is_blocked('user-1', '10.0.0.2'))
+        self.assertFalse(tracker.is_blocked('user-2', '10.0.0.2'))
+        tracker.add_failure('user-2', '10.0.0.1')
+        # three failures from the address
+        self.assertTrue(tracker.is_blocked('user-3', '10.0.0.1'))
+        tracker.reset('user-1')
+        self.assertFalse(tracker.is_blocked('user-1', '10.0.0.2'))
+        # the failures slide out of the window
+        time.sleep(0.25)
+        self.assertFalse(tracker.is_blocked('user-3', '10.0.0.1'))
+
+    def test_locmem(self):
+        self._check(LocMemFailureTracker(user_limit=2, ip_limit=3,
+                                         window=0.2))
+
+    def test_locmem_prune(self):
+        tracker = LocMemFailureTracker(user_limit=2, ip_limit=3, window=0.1)
+        tracker.MAX_KEYS = 2
+        tracker.add_failure('user-1', None)
+        time.sleep(0.15)
+        tracker.add_failure('user-2', None)
+        tracker.add_failure('user-3', None)
+        self.assertEqual(sorted(tracker._failures),
+                         ['user:user-2', 'user:user-3'])
+
+    def test_non_ascii_username(self):
+        cache.clear()
+        for tracker in (LocMemFailureTracker(user_limit=1),
+                        CacheFailureTracker(user_limit=1)):
+            tracker.add_failure(u'jos\xe9', None)
+            self.assertTrue(tracker.is_blocked(u'jos\xe9', None))
+            tracker.reset(u'jos\xe9')
+            self.assertFalse(tracker.is_blocked(u'jos\xe9', None))
+
+    def test_cache(self):
+        cache.clear()
+        tracker = CacheFailureTracker(user_limit=2, ip_limit=3, window=0.2)
+        self._check(tracker)
+        self.assertEqual(tracker.metrics()['failures'], 3)
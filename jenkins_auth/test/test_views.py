@@ -33,11 +33,16 @@ import django
 django.setup()
 
 
+from django.apps import apps
+from django.db import connection
 from django.test import Client
+from django.test import RequestFactory
 from django.test import TestCase
-from jenkins_auth.models import JenkinsUserProfile
+from jenkins_auth.models import JenkinsUserProfile, Project, ProjectMembership
 from django.contrib.auth import get_user_model
+from jenkins_auth.signals import create_search_index
 from jenkins_auth.test.helper import get_template_names
+from jenkins_auth.views import ProjectCreate
 
 
 User = get_user_model()
@@ -327,6 +332,26 @@ class ProjectTestCase(TestCase):
         self.assertTrue(
             'jenkins_auth/project_form.html' in get_template_names(response.templates))
 
+    def test_create_project_name_taken(self):
+        """The name is taken by another request after the form is checked"""
+        view = ProjectCreate()
+        view.request = RequestFactory().post(
+            '/project/add/',
+            {'name': 'proj 1', 'description': 'my first project'})
+        view.request.user = User.objects.get(username='user-1')
+        view.args = ()
+        view.kwargs = {}
+        view.object = None
+        form = view.get_form()
+        self.assertTrue(form.is_valid())
+        Project.objects.create(
+            name='proj 1', owner_id=User.objects.get(username='user-2').pk)
+        response = view.form_valid(form)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(form.errors['name'],
+                          ['This project name has already been taken.'])
+        self.assertEquals(Project.objects.count(), 1)
+
     def test_create_project_description_too_long(self):
         response = self.c.post(
             '/project/add/',
@@ -375,10 +400,12 @@ class ProjectTestCase(TestCase):
                      'user_users': User.objects.get(username='user-3').id})
         response = self.c.get('/project/1/')
         self.assertEquals(
-            response.context['project'].admins.user_set.first().username,
+            response.context['project'].get_members(
+                ProjectMembership.ADMIN).first().username,
             'user-2')
         self.assertEquals(
-            response.context['project'].users.user_set.first().username,
+            response.context['project'].get_members(
+                ProjectMembership.USER).first().username,
             'user-3')
 
     def test_get_project_admin_access(self):
@@ -411,6 +438,30 @@ class ProjectTestCase(TestCase):
         self.assertTrue(
             'jenkins_auth/project_detail.html' in get_template_names(response.templates))
 
+    def test_get_project_flags(self):
+        # create project
+        self.c.post(
+            '/project/add/', {'name': 'proj 1', 'description': 'my first project'})
+        # add admin and user privileges
+        self.c.post('/project/1/update/',
+                    {'admin_users': User.objects.get(username='user-2').id,
+                     'user_users': User.objects.get(username='user-3').id})
+        response = self.c.get('/project/1/')
+        self.assertTrue(response.context['is_owner'])
+        self.assertTrue(response.context['is_admin'])
+        self.c.login(username='user-2', password='pwd-2')
+        response = self.c.get('/project/1/')
+        self.assertFalse(response.context['is_owner'])
+        self.assertTrue(response.context['is_admin'])
+        self.assertEquals(
+            [u.username for u in response.context['admin_page']], ['user-2'])
+        self.c.login(username='user-3', password='pwd-3')
+        response = self.c.get('/project/1/')
+        self.assertFalse(response.context['is_owner'])
+        self.assertFalse(response.context['is_admin'])
+        self.assertEquals(
+            [u.username for u in response.context['user_page']], ['user-3'])
+
     def test_get_project_unauthorised_access(self):
         # create project
         self.c.post(
@@ -535,3 +586,68 @@ class ProjectTestCase(TestCase):
         self.assertTrue(
             'jenkins_auth/home.html' in get_template_names(response.templates))
         self.assertTrue(self.MESSAGE_2 in str(response.content))
+
+
+class ProjectUserSearchTestCase(TestCase):
+    c = Client()
+
+    def setUp(self):
+        User.objects.create_user(
+            "user-1", password="pwd-1", first_name="Ann", last_name="Smith")
+        User.objects.create_user(
+            "user-2", password="pwd-2", first_name="Bob", last_name="Smithers",
+            email="bob@example.org")
+        User.objects.create_user(
+            "user-3", password="pwd-3", first_name="Cat", last_name="Jones",
+            is_active=False)
+        self.c.login(username='user-1', password='pwd-1')
+
+    def test_search(self):
+        response = self.c.get('/project/users/', {'q': 'smi'})
+        self.assertEquals(response.status_code, 200)
+        data = response.json()
+        self.assertEquals(
+            [u['text'] for u in data['results']],
+            ['Ann Smith (id:{})'.format(User.objects.get(username='user-1').id),
+             'Bob Smithers (id:{})'.format(User.objects.get(username='user-2').id)])
+        self.assertFalse(data['more'])
+
+    def test_search_words(self):
+        response = self.c.get('/project/users/', {'q': 'smi bob'})
+        self.assertEquals(len(response.json()['results']), 1)
+
+    def test_search_email(self):
+        """Only the staff can search on the email"""
+        response = self.c.get('/project/users/', {'q': 'example.org'})
+        self.assertEquals(response.json()['results'], [])
+        User.objects.filter(username='user-1').update(is_staff=True)
+        response = self.c.get('/project/users/', {'q': 'example.org'})
+        self.assertEquals(len(response.json()['results']), 1)
+
+    def test_search_existing_users(self):
+        """Users saved before the search index was created are found"""
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE jenkins_auth_search')
+        create_search_index(sender=apps.get_app_config('jenkins_auth'))
+        response = self.c.get('/project/users/', {'q': 'smi'})
+        self.assertEquals(len(response.json()['results']), 2)
+
+    def test_search_non_ascii(self):
+        user = User.objects.create_user(
+            "user-4", first_name=u"Jos\xe9", last_name=u"Mu\xf1oz")
+        response = self.c.get('/project/users/', {'q': u'jos\xe9'})
+        self.assertEquals(
+            [u['text'] for u in response.json()['results']],
+            [u'Jos\xe9 Mu\xf1oz (id:{})'.format(user.id)])
+
+    def test_search_inactive(self):
+        response = self.c.get('/project/users/', {'q': 'jones'})
+        self.assertEquals(response.json()['results'], [])
+
+    def test_update_form_renders_members_only(self):
+        self.c.post(
+            '/project/add/', {'name': 'proj 1', 'description': 'my first project'})
+        response = self.c.get('/project/1/update/')
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue('Ann Smith' in str(response.content))
+        self.assertFalse('Bob Smithers' in str(response.content))
@@ -0,0 +1,291 @@
+'''
+BSD Licence
+Copyright (c) 2017, Science & Technology Facilities Council (STFC)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+    * Redistributions of source code must retain the above copyright notice,
+        this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice,
+        this list of conditions and the following disclaimer in the
+        documentation and/or other materials provided with the distribution.
+    * Neither the name of the Science & Technology Facilities Council (STFC)
+        nor the names of its contributors may be used to endorse or promote
+        products derived from this software without specific prior written
+        permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+from collections import Counter, deque
+import hashlib
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.utils.encoding import force_bytes
+from django.utils.module_loading import import_string
+
+from jenkins_auth.settings import API_USER, LOGIN_THROTTLE_BACKEND, \
+    LOGIN_FAILURE_LIMIT, LOGIN_IP_FAILURE_LIMIT, LOGIN_FAILURE_WINDOW, \
+    LOGIN_THROTTLE_IP_HEADER
+
+
+LOGGER = logging.getLogger(__name__)
+
+# the names of the counters returned by FailureTracker.metrics
+METRICS = ('allowed', 'blocked', 'failures')
+
+_tracker = None
+
+
+def get_failure_tracker():
+    """
+    @return (FailureTracker) the tracker named in the LOGIN_THROTTLE_BACKEND
+        setting
+
+    """
+    global _tracker
+    if _tracker is None:
+        _tracker = import_string(LOGIN_THROTTLE_BACKEND)()
+    return _tracker
+
+
+def get_client_ip(request, header=LOGIN_THROTTLE_IP_HEADER):
+    """
+    Get the address of the client. Behind a proxy this is read from the
+    header the proxy sets, see LOGIN_THROTTLE_IP_HEADER. A header such as
+    X-Forwarded-For may list several addresses, the last is the one added by
+    the proxy, the others were sent by the client so may be forged.
+
+    @param request (HttpRequest) the request
+    @param header (str) the key in request.META of the header holding the
+        address, or None to use the address seen by the web server
+
+    @return (str) the address of the client
+
+    """
+    if header:
+        address = request.META.get(header, '').split(',')[-1].strip()
+        if address:
+            return address
+    return request.META.get('REMOTE_ADDR')
+
+
+class FailureTracker(object):
+    """
+    Counts the failed logins for each username, and for each client address,
+    over a sliding window of LOGIN_FAILURE_WINDOW seconds.
+
+    Callers check is_blocked before checking the password, so that once a
+    username or an address has reached its limit no more time is spent
+    hashing passwords for it until the older failures drop out of the window.
+    A successful login clears the failures of the username, but not of the
+    address.
+
+    The usernames in exempt_usernames, by default the API_USER that Jenkins
+    logs in with, are only limited by address. Otherwise anyone could cut
+    Jenkins off from the API by sending wrong passwords for it.
+
+    Sub classes store the times of the failures, at most limit of them per
+    username or address.
+
+    """
+
+    def __init__(self, user_limit=LOGIN_FAILURE_LIMIT,
+                 ip_limit=LOGIN_IP_FAILURE_LIMIT,
+                 window=LOGIN_FAILURE_WINDOW, exempt_usernames=(API_USER,)):
+        self.user_limit = user_limit
+        self.ip_limit = ip_limit
+        self.window = window
+        self.exempt_usernames = frozenset(exempt_usernames)
+
+    def is_blocked(self, username, ip):
+        """
+        @param username (str) the username being logged in with
+        @param ip (str) the address of the client
+
+        @return (bool) True if either has failed too often recently
+
+        """
+        now = time.time()
+        for key, limit in self._keys(username, ip):
+            if len(self._recent(key, now)) >= limit:
+                self._incr('blocked')
+                return True
+        self._incr('allowed')
+        return False
+
+    def add_failure(self, username, ip):
+        """
+        Record a failed login.
+
+        @param username (str) the username being logged in with
+        @param ip (str) the address of the client
+
+        """
+        now = time.time()
+        for key, limit in self._keys(username, ip):
+            self._add(key, now, limit)
+            if len(self._recent(key, now)) == limit:
+                LOGGER.warning('Logins for %s blocked after %s failures',
+                               key, limit)
+        self._incr('failures')
+
+    def reset(self, username):
+        """
+        Forget the failures of a username, after a successful login.
+
+        @param username (str) the username
+
+        """
+        self._clear(u'user:{}'.format(username))
+
+    def metrics(self):
+        """
+        @return (dict) the number of logins allowed to check the password,
+            the number blocked, and the number of failures recorded
+
+        """
+        raise NotImplementedError
+
+    def _keys(self, username, ip):
+        keys = []
+        if username and username not in self.exempt_usernames:
+            keys.append((u'user:{}'.format(username), self.user_limit))
+        if ip:
+            keys.append(('ip:{}'.format(ip), self.ip_limit))
+        return keys
+
+    def _recent(self, key, now):
+        """
+        @return (list) the times of the failures for the key within the
+            window
+
+        """
+        raise NotImplementedError
+
+    def _add(self, key, now, limit):
+        raise NotImplementedError
+
+    def _clear(self, key):
+        raise NotImplementedError
+
+    def _incr(self, metric):
+        raise NotImplementedError
+
+
+class LocMemFailureTracker(FailureTracker):
+    """
+    Keeps the failures in the memory of the process. Only suitable when the
+    site is served by a single process.
+
+    """
+    # keys whose failures have all expired are dropped when there are more
+    # than this many
+    MAX_KEYS = 10000
+
+    def __init__(self, *args, **kwargs):
+        super(LocMemFailureTracker, self).__init__(*args, **kwargs)
+        self._failures = {}
+        self._metrics = Counter()
+        self._lock = threading.Lock()
+
+    def metrics(self):
+        with self._lock:
+            return dict((metric, self._metrics[metric]) for metric in METRICS)
+
+    def clear(self):
+        """
+        Forget all of the failures and reset the metrics.
+
+        """
+        with self._lock:
+            self._failures.clear()
+            self._metrics.clear()
+
+    def _recent(self, key, now):
+        with self._lock:
+            failures = self._failures.get(key)
+            if not failures:
+                return []
+            while failures and failures[0] <= now - self.window:
+                failures.popleft()
+            return list(failures)
+
+    def _add(self, key, now, limit):
+        with self._lock:
+            if key not in self._failures and (
+                    len(self._failures) >= self.MAX_KEYS):
+                self._prune(now)
+            self._failures.setdefault(key, deque(maxlen=limit)).append(now)
+
+    def _prune(self, now):
+        for key in [key for key, failures in self._failures.items()
+                    if not failures or failures[-1] <= now - self.window]:
+            del self._failures[key]
+
+    def _clear(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+    def _incr(self, metric):
+        with self._lock:
+            self._metrics[metric] += 1
+
+
+class CacheFailureTracker(FailureTracker):
+    """
+    Keeps the failures in the default cache, so that they are shared by all
+    of the processes when a shared cache (memcached, database, ...) is
+    configured in CACHES.
+
+    Updates are not atomic, two processes recording a failure for the same
+    key at the same moment may only record one of them.
+
+    """
+    KEY = 'jenkins_auth.login_failures.{}'
+    METRIC_KEY = 'jenkins_auth.login_throttle.{}'
+
+    def metrics(self):
+        values = cache.get_many([self.METRIC_KEY.format(metric)
+                                 for metric in METRICS])
+        return dict((metric, values.get(self.METRIC_KEY.format(metric), 0))
+                    for metric in METRICS)
+
+    def _cache_key(self, key):
+        # usernames may hold characters that memcached does not allow
+        return self.KEY.format(hashlib.sha1(force_bytes(key)).hexdigest())
+
+    def _recent(self, key, now):
+        return [failure for failure in cache.get(self._cache_key(key), [])
+                if failure > now - self.window]
+
+    def _add(self, key, now, limit):
+        failures = (self._recent(key, now) + [now])[-limit:]
+        cache.set(self._cache_key(key), failures, self.window)
+
+    def _clear(self, key):
+        cache.delete(self._cache_key(key))
+
+    def _incr(self, metric):
+        key = self.METRIC_KEY.format(metric)
+        # add does nothing if the counter already exists
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # the counter was evicted between the add and the incr
+            cache.set(key, 1, None)
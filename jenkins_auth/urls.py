@@ -45,7 +45,6 @@ Including another URLconf
 from django.conf.urls import include, url
 from django.contrib import admin
 from django.views.generic.base import TemplateView
-from django.views.i18n import JavaScriptCatalog
 
 from jenkins_auth.api.views import Role
 from jenkins_auth.settings import DEBUG
@@ -53,11 +52,12 @@ from jenkins_auth.staff.views import ProjectDelete as StaffProjectDelete
 from jenkins_auth.staff.views import UserList, UserListStale, UserListRegistration, \
     UserListDeleted, UserListStaff, ProjectList, ProjectListApproval, \
     ProjectDetail, UserDetail, UserListApproval, UserDelete, UserReject, ProjectReject, \
-    UserDeleteExpiredRegistrations, UserApprove, ProjectApprove
+    UserDeleteExpiredRegistrations, UserApprove, ProjectApprove, Search, \
+    UserBulkAction, ProjectBulkAction, UserDeactivateStale, LoginThrottle
 from jenkins_auth.staff_admin.views import ToggleStaffStatus
 from jenkins_auth.views import Home, Profile, ProfileUpdate, ProfileDelete, ProjectCreate, \
     ProjectUpdate, ProjectDelete, ProjectView, TermsOfService, Shibboleth, \
-    ShibbolethUserRegistration, Login, ActivationView
+    ShibbolethUserRegistration, Login, ActivationView, ProjectUserSearch
 
 
 urlpatterns = [
@@ -98,11 +98,10 @@ urlpatterns = [
         ToggleStaffStatus.as_view(), name='admin_toggle_staff'),
     url(r'^admin/', include(admin.site.urls)),
 
-    # needed for the FilteredSelectMultiple
-    url(r'^jsi18n/$', JavaScriptCatalog.as_view(), name='javascript-catalog'),
-
     # User project pages
     url(r'^project/add/$', ProjectCreate.as_view(), name='project-add'),
+    url(r'^project/users/$', ProjectUserSearch.as_view(),
+        name='project-user-search'),
     url(r'^project/(?P<pk>[0-9]+)/$',
         ProjectView.as_view(), name='project-detail'),
     url(r'^project/(?P<pk>[0-9]+)/update/$',
@@ -134,6 +133,10 @@ urlpatterns = [
     url(r'^staff/user/registration/delete$',
         UserDeleteExpiredRegistrations.as_view(),
         name='staff_user_registration_delete'),
+    url(r'^staff/user/stale/deactivate$', UserDeactivateStale.as_view(),
+        name='staff_user_stale_deactivate'),
+    url(r'^staff/user/approval/bulk/$', UserBulkAction.as_view(),
+        name='staff_user_bulk'),
 
 
     # Staff access to projects
@@ -149,6 +152,16 @@ urlpatterns = [
     url(r'^staff/project/(?P<pk>[0-9]+)/reject/$',
         ProjectReject.as_view(), name='staff_project_reject'),
 
+    url(r'^staff/project/approval/bulk/$', ProjectBulkAction.as_view(),
+        name='staff_project_bulk'),
+
+    # Staff search
+    url(r'^staff/search/$', Search.as_view(), name='staff_search'),
+
+    # Staff view of the login throttle
+    url(r'^staff/throttle/$', LoginThrottle.as_view(),
+        name='staff_login_throttle'),
+
     # Terms of service
     url(r'^tos/$', TermsOfService.as_view(), name='tos'),
 
@@ -28,15 +28,46 @@ ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 '''
+from collections import Counter
+from importlib import import_module
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
 from django.contrib.sites.shortcuts import get_current_site
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import router, transaction
+from django.db.models import Case, Count, IntegerField, Q, Sum, When
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders.cached import Loader as CachedLoader
+from django.template.utils import get_app_template_dirs
+from django.utils import timezone
+
+from jenkins_auth.backends import invalidate_project_permissions
+from jenkins_auth.middleware import invalidate_shib_users
+from jenkins_auth.models import (JenkinsUser, JenkinsUserProfile,
+                                 OwnedProjectCount, Project,
+                                 ProjectMembership, RegistrationProfile,
+                                 RegistrationPurgeRequest, StaffNotification,
+                                 StaleUserDeactivationRequest)
+from jenkins_auth.search import get_search_backend
+from jenkins_auth.settings import ACCOUNT_EXPIRATION_DAYS, ADMIN_USER, API_USER
+from jenkins_auth.signals import project_members_changed
+
+
+LOGGER = logging.getLogger(__name__)
 
-from jenkins_auth.models import RegistrationProfile
+# The number of members of a project role to display on a page
+MEMBER_PAGE_SIZE = 50
 
 
 def logically_delete_user(user):
     """
-    Delete a users registration profile, remove the user from all groups, remove
-    all permissions and logically delete the user.
+    Delete a users registration profile, remove the user from all groups and
+    projects, remove all permissions and logically delete the user.
 
     """
     try:
@@ -46,26 +77,434 @@ def logically_delete_user(user):
         pass
     user.groups.clear()
     user.user_permissions.clear()
+    ProjectMembership.objects.filter(user=user).delete()
     user.is_staff = False
     user.is_superuser = False
     # logically delete the user
     user.is_active = False
     user.save()
+    invalidate_project_permissions([user.pk])
+
+
+def get_stale_users(days=ACCOUNT_EXPIRATION_DAYS):
+    """
+    @param days (int) the number of days without a login after which an
+        account is stale
+
+    @return (QuerySet) the active users that have not logged in for days
+
+    """
+    old_date = timezone.now() - timezone.timedelta(days=days)
+    return (JenkinsUser.objects.filter(is_active=True).
+            filter(last_login__lte=old_date).
+            exclude(username=API_USER).
+            exclude(username=ADMIN_USER))
+
+
+def get_account_counts():
+    """
+    Count the accounts in each of the staff account lists, with one
+    conditional aggregation query.
+
+    @return (dict) the number of accounts keyed on 'approval', 'active',
+        'stale', 'deleted', 'staff' and 'registration'
+
+    """
+    old_date = timezone.now() - timezone.timedelta(
+        days=ACCOUNT_EXPIRATION_DAYS)
+    active = (Q(is_active=True) & ~Q(username=API_USER) &
+              ~Q(username=ADMIN_USER))
+    conditions = {
+        'approval': Q(registrationprofile__activated=True, is_active=False),
+        'active': active,
+        'stale': active & Q(last_login__lte=old_date),
+        'deleted': Q(is_active=False, registrationprofile__isnull=True),
+        'staff': active & Q(is_staff=True),
+        'registration': Q(registrationprofile__activated=False),
+    }
+    counts = JenkinsUser.objects.aggregate(**dict(
+        (name, Sum(Case(When(condition, then=1), default=0,
+                        output_field=IntegerField())))
+        for name, condition in conditions.items()))
+    # Sum is None when there are no users at all
+    return dict((name, count or 0) for name, count in counts.items())
+
+
+def deactivate_stale_users(days=ACCOUNT_EXPIRATION_DAYS, batch_size=500,
+                           progress=None):
+    """
+    Logically delete the stale users, as logically_delete_user does, except
+    for those that own a project.
+
+    The users are selected in primary key order, batch_size at a time. For
+    each batch the registration profiles, group and project memberships and
+    user permissions are removed with one delete each and the users are
+    deactivated with one update, in a single short transaction.
+
+    @param days (int) the number of days without a login after which an
+        account is stale
+    @param batch_size (int) the number of users deactivated per transaction
+    @param progress (function) if given, called with the summary after each
+        batch
+
+    @return (Counter) a summary of what was done
+
+    """
+    stale = get_stale_users(days)
+    summary = Counter()
+    summary['project owners skipped'] = (
+        stale.filter(project_owner__isnull=False).distinct().count())
+    membership = JenkinsUser.groups.through
+    permission = JenkinsUser.user_permissions.through
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            user_ids = list(stale.filter(pk__gt=last_pk).
+                            filter(project_owner__isnull=True).
+                            order_by('pk').
+                            values_list('pk', flat=True)[:batch_size])
+            if not user_ids:
+                break
+            last_pk = user_ids[-1]
+            RegistrationProfile.objects.filter(user__in=user_ids).delete()
+            # these do not send m2m_changed
+            summary['group memberships removed'] += (
+                membership.objects.filter(user__in=user_ids).delete()[0])
+            summary['project memberships removed'] += (
+                ProjectMembership.objects.filter(user__in=user_ids).
+                delete()[0])
+            summary['user permissions removed'] += (
+                permission.objects.filter(user__in=user_ids).delete()[0])
+            summary['users deactivated'] += (
+                JenkinsUser.objects.filter(pk__in=user_ids).update(
+                    is_active=False, is_staff=False, is_superuser=False))
+            invalidate_project_permissions(user_ids)
+        if progress is not None:
+            progress(summary)
+    LOGGER.info('Deactivated stale users: %s', ', '.join(
+        '{} {}'.format(count, name)
+        for name, count in sorted(summary.items())))
+    return summary
+
+
+def delete_users(users):
+    """
+    Delete users, except for those that own a project, with one delete per
+    table. Model.delete() would load the users and their profiles and run
+    the post_delete receivers one user at a time, so instead the rows that
+    refer to the users are deleted directly, and the search index entries and
+    cached details of the users are removed in bulk.
+
+    Should be called in a transaction.
+
+    @param users (QuerySet) the users to delete
+
+    @return (int) the number of users deleted
+
+    """
+    usernames = dict(users.filter(project_owner__isnull=True).
+                     values_list('pk', 'username'))
+    if not usernames:
+        return 0
+    user_ids = list(usernames)
+    # every table with a foreign key to the user, see the test of this
+    for model in (JenkinsUser.groups.through,
+                  JenkinsUser.user_permissions.through, JenkinsUserProfile,
+                  LogEntry, OwnedProjectCount, ProjectMembership,
+                  RegistrationProfile, StaffNotification):
+        model.objects.filter(user__in=user_ids)._raw_delete(
+            router.db_for_write(model))
+    deleted = JenkinsUser.objects.filter(pk__in=user_ids)._raw_delete(
+        router.db_for_write(JenkinsUser))
+    get_search_backend().remove_users(user_ids)
+    invalidate_shib_users(usernames.values())
+    invalidate_project_permissions(user_ids)
+    return deleted
+
+
+def create_project(project):
+    """
+    Create a project, make the owner an admin of it and add it to the count
+    of projects they own. Either everything is created or, if an
+    IntegrityError is raised, nothing is.
+
+    @param project (Project) an unsaved project with name and owner set
+
+    """
+    with transaction.atomic():
+        project.save()
+        ProjectMembership.objects.create(
+            project=project, user_id=project.owner_id,
+            role=ProjectMembership.ADMIN)
+        OwnedProjectCount.objects.adjust({project.owner_id: 1})
+    invalidate_project_permissions([project.owner_id])
+
+
+def create_projects(projects):
+    """
+    Create many projects in a single transaction using bulk inserts.
+    The number of queries does not depend on the number of projects, only on
+    the number of owners.
+
+    @param projects (list) unsaved projects with name and owner set
+
+    """
+    names = [project.name for project in projects]
+    with transaction.atomic():
+        Project.objects.bulk_create(projects)
+        # bulk_create does not set the primary key on every database
+        project_ids = dict(Project.objects.filter(name__in=names).
+                           values_list('name', 'id'))
+        ProjectMembership.objects.bulk_create([
+            ProjectMembership(project_id=project_ids[project.name],
+                              user_id=project.owner_id,
+                              role=ProjectMembership.ADMIN)
+            for project in projects])
+        OwnedProjectCount.objects.adjust(
+            Counter(project.owner_id for project in projects))
+        # bulk_create does not send post_save
+        get_search_backend().index_projects(
+            Project.objects.filter(name__in=names))
+    invalidate_project_permissions(
+        set(project.owner_id for project in projects))
 
 
 def delete_project(project):
     """
-    Delete a project.
+    Delete a project, its memberships are deleted by the cascade.
 
     """
-    # delete the foreign objects
-    project.users.delete()
-    project.admins.delete()
-    try:
-        # the project should have been delete with the cascade
+    member_ids = set(project.memberships.values_list('user_id', flat=True))
+    with transaction.atomic():
         project.delete()
-    except AttributeError:
-        pass
+        OwnedProjectCount.objects.adjust({project.owner_id: -1})
+    invalidate_project_permissions(member_ids)
+
+
+def delete_projects(project_ids):
+    """
+    Delete many projects with one set based delete, their memberships are
+    deleted by the cascade.
+
+    @param project_ids (list) the ids of the projects to delete
+
+    """
+    member_ids = set(ProjectMembership.objects.
+                     filter(project__in=project_ids).
+                     values_list('user_id', flat=True))
+    with transaction.atomic():
+        projects = Project.objects.filter(pk__in=project_ids)
+        owners = Counter(projects.values_list('owner_id', flat=True))
+        projects.delete()
+        OwnedProjectCount.objects.adjust(
+            dict((owner_id, -count) for owner_id, count in owners.items()))
+    invalidate_project_permissions(member_ids)
+
+
+def check_owned_project_counts(repair=False):
+    """
+    Compare the stored number of projects owned by each user with the number
+    of projects, see OwnedProjectCount.
+
+    When repairing, each wrong count is locked, counted again and saved in
+    its own short transaction, so a project created or deleted since the
+    comparison is not missed.
+
+    @param repair (bool) if True the wrong counts are corrected
+
+    @return (dict) user id mapped to (stored count, actual count) for each
+        count that was wrong
+
+    """
+    actual = dict(Project.objects.order_by().values_list('owner').
+                  annotate(Count('pk')))
+    stored = dict(OwnedProjectCount.objects.values_list('user_id', 'count'))
+    wrong = dict(
+        (user_id, (stored.get(user_id, 0), actual.get(user_id, 0)))
+        for user_id in set(actual) | set(stored)
+        if stored.get(user_id, 0) != actual.get(user_id, 0))
+    if repair:
+        for user_id in wrong:
+            with transaction.atomic():
+                list(OwnedProjectCount.objects.select_for_update().
+                     filter(user_id=user_id))
+                OwnedProjectCount.objects.update_or_create(
+                    user_id=user_id,
+                    defaults={'count': Project.objects.filter(
+                        owner_id=user_id).count()})
+        LOGGER.info('Repaired the owned project counts of %s users',
+                    len(wrong))
+    return wrong
+
+
+def set_project_members(project, admin_ids, user_ids, batch_size=500):
+    """
+    Set the admins and users of a project.
+
+    Only the differences between the current and the new members are written.
+    The current members in both roles are read with one query, new members
+    are added with one bulk insert and old members removed with a filtered
+    delete per role and batch_size users, so that a delete stays under the
+    SQLite limit of 999 parameters, all in a single transaction.
+    project_members_changed is then sent once.
+
+    @param project (Project) the project
+    @param admin_ids (iterable) the ids of the users to make admins
+    @param user_ids (iterable) the ids of the users to make users
+    @param batch_size (int) the number of members removed per query
+
+    """
+    wanted = {ProjectMembership.ADMIN: set(admin_ids),
+              ProjectMembership.USER: set(user_ids)}
+    current = dict((role, set()) for role in wanted)
+
+    with transaction.atomic():
+        rows = (ProjectMembership.objects.
+                filter(project=project).
+                values_list('role', 'user_id'))
+        for role, user_id in rows:
+            current[role].add(user_id)
+
+        added = {}
+        removed = {}
+        new_rows = []
+        for role in wanted:
+            added[role] = wanted[role] - current[role]
+            removed[role] = current[role] - wanted[role]
+            new_rows.extend(ProjectMembership(project=project, role=role,
+                                              user_id=user_id)
+                            for user_id in added[role])
+
+        if new_rows:
+            ProjectMembership.objects.bulk_create(new_rows)
+        for role in removed:
+            old_ids = sorted(removed[role])
+            for start in range(0, len(old_ids), batch_size):
+                ProjectMembership.objects.filter(
+                    project=project, role=role,
+                    user_id__in=old_ids[start:start + batch_size]).delete()
+
+    if new_rows or any(removed.values()):
+        project_members_changed.send(
+            sender=Project, project=project, added=added, removed=removed)
+
+
+def queue_stale_user_deactivation():
+    """
+    Ask for the stale users to be deactivated by the deactivate_stale_users
+    command run with --requested, so the request does not wait for it. Does
+    nothing if a deactivation has already been asked for.
+
+    """
+    if not StaleUserDeactivationRequest.objects.exists():
+        StaleUserDeactivationRequest.objects.create()
+
+
+def run_requested_stale_user_deactivation(days=ACCOUNT_EXPIRATION_DAYS,
+                                          batch_size=500, progress=None):
+    """
+    Deactivate the stale users if the staff have asked for it since the last
+    time.
+
+    @param days (int) the number of days without a login after which an
+        account is stale
+    @param batch_size (int) the number of users deactivated per transaction
+    @param progress (function) if given, called with the summary after each
+        batch
+
+    @return (Counter) a summary of what was done, None if no deactivation
+        was asked for
+
+    """
+    with transaction.atomic():
+        # lock the requests so that two workers do not both deactivate
+        requests = list(StaleUserDeactivationRequest.objects.
+                        select_for_update().values_list('pk', flat=True))
+        if not requests:
+            return None
+        StaleUserDeactivationRequest.objects.filter(pk__in=requests).delete()
+    return deactivate_stale_users(days=days, batch_size=batch_size,
+                                  progress=progress)
+
+
+def queue_expired_registration_purge():
+    """
+    Ask for the expired registrations to be purged by the
+    purge_expired_registrations command run with --requested, so the request
+    does not wait for it. Does nothing if a purge has already been asked for.
+
+    """
+    if not RegistrationPurgeRequest.objects.exists():
+        RegistrationPurgeRequest.objects.create()
+
+
+def run_requested_registration_purge(batch_size=500, progress=None):
+    """
+    Purge the expired registrations if the staff have asked for it since the
+    last purge.
+
+    @param batch_size (int) the number of registrations deleted per
+        transaction
+    @param progress (function) if given, called with the running total
+        after each batch
+
+    @return (int) the number of registrations deleted, None if no purge was
+        asked for
+
+    """
+    with transaction.atomic():
+        # lock the requests so that two workers do not both purge
+        requests = list(RegistrationPurgeRequest.objects.select_for_update().
+                        values_list('pk', flat=True))
+        if not requests:
+            return None
+        RegistrationPurgeRequest.objects.filter(pk__in=requests).delete()
+    # each batch is deleted in its own transaction, a purge that is
+    # interrupted is finished by the next purge_expired_registrations
+    return RegistrationProfile.objects.delete_expired_users(
+        batch_size=batch_size, progress=progress)
+
+
+def delete_expired_sessions(batch_size=1000, pause=0, progress=None):
+    """
+    Delete the expired sessions from the database, batch_size at a time, each
+    batch in its own short transaction. Unlike clearsessions, which deletes
+    them all in one statement, logins are not held up while this runs.
+
+    Nothing is done for session engines that do not keep the sessions in the
+    database.
+
+    @param batch_size (int) the number of sessions deleted per transaction
+    @param pause (float) the number of seconds to wait between batches, to
+        let other writers in when the database is SQLite
+    @param progress (function) if given, called with the running total
+        after each batch
+
+    @return (int) the number of sessions deleted, or None if the session
+        engine does not use the database
+
+    """
+    engine = import_module(settings.SESSION_ENGINE)
+    if not hasattr(engine.SessionStore, 'get_model_class'):
+        return None
+    session_model = engine.SessionStore.get_model_class()
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            keys = list(session_model.objects.filter(
+                expire_date__lt=timezone.now()).
+                values_list('session_key', flat=True)[:batch_size])
+            if not keys:
+                break
+            session_model.objects.filter(session_key__in=keys).delete()
+        deleted += len(keys)
+        if progress is not None:
+            progress(deleted)
+        if len(keys) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted
 
 
 def get_service_email_address(request):
@@ -79,3 +518,63 @@ def get_service_email_address(request):
         current_site = 'localhost.esc.rl.ac.uk'
     email = 'webmaster@{}'.format(current_site)
     return email
+
+
+def get_member_page(request, project_id, role, page_kwarg):
+    """
+    Get one page of the members of a project in a role.
+    Only the columns needed to display the members are loaded.
+
+    @param request (HttpRequest) the request, the page number is read from the
+        GET parameter page_kwarg
+    @param project_id (int) the id of the project
+    @param role (str) ProjectMembership.ADMIN or ProjectMembership.USER
+    @param page_kwarg (str) the name of the GET parameter
+    @return (Page) the page of users
+
+    """
+    members = (JenkinsUser.objects.
+               filter(project_memberships__project=project_id,
+                      project_memberships__role=role).
+               only('first_name', 'last_name').
+               order_by('last_name', 'first_name', 'id'))
+    paginator = Paginator(members, MEMBER_PAGE_SIZE)
+    try:
+        return paginator.page(request.GET.get(page_kwarg, 1))
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+
+def precompile_templates():
+    """
+    Compile every template, so that the cached template loader holds them all
+    before the first request is served. Nothing is done unless the cached
+    loader is configured.
+
+    @return (int) the number of templates compiled
+
+    """
+    names = set()
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates) or not any(
+                isinstance(loader, CachedLoader)
+                for loader in engine.engine.template_loaders):
+            continue
+        template_dirs = list(engine.engine.dirs) + \
+            list(get_app_template_dirs('templates'))
+        for template_dir in template_dirs:
+            for root, _, files in os.walk(template_dir):
+                for filename in files:
+                    name = os.path.relpath(
+                        os.path.join(root, filename),
+                        template_dir).replace(os.sep, '/')
+                    try:
+                        engine.get_template(name)
+                    except (TemplateDoesNotExist, TemplateSyntaxError,
+                            UnicodeDecodeError):
+                        # not a template, or one for a different engine
+                        continue
+                    names.add(name)
+    return len(names)
@@ -30,15 +30,15 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 '''
 from django.contrib import messages
 from django.contrib.auth import views as auth_views
+from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.contrib.auth.models import Group, Permission
 from django.contrib.auth.views import logout
 from django.contrib.messages.views import SuccessMessageMixin
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.exceptions import SuspiciousOperation, ValidationError
 from django.core.urlresolvers import reverse
-from django.db import IntegrityError
-from django.http import HttpResponseRedirect
+from django.db import IntegrityError, transaction
+from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import render
 from django.template.loader import render_to_string
 from django.urls import reverse_lazy
@@ -50,12 +50,17 @@ from registration.backends.default.views import ActivationView as ActivationView
 from registration.backends.default.views import RegistrationView
 from shibboleth.backends import ShibbolethRemoteUserBackend
 
-from jenkins_auth.forms import MinimalRegistrationForm, ProjectForm
+from jenkins_auth.forms import MinimalRegistrationForm, ProjectForm, get_member_queryset, \
+    get_user_label
 from jenkins_auth.models import Project, JenkinsUser, JenkinsUserProfile
-from jenkins_auth.models import RegistrationProfile
-from jenkins_auth.settings import LOCAL_ACCOUNTS
-from jenkins_auth.utils import delete_project, logically_delete_user, get_service_email_address
-
+from jenkins_auth.models import OwnedProjectCount, ProjectMembership
+from jenkins_auth.middleware import get_shib_user
+from jenkins_auth.models import RegistrationProfile, StaffNotification
+from jenkins_auth.search import get_search_backend
+from jenkins_auth.settings import LOCAL_ACCOUNTS, STAFF_DIGEST_INTERVAL
+from jenkins_auth.throttle import get_client_ip, get_failure_tracker
+from jenkins_auth.utils import delete_project, logically_delete_user, get_service_email_address, \
+    get_member_page, create_project
 
 HOME_TEMPLATE = 'jenkins_auth/home.html'
 PROFILE_CHANGE_FORM_TEMPLATE = 'user/profile_change_form.html'
@@ -67,6 +72,9 @@ REGISTRATION_FORM_SHIB = 'registration/registration_form_shib.html'
 TOS_TEMPLATE = 'jenkins_auth/tos.html'
 LOGIN_TEMPLATE = 'registration/login.html'
 
+# the number of users returned by a search
+USER_SEARCH_PAGE_SIZE = 20
+
 # emails
 ACCOUNT_REQUEST_EMAIL = 'jenkins_auth/account_request_email.txt'
 PROJECT_REQUEST_EMAIL = 'jenkins_auth/project_request_email.txt'
@@ -85,11 +93,10 @@ class Home(LoginRequiredMixin, TemplateView):
         user = self.request.user
         project_owner_list = Project.objects.filter(owner=user)
         context['project_owner_list'] = project_owner_list
-        users_groups = user.groups.all()
-        project_admin_list = Project.objects.filter(admins__in=users_groups)
-        context['project_admin_list'] = project_admin_list
-        project_user_list = Project.objects.filter(users__in=users_groups)
-        context['project_user_list'] = project_user_list
+        context['project_admin_list'] = Project.objects.with_member(
+            user, ProjectMembership.ADMIN)
+        context['project_user_list'] = Project.objects.with_member(
+            user, ProjectMembership.USER)
         if user.is_staff:
             accounts = RegistrationProfile.objects.filter(
                 activated=True).filter(
@@ -127,7 +134,28 @@ class Login(View):
         return HttpResponseRedirect(self.login_url)
 
     def post(self, request, *args, **kwargs):
-        return auth_views.login(request)
+        """
+        Refuse the login without checking the password if there have been
+        too many failures for the username or the client address.
+
+        """
+        username = request.POST.get('username', '')
+        tracker = get_failure_tracker()
+        ip = get_client_ip(request)
+        if tracker.is_blocked(username, ip):
+            messages.error(
+                request, 'Too many failed logins, please try again later.')
+            return render(request, LOGIN_TEMPLATE,
+                          {'form': AuthenticationForm(request),
+                           'local_accounts': LOCAL_ACCOUNTS},
+                          status=429)
+        response = auth_views.login(request)
+        # a successful login redirects
+        if response.status_code == 302:
+            tracker.reset(username)
+        else:
+            tracker.add_failure(username, ip)
+        return response
 
 
 class Shibboleth(View):
@@ -151,13 +179,11 @@ class Shibboleth(View):
                     request, 'Access denied. Your account has not yet been activated.')
                 return bad_request(
                     request, None, template_name=LOGIN_TEMPLATE)
-            try:
-                shib_uid = request.user.jenkinsuserprofile.shib_uid
-            except JenkinsUserProfile.DoesNotExist:
-                return server_error(request)
-            if request.user.username != shib_uid:
-                # it is remotely possible that a user could of already created
-                # an account with a username equal to a shibboleth id
+            shib_user = get_shib_user(request.user.username)
+            if shib_user is None or not shib_user['is_shib_user']:
+                # there is no profile, or it is remotely possible that a user
+                # could of already created an account with a username equal
+                # to a shibboleth id
                 return server_error(request)
             return HttpResponseRedirect(self.success_url)
 
@@ -256,7 +282,7 @@ class Profile(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super(Profile, self).get_context_data(**kwargs)
         user = self.request.user
-        context['project_count'] = Project.objects.filter(owner=user).count()
+        context['project_count'] = OwnedProjectCount.objects.get_count(user)
         return context
 
 
@@ -319,7 +345,7 @@ class ProfileDelete(LoginRequiredMixin, TemplateView):
 
         """
         user = self.request.user
-        project_count = Project.objects.filter(owner=user).count()
+        project_count = OwnedProjectCount.objects.get_count(user)
         if project_count > 0:
             if project_count > 1:
                 messages.error(request, 'Account cannot be deleted as you are the owner of {} projects'.format(
@@ -349,44 +375,30 @@ class ProjectView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
         Overrides method from PermissionRequiredMixin.
 
         """
-        # Just in case the owner removes his admin privileges
-        if self.get_object().owner == self.request.user:
-            return True
-
-        # get the user group for this project
-        user_group = self.get_object().users
+        return self.request.user.has_perm(
+            'jenkins_auth.read_project', self.get_object())
 
-        # check user group for this instance has read permission
-        try:
-            user_group.permissions.get(codename='read_project')
-        except Permission.DoesNotExist:
-            return self.has_admin_permission()
-
-        # check user is a member of the user group
-        try:
-            self.request.user.groups.get(id=user_group.id)
-        except Group.DoesNotExist:
-            return self.has_admin_permission()
+    def get_queryset(self):
+        return Project.objects.select_related('owner')
 
-        return True
-
-    def has_admin_permission(self):
-        # get the admin group for this project
-        admin_group = self.get_object().admins
-
-        # check admin group for this instance has read permission
-        try:
-            admin_group.permissions.get(codename='read_project')
-        except Permission.DoesNotExist:
-            return False
-
-        # check user is a member of the admin group
-        try:
-            self.request.user.groups.get(id=admin_group.id)
-        except Group.DoesNotExist:
-            return False
+    def get_context_data(self, **kwargs):
+        """
+        Rather than loading all of the members of a project to find out what
+        the user can do, the flags are taken from the users cached permissions
+        and only one page of each member list is loaded.
 
-        return True
+        """
+        context = super(ProjectView, self).get_context_data(**kwargs)
+        user = self.request.user
+        project = self.object
+        context['is_owner'] = project.owner_id == user.pk
+        context['is_admin'] = user.has_perm(
+            'jenkins_auth.change_project', project)
+        context['admin_page'] = get_member_page(
+            self.request, project.pk, ProjectMembership.ADMIN, 'admins_page')
+        context['user_page'] = get_member_page(
+            self.request, project.pk, ProjectMembership.USER, 'users_page')
+        return context
 
 
 class ProjectCreate(LoginRequiredMixin, SuccessMessageMixin, CreateView):
@@ -405,53 +417,17 @@ class ProjectCreate(LoginRequiredMixin, SuccessMessageMixin, CreateView):
 
         """
         form.instance.owner = self.request.user
-        # admin group
-        try:
-            admin_group = Group.objects.create(
-                name='{} | admins'.format(form.instance.name))
-        except IntegrityError:
-            print(
-                "ERROR Group '{} | admins' exists without a corresponding project".format(
-                    form.instance.name))
-            form.add_error(
-                "name",
-                ValidationError(
-                    _('Project with this Project name already exists.'),
-                    code='IntegrityError'))
-            return super(ProjectCreate, self).form_invalid(form)
-
-        update_project = Permission.objects.get(codename='change_project')
-        admin_group.permissions.add(update_project)
-        read_project = Permission.objects.get(codename='delete_project')
-        admin_group.permissions.add(read_project)
-        read_project = Permission.objects.get(codename='read_project')
-        admin_group.permissions.add(read_project)
-        form.instance.admins = admin_group
-        # add owner as admin
-        self.request.user.groups.add(admin_group)
-
-        # user group
+        form.instance.is_active = True
         try:
-            user_group = Group.objects.create(
-                name='{} | users'.format(form.instance.name))
+            create_project(form.instance)
         except IntegrityError:
-            print(
-                "ERROR Group '{} | users' exists without a corresponding project".format(
-                    form.instance.name))
+            # the name was taken by another request after the form checked it
             form.add_error(
                 "name",
                 ValidationError(
-                    _('Project with this Project name already exists.'),
-                    code='IntegrityError'))
+                    _('This project name has already been taken.'),
+                    code='unique'))
             return super(ProjectCreate, self).form_invalid(form)
-        user_group.permissions.add(read_project)
-        form.instance.users = user_group
-
-        form.instance.is_active = True
-
-        admin_group.save()
-        user_group.save()
-        form.instance.save()
 
         # email
 #         context = super(ProjectCreate, self).get_context_data()
@@ -487,26 +463,8 @@ class ProjectUpdate(
         Overrides method from PermissionRequiredMixin.
 
         """
-        # Just in case the owner removes his admin privileges
-        if self.get_object().owner == self.request.user:
-            return True
-
-        # get the admin group for this project
-        admin_group = self.get_object().admins
-
-        # check admin group for this instance has update permission
-        try:
-            admin_group.permissions.get(codename='change_project')
-        except Permission.DoesNotExist:
-            return False
-
-        # check user is a member of the admin group
-        try:
-            self.request.user.groups.get(id=admin_group.id)
-        except Group.DoesNotExist:
-            return False
-
-        return True
+        return self.request.user.has_perm(
+            'jenkins_auth.change_project', self.get_object())
 
 
 class ProjectDelete(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
@@ -541,15 +499,56 @@ class ProjectDelete(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
         return HttpResponseRedirect(self.success_url)
 
 
+class ProjectUserSearch(LoginRequiredMixin, View):
+    """
+    Search for users that can be added to a project.
+    Used by the admin and user pickers on the project form.
+
+    Each word of the GET parameter 'q' must be the start of a word in the
+    users first name, last name or username. Staff may also search on the
+    email and Shibboleth id, for other users these are not matched so that
+    they cannot find out which addresses have accounts. The words are
+    looked up in the index of the search backend, which is filled from the
+    existing users when migrate creates it. The results are returned
+    a page at a time, the page is selected with the GET parameter 'page'.
+    {'results': [{'id': 1, 'text': 'Joe Bloggs (id:1)'}],
+     'more': false}
+
+    """
+
+    def get(self, request, *args, **kwargs):
+        users = get_search_backend().filter_users(
+            get_member_queryset(), request.GET.get('q', ''),
+            names_only=not request.user.is_staff)
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        start = (page - 1) * USER_SEARCH_PAGE_SIZE
+        # fetch one extra row to find out if there is another page
+        users = list(users.
+                     only('first_name', 'last_name').
+                     order_by('last_name', 'first_name', 'id')
+                     [start:start + USER_SEARCH_PAGE_SIZE + 1])
+        results = [{'id': user.pk, 'text': get_user_label(user)}
+                   for user in users[:USER_SEARCH_PAGE_SIZE]]
+        return JsonResponse(
+            {'results': results,
+             'more': len(users) > USER_SEARCH_PAGE_SIZE})
+
+
 class ActivationView(ActivationViewBase):
     """
     Re-implements registration.backends.default.views in order to use our version of RegistrationProfile.
 
     """
 
+    @transaction.atomic
     def activate(self, *args, **kwargs):
         """
         Re-implements registration.backends.default.views in order to use our version of RegistrationProfile.
+        The email to staff, or the notification for the next digest, is
+        queued in the same transaction as the activation.
 
         """
         activation_key = kwargs.get('activation_key', '')
@@ -557,7 +556,10 @@ class ActivationView(ActivationViewBase):
                           .activate_user(activation_key))
         if activated_user:
 
-            if not activated_user.is_active:
+            if not activated_user.is_active and STAFF_DIGEST_INTERVAL:
+                # the staff are told in the next digest
+                StaffNotification.objects.create(user_id=activated_user.pk)
+            elif not activated_user.is_active:
                 # send mail to staff
                 context = super(
                     ActivationView,
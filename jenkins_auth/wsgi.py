@@ -43,3 +43,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jenkins_auth.settings")
 
 application = get_wsgi_application()
+
+# compile the templates before the first request
+from jenkins_auth.utils import precompile_templates  # noqa
+precompile_templates()